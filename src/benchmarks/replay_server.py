@@ -0,0 +1,291 @@
+"""Local stand-in for the Polygon REST API
+
+Serves /v2/aggs, /v3/reference/options/contracts and /v3/quotes from one of
+three sources, with optional injected latency per request:
+
+- replay:    responses recorded earlier, keyed by path + query (apiKey excluded)
+- record:    proxies to the real API and saves every response for later replays
+- synthetic: deterministic generated bars / chains / quotes, no API key needed
+
+Point the clients at it with POLYGON_BASE_URL=http://127.0.0.1:<port>.
+GET /__stats returns request counts per endpoint, GET /__reset clears them.
+
+    python -m benchmarks.replay_server --source record --upstream https://api.polygon.io
+    python -m benchmarks.replay_server --source replay --latency-ms 40 --jitter-ms 20
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import zlib
+import numpy as np
+import pandas as pd
+import requests
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode, unquote
+from typing import Optional
+
+SOURCES = ("replay", "record", "synthetic")
+DEFAULT_FIXTURES = ".cache/replay"
+
+
+def endpoint_of(path: str) -> str:
+    if path.startswith("/v2/aggs"):
+        return "aggs"
+    if path.startswith("/v3/reference/options/contracts"):
+        return "contracts"
+    if path.startswith("/v3/quotes"):
+        return "quotes"
+    return "other"
+
+
+def fixture_key(path: str, params: dict) -> str:
+    query = urlencode(sorted((k, v) for k, v in params.items() if k != "apiKey"))
+    return f"{path}?{query}"
+
+
+def fixture_path(root: str, key: str) -> str:
+    path = urlsplit(key).path
+    return os.path.join(root, endpoint_of(path), hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+###########################
+# SYNTHETIC MARKET DATA   #
+###########################
+
+def _rng(*parts) -> np.random.Generator:
+    return np.random.default_rng(zlib.crc32("|".join(map(str, parts)).encode()))
+
+
+def _base_price(ticker: str) -> float:
+    if ticker.startswith("O:"):
+        return 3.0
+    if "VIX" in ticker:
+        return 15.0
+    return 5000.0 if "SPX" in ticker else 500.0
+
+
+def _bound(value: str) -> tuple:
+    """(New York date, epoch ms) of an aggs range bound, a date or a ms timestamp"""
+    if value.isdigit():
+        return pd.Timestamp(int(value), unit="ms", tz="UTC").tz_convert("America/New_York").date(), int(value)
+    return pd.Timestamp(value).date(), None
+
+
+def synthetic_aggs(ticker: str, multiplier: int, timespan: str, start: str, end: str) -> dict:
+    (start, start_ms), (end, end_ms) = _bound(start), _bound(end)
+    results = []
+    for day in pd.bdate_range(start, end):
+        rng = _rng(ticker, day.date())
+        open_ = pd.Timestamp(day.date()).tz_localize("America/New_York") + pd.Timedelta(hours=9, minutes=30)
+        if timespan == "day":
+            times, closes = [open_.normalize()], [_base_price(ticker) * (1 + rng.normal(0, 0.01))]
+        else:
+            n = 391 // multiplier
+            times = [open_ + pd.Timedelta(minutes=m * multiplier) for m in range(n)]
+            closes = _base_price(ticker) * np.exp(rng.normal(0, 0.0005, n).cumsum())
+            if ticker.startswith("O:"):
+                # most strikes trade most minutes, not all of them
+                closes = np.where(rng.random(n) < 0.9, closes, np.nan)
+        for t, c in zip(times, closes):
+            ms = int(t.timestamp() * 1000)
+            if (start_ms is not None and ms < start_ms) or (end_ms is not None and ms > end_ms):
+                continue
+            if not np.isnan(c):
+                c = round(float(c), 2)
+                results.append({"v": 100.0, "vw": c, "o": c, "c": c, "h": c, "l": c, "t": ms, "n": 10})
+    return {"status": "OK", "ticker": ticker, "resultsCount": len(results), "results": results}
+
+
+def synthetic_contracts(params: dict, base_url: str, path: str) -> dict:
+    as_of, right = params.get("as_of") or params.get("expiration_date"), params.get("contract_type", "call")
+    expiration = params.get("expiration_date", as_of)
+    exp = pd.Timestamp(expiration)
+    strikes = np.arange(4500, 5505, 5)
+    code = "C" if right == "call" else "P"
+    contracts = [{"ticker": f"O:SPXW{exp:%y%m%d}{code}{int(k * 1000):08d}", "strike_price": float(k), "expiration_date": expiration,
+                  "contract_type": right, "underlying_ticker": params.get("underlying_ticker", "SPX")} for k in strikes]
+    limit, offset = int(params.get("limit", 1000)), int(params.get("cursor", 0))
+    payload = {"status": "OK", "results": contracts[offset:offset + limit]}
+    if offset + limit < len(contracts):
+        query = urlencode({**{k: v for k, v in params.items() if k not in ("apiKey", "cursor")}, "cursor": offset + limit})
+        payload["next_url"] = f"{base_url}{path}?{query}"
+    return payload
+
+
+def synthetic_quotes(ticker: str, params: dict) -> dict:
+    limit = int(params.get("limit", 10))
+    if "timestamp.gte" in params:
+        start, end = int(params["timestamp.gte"]), int(params.get("timestamp.lt", int(params["timestamp.gte"]) + 60_000_000_000))
+    else:
+        end = time.time_ns()
+        start = end - 60_000_000_000
+    rng = _rng(ticker, start // 60_000_000_000)
+    n = min(limit, 50)
+    stamps = np.sort(rng.integers(start, end, n))
+    if params.get("order") == "desc":
+        stamps = stamps[::-1]
+    mid = _base_price(ticker) * (1 + rng.normal(0, 0.02, n))
+    half = rng.uniform(0.05, 0.15, n)
+    results = [{"sip_timestamp": int(ts), "bid_price": round(float(m - h), 2), "ask_price": round(float(m + h), 2),
+                "bid_size": 10, "ask_size": 10} for ts, m, h in zip(stamps, mid, half)]
+    return {"status": "OK", "results": results}
+
+
+def synthetic_response(path: str, params: dict, base_url: str) -> dict:
+    endpoint = endpoint_of(path)
+    if endpoint == "aggs":
+        # /v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{from}/{to}
+        parts = path.split("/")
+        return synthetic_aggs(parts[4], int(parts[6]), parts[7], parts[8], parts[9])
+    if endpoint == "contracts":
+        return synthetic_contracts(params, base_url, path)
+    if endpoint == "quotes":
+        return synthetic_quotes(path.rsplit("/", 1)[-1], params)
+    return {"status": "ERROR", "error": f"no synthetic data for {path}"}
+
+
+################
+# SERVER       #
+################
+
+class ReplayServer:
+    """Threaded HTTP stand-in, start() runs it in a daemon thread"""
+    def __init__(self, source: str = "replay", fixtures: str = DEFAULT_FIXTURES, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, upstream: Optional[str] = None):
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {SOURCES}")
+        self.source = source
+        self.fixtures = os.path.abspath(fixtures)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.upstream = (upstream or "https://api.polygon.io").rstrip("/")
+        self.session = requests.Session()
+        self.counts = defaultdict(lambda: {"requests": 0, "misses": 0, "bytes": 0})
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.counts.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self.counts.clear()
+
+    def _count(self, endpoint: str, size: int, miss: bool = False):
+        with self._lock:
+            counts = self.counts[endpoint]
+            counts["requests"] += 1
+            counts["misses"] += int(miss)
+            counts["bytes"] += size
+
+    def respond(self, path: str, params: dict) -> tuple:
+        """(status, payload) of one request"""
+        if self.source == "synthetic":
+            return 200, synthetic_response(path, params, self.url)
+
+        key = fixture_key(path, params)
+        target = fixture_path(self.fixtures, key)
+        if self.source == "replay":
+            if not os.path.exists(target):
+                return 404, {"status": "ERROR", "error": f"no fixture for {key}"}
+            with open(target) as f:
+                recorded = json.load(f)
+            return recorded["status_code"], self._local_next_url(recorded["body"])
+
+        response = self.session.get(f"{self.upstream}{path}", params=params, timeout=(5, 60))
+        body = response.json()
+        if response.status_code == 200:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "w") as f:
+                json.dump({"key": key, "status_code": response.status_code, "body": body}, f)
+        return response.status_code, self._local_next_url(body)
+
+    def _local_next_url(self, body: dict) -> dict:
+        # pagination links must come back to this server
+        if isinstance(body, dict) and body.get("next_url"):
+            parts = urlsplit(body["next_url"])
+            body = {**body, "next_url": f"{self.url}{parts.path}?{parts.query}"}
+        return body
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                path, params = unquote(parts.path), dict(parse_qsl(parts.query))
+                if path == "/__stats":
+                    return self._send(200, server.stats(), count=False)
+                if path == "/__reset":
+                    server.reset_stats()
+                    return self._send(200, {"status": "OK"}, count=False)
+
+                if server.latency_ms or server.jitter_ms:
+                    time.sleep((server.latency_ms + random.uniform(0, server.jitter_ms)) / 1000)
+                try:
+                    status, payload = server.respond(path, params)
+                except Exception as e:
+                    status, payload = 502, {"status": "ERROR", "error": repr(e)}
+                self._send(status, payload, endpoint=endpoint_of(path))
+
+            def _send(self, status: int, payload: dict, count: bool = True, endpoint: str = "other"):
+                body = json.dumps(payload).encode()
+                if count:
+                    server._count(endpoint, len(body), miss=status == 404)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Polygon stand-in for benchmarks")
+    parser.add_argument("--source", choices=SOURCES, default="replay")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--upstream", default="https://api.polygon.io")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.source, args.fixtures, args.host, args.port, args.latency_ms, args.jitter_ms, args.upstream)
+    print(f"{args.source} server on {server.url} (POLYGON_BASE_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,224 @@
+"""Benchmark suite for the backtest and the live monitor, against the local replay server
+
+Every client talks to a ReplayServer (recorded fixtures, or synthetic data) so the
+numbers only depend on the code and the injected latency. Reported per run:
+
+- backtest: per-day time (features + trade, cold caches), requests per day by endpoint,
+  end-to-end time and throughput of the full pipeline with cold and with warm caches
+- sim_live: time and requests of the entry phase and of each monitoring tick
+- peak RSS of the process
+
+One JSON object is printed and appended to --output (JSON lines), so results can be
+compared over time. Run from src/:
+
+    python -m benchmarks.run --source synthetic --latency-ms 30 --start 2024-03-01 --end 2024-03-29
+    python -m benchmarks.run --source replay --fixtures .cache/replay --output benchmarks/results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import importlib
+import subprocess
+import tempfile
+import numpy as np
+from datetime import datetime, timezone
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from benchmarks.replay_server import ReplayServer, SOURCES, DEFAULT_FIXTURES
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+
+
+def summary(values) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {}
+    return {"n": len(values), "mean": round(float(values.mean()), 4), "p50": round(float(np.percentile(values, 50)), 4),
+            "p95": round(float(np.percentile(values, 95)), 4), "max": round(float(values.max()), 4)}
+
+
+def requests_made(before: dict, after: dict) -> dict:
+    return {endpoint: counts["requests"] - before.get(endpoint, {}).get("requests", 0) for endpoint, counts in after.items()
+            if counts["requests"] - before.get(endpoint, {}).get("requests", 0)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def fresh_caches(bt, root: str):
+    """Point the backtest's caches at an empty directory"""
+    from utils.cache import AggregatesCache
+    from utils.bar_store import MinuteBarStore
+    from utils.chain_reference import ChainReference
+    from utils.strike_band import StrikeBandLoader
+    bt.client.cache = AggregatesCache(root)
+    bt.client.bar_store = MinuteBarStore(root)
+    bt.chains = ChainReference(bt.client, root)
+    bt.bands = StrikeBandLoader(bt.client, bt.chains, root, bt.bands.band_pct)
+
+
+def run_backtest_pipeline(bt, trading_dates: list) -> int:
+    """The backtest main without plotting: features, expected moves, trades"""
+    trend_regime = bt.TrendRegime(bt.client.get_ticker_data(bt.etf_ticker, "2020-01-01", trading_dates[-1], "day"), window=20)
+    features = bt.compute_features_from_store(trading_dates, trend_regime).set_index("date").reindex(trading_dates)
+    features["expected_move"] = features["expected_move_original"]
+    tradable = features.dropna(subset=["expected_move"])
+    trade_args = [(date, row["price"], int(row["direction"]), row["expected_move"]) for date, row in tradable.iterrows()]
+    trades = bt.run_parallel(bt.run_day_trade, trade_args, bt.MAX_WORKERS, "thread", desc="trades: ")
+    return len([t for t in trades if t is not None])
+
+
+def bench_backtest(server: ReplayServer, trading_dates: list, cache_root: str) -> dict:
+    bt = importlib.import_module("short_credit_spread_backtest")
+
+    # per day, sequential and cold: the latency a single backtest day costs
+    fresh_caches(bt, os.path.join(cache_root, "per_day"))
+    trend_regime = bt.TrendRegime(bt.client.get_ticker_data(bt.etf_ticker, "2020-01-01", trading_dates[-1], "day"), window=20)
+    day_seconds, day_requests, by_endpoint, failures = [], [], {}, 0
+    for prior_day, date in zip(trading_dates[:-1], trading_dates[1:]):
+        before = server.stats()
+        start = time.perf_counter()
+        try:
+            features = bt.compute_day_features(date, prior_day, trend_regime)
+            bt.run_day_trade(date, features["price"], int(features["direction"]), features["expected_move_original"])
+        except Exception as e:
+            failures += 1
+            print(f"{date}: {e}")
+            continue
+        day_seconds.append(time.perf_counter() - start)
+        made = requests_made(before, server.stats())
+        day_requests.append(sum(made.values()))
+        for endpoint, n in made.items():
+            by_endpoint[endpoint] = by_endpoint.get(endpoint, 0) + n
+
+    # full pipeline, cold then warm caches
+    end_to_end = {}
+    fresh_caches(bt, os.path.join(cache_root, "end_to_end"))
+    for run in ("cold", "warm"):
+        before = server.stats()
+        start = time.perf_counter()
+        n_trades = run_backtest_pipeline(bt, trading_dates)
+        seconds = time.perf_counter() - start
+        end_to_end[run] = {"seconds": round(seconds, 3), "trades": n_trades, "days_per_second": round((len(trading_dates) - 1) / seconds, 3),
+                           "requests": sum(requests_made(before, server.stats()).values())}
+
+    return {
+        "days": len(trading_dates) - 1,
+        "failed_days": failures,
+        "per_day_seconds": summary(day_seconds),
+        "requests_per_day": summary(day_requests),
+        "requests_per_day_by_endpoint": {endpoint: round(n / max(len(day_requests), 1), 2) for endpoint, n in by_endpoint.items()},
+        "end_to_end": end_to_end,
+        "client_stats": bt.client.stats_frame().reset_index(names="endpoint").to_dict("records"),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_sim_live(server: ReplayServer, today: str, iterations: int) -> dict:
+    sim = importlib.import_module("sim_live_trading")
+    from utils.polygon_async import AsyncPolygonClient
+
+    async def session():
+        async with AsyncPolygonClient.from_client(sim.client) as aclient:
+            before = server.stats()
+            start = time.perf_counter()
+            entry, spot = await sim.enter(aclient, today, 0)
+            entry_phase = {"seconds": round(time.perf_counter() - start, 4), "requests": sum(requests_made(before, server.stats()).values())}
+
+            seconds, requests = [], []
+            for _ in range(iterations):
+                before = server.stats()
+                start = time.perf_counter()
+                await sim.poll(aclient, entry, spot)
+                seconds.append(time.perf_counter() - start)
+                requests.append(sum(requests_made(before, server.stats()).values()))
+        return entry_phase, seconds, requests
+
+    entry_phase, seconds, requests = asyncio.run(session())
+    return {
+        "date": today,
+        "entry": entry_phase,
+        "tick_seconds": summary(seconds),
+        "requests_per_tick": summary(requests),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest / live monitor benchmarks against the replay server")
+    parser.add_argument("--source", choices=SOURCES, default="synthetic")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--upstream", default="https://api.polygon.io")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--start", default="2024-03-01")
+    parser.add_argument("--end", default="2024-03-15")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--strike-bands", action="store_true", help="backtest with BACKTEST_STRIKE_BANDS=1")
+    parser.add_argument("--monitor-passes", type=int, default=5)
+    parser.add_argument("--skip", choices=["backtest", "sim_live"], action="append", default=[])
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results.jsonl"))
+    args = parser.parse_args()
+
+    server = ReplayServer(args.source, args.fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, upstream=args.upstream).start()
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    api_key = os.environ.get("POLYGON_API_KEY", "replay")
+
+    # the scripts read .env from the working directory and the base url at import
+    os.environ["POLYGON_BASE_URL"] = server.url
+    with open(os.path.join(work_dir, ".env"), "w") as f:
+        f.write(f'POLYGON_API_KEY="{api_key}"\nPOLYGON_CACHE_DIR="{os.path.join(work_dir, "cache")}"\n'
+                f'BACKTEST_WORKERS="{args.workers}"\nBACKTEST_EXECUTOR="thread"\n'
+                f'BACKTEST_STRIKE_BANDS="{int(args.strike_bands)}"\n')
+    output = os.path.abspath(args.output)
+    os.chdir(work_dir)
+
+    from utils.date_util import schedule_trading_dates
+    trading_dates = list(schedule_trading_dates("NYSE", args.start, args.end))
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {"source": args.source, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                   "start": args.start, "end": args.end, "workers": args.workers},
+    }
+    try:
+        if "backtest" not in args.skip:
+            result["backtest"] = bench_backtest(server, trading_dates, os.path.join(work_dir, "bench_cache"))
+        if "sim_live" not in args.skip:
+            result["sim_live"] = bench_sim_live(server, trading_dates[-1], args.monitor_passes)
+    finally:
+        server.stop()
+    result["server_stats"] = server.stats()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,54 @@
 """ Short 0DTE call/put spread
 
 with a directional regime indicator, short the opposite direction spread at x times of expected move from spot.
+
+Each trading day only depends on its own market data and, for RVRP, on the trailing
+window of earlier days' features. The backtest therefore runs in three steps:
+1. per-day market features, computed in one pass over the memory-mapped minute bars
+2. RVRP / expected move series, a cheap sequential reduce over the features
+3. per-day strike selection and spread P&L, fetched concurrently
+
+Steps 1 and 3 record every day in an append-only ledger (BACKTEST_LEDGER_DIR) keyed
+by a hash of their parameters and code, so a rerun only computes the new days, the
+ones that failed and the ones whose parameters, code or trade inputs changed.
 """
+import os
+import asyncio
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from dotenv import dotenv_values
 import matplotlib.pyplot as plt
 from utils.date_util import schedule_trading_dates
-from utils.polygon import get_ticker_data, get_historical_option_contracts
+from utils.polygon import PolygonClient
+from utils.polygon_async import AsyncPolygonClient
+from utils.cache import AggregatesCache
+from utils.bar_store import MinuteBarStore
+from utils.chain_reference import ChainReference
+from utils.strike_band import StrikeBandLoader
+from utils.signals import TrendRegime
+from utils.features import RVRPFeatureStore, session_features
+from utils.executor import run_parallel
+from utils.instrumentation import Instrumentation
+from utils.ledger import Ledger
+from utils import analytics
 
 
 config = dotenv_values(".env")
 polygon_api_key = config['POLYGON_API_KEY']
 
-trading_dates = schedule_trading_dates("NYSE", "2023-05-01", (datetime.today()-timedelta(days = 1)))
+# historical bars and chains never change, so re-runs read them from disk (POLYGON_OFFLINE=1 fails fast on a cache miss)
+cache_dir = config.get('POLYGON_CACHE_DIR') or ".cache/polygon"
+client = PolygonClient(polygon_api_key,
+                       requests_per_minute = float(config['POLYGON_REQUESTS_PER_MINUTE']) if config.get('POLYGON_REQUESTS_PER_MINUTE') else None,
+                       cache = AggregatesCache(cache_dir, offline = config.get('POLYGON_OFFLINE') == "1"),
+                       bar_store = MinuteBarStore(cache_dir))
+chains = ChainReference(client, cache_dir)
+# minute bars of every call and put strike within 3% of the entry price, so strike logic and widths can change
+# without new requests. Opt-in (BACKTEST_STRIKE_BANDS=1): a cold day costs one aggregates request per strike
+# in both bands (~120 for SPXW) instead of the 2 of the traded legs, worth it before a sweep or strike logic change
+bands = StrikeBandLoader(client, chains, cache_dir, band_pct = 0.03)
+USE_STRIKE_BANDS = config.get('BACKTEST_STRIKE_BANDS') == "1"
 
 ticker = "I:SPX"
 index_ticker = "I:VIX1D"
@@ -22,216 +56,256 @@ options_ticker = "SPX"
 etf_ticker = "SPY"
 
 EXPECTED_MOVE_SCALAR = 0.5
+STARTING_CAPITAL = analytics.STARTING_CAPITAL
 USE_RVRP = True
+RVRP_WINDOW = 21
+RVRP_STORE_PATH = config.get('RVRP_STORE_PATH') or "rvrp_features.npz"
+ENTRY_TIME = pd.Timestamp("09:35").time()
+# SPX / VIX1D / SPY minute bars are ingested into the memmap bar store once and the
+# per-day features are computed over the whole history in one pass
+USE_BAR_STORE = True
+# entry credit from the NBBO mids of the first minute after ENTRY_TIME instead of the first minute bar closes
+PRICE_ENTRY_ON_QUOTES = False
+FEATURE_COLUMNS = ["date", "price", "vix1d_935", "realized_vol", "actual_move", "expected_move_original", "direction"]
+
+# worker pool for the per-day steps, "process" also parallelises the pandas work
+MAX_WORKERS = int(config.get('BACKTEST_WORKERS') or 8)
+EXECUTOR = config.get('BACKTEST_EXECUTOR') or "thread"
+
+# per-day features and trades, reused by later runs
+LEDGER_DIR = config.get('BACKTEST_LEDGER_DIR') or ".cache/ledger"
+
+# per-stage spans go to a JSON lines log, BACKTEST_PROFILE_DAY profiles the steps of one date
+instrumentation = Instrumentation(config.get('BACKTEST_LOG') or "backtest_log.jsonl",
+                                  profile_day = config.get('BACKTEST_PROFILE_DAY') or None,
+                                  profiler = config.get('BACKTEST_PROFILER') or "cprofile")
+
+
+def load_sessions(tickers: list, date: str) -> list[pd.DataFrame]:
+    """Minute bars of several tickers for one session, requested concurrently"""
+    async def fetch():
+        async with AsyncPolygonClient.from_client(client) as aclient:
+            return await aclient.get_tickers_data(tickers, date, date, "minute")
+    bars = asyncio.run(fetch())
+    for data in bars.values():
+        data.index = pd.to_datetime(data.index, unit="ms", utc=True).tz_convert("America/New_York")
+    return [bars[t] for t in tickers]
+
+@instrumentation.per_day("day_features")
+def compute_day_features(date: str, prior_day: str, trend_regime: TrendRegime) -> dict:
+    """Market features of a single session, independent of every other backtest day"""
+    # etf bars are for the trend signal
+    with instrumentation.span("session_bars"):
+        underlying_data, index_data, etf_underlying_data = load_sessions([ticker, index_ticker, etf_ticker], date)
+
+    underlying_data = underlying_data[underlying_data.index.time >= ENTRY_TIME]
+    index_data = index_data[index_data.index.time >= ENTRY_TIME]
+    etf_underlying_data = etf_underlying_data[etf_underlying_data.index.time >= ENTRY_TIME]
+
+    rvrp_inputs = session_features(underlying_data, index_data)
+    index_price = rvrp_inputs["vix1d_935"]
+    price = underlying_data["c"].iloc[0]
+
+    # Pull the data at 9:35 to represent the most up-to-date regime that would be available
+    if len(etf_underlying_data):
+        direction = trend_regime.regime_with_intraday(prior_day, etf_underlying_data["c"].iloc[0]) # downtrend == 0, uptrend == 1
+    else:
+        direction = trend_regime.regime_at(prior_day)
+
+    return {
+        "date": date,
+        "price": price,
+        "expected_move_original": (round((index_price / np.sqrt(252)), 2)/100)*EXPECTED_MOVE_SCALAR,
+        "direction": direction,
+        **rvrp_inputs,
+    }
+
+def compute_features_from_store(trading_dates: list, trend_regime: TrendRegime) -> pd.DataFrame:
+    """compute_day_features for every date at once, on the memory-mapped bars"""
+    start, end = trading_dates[0], trading_dates[-1]
+    with instrumentation.span("bar_store_sync"):
+        underlying, index, etf = (client.bar_store.sync(client, t, start, end) for t in (ticker, index_ticker, etf_ticker))
+    entry = ENTRY_TIME.strftime("%H:%M")
+
+    features = pd.DataFrame({
+        "price": underlying.first_at_or_after(entry),
+        "realized_vol": underlying.realized_vol(entry),
+    }).join(pd.DataFrame({
+        "vix1d_935": index.first_at_or_after(entry),
+        "vix1d_close": index.last(),
+    }), how = "inner").reindex(trading_dates[1:]).dropna(subset = ["price", "vix1d_935"])
+    etf_entry = etf.first_at_or_after(entry)
+
+    features["actual_move"] = np.abs((features["vix1d_close"] - features["vix1d_935"]) / features["vix1d_935"])
+    features["expected_move_original"] = (np.round(features["vix1d_935"] / np.sqrt(252), 2) / 100) * EXPECTED_MOVE_SCALAR
+    prior_days = dict(zip(trading_dates[1:], trading_dates[:-1]))
+    features["direction"] = [trend_regime.regime_with_intraday(prior_days[date], etf_entry[date]) if not np.isnan(etf_entry.get(date, np.nan))
+                             else trend_regime.regime_at(prior_days[date]) for date in features.index]
+    return features.drop(columns = "vix1d_close").rename_axis("date").reset_index()
+
+def build_feature_store(features: pd.DataFrame) -> RVRPFeatureStore:
+    """Sequential reduce over the per-day features (one row per trading date, NaN for failed days)"""
+    store = RVRPFeatureStore(window = RVRP_WINDOW, capacity = len(features))
+    for row in features.itertuples():
+        store.append(row.Index, row.realized_vol, row.vix1d_935, row.actual_move, row.expected_move_original)
+    return store
+
+def load_spread_value(short_ticker: str, long_ticker: str, date: str) -> pd.Series:
+    with instrumentation.span("leg_bars"):
+        short_leg, long_leg = load_sessions([short_ticker, long_ticker], date)
+    spread = pd.concat([short_leg.add_prefix("short_"), long_leg.add_prefix("long_")], axis = 1).dropna()
+    spread = spread[spread.index.time >= ENTRY_TIME]
+    return spread["short_c"] - spread["long_c"]
+
+def entry_window(date: str) -> tuple:
+    """ns timestamps of the minute starting at ENTRY_TIME"""
+    start = pd.Timestamp(f"{date} {ENTRY_TIME}").tz_localize("America/New_York")
+    return start.value, (start + pd.Timedelta(minutes = 1)).value
+
+@instrumentation.per_day("trade")
+def run_day_trade(date: str, price: float, direction: int, expected_move: float) -> dict:
+    """Strike selection and P&L of the 1 tick wide 0DTE spread for a single day"""
+    lower_price = round(price - (price * expected_move))
+    upper_price = round(price + (price * expected_move))
+
+    #0DTE contracts
+    exp_date = date
 
-trade_list = []
-times = []
-
-underlying_realized_vol = get_ticker_data(etf_ticker, trading_dates[0], trading_dates[-1], 'day', polygon_api_key)
-underlying_realized_vol.index = pd.to_datetime(underlying_realized_vol.index, unit="ms", utc=True).tz_convert("America/New_York").date
-
-# loop through all backtest dates
-for date in trading_dates[1:]:
-    
-    try:
-        
-        start_time = datetime.now()
-        prior_day = trading_dates[np.where(trading_dates==date)[0][0]-1]
-        
-        prior_day_underlying_data = get_ticker_data(ticker, prior_day, prior_day, 'day', polygon_api_key)
-        prior_day_underlying_data.index = pd.to_datetime(prior_day_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        
-        big_underlying_data = get_ticker_data(etf_ticker, "2020-01-01", prior_day, 'day', polygon_api_key)
-        big_underlying_data.index = pd.to_datetime(big_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        big_underlying_data["1_mo_avg"] = big_underlying_data["c"].rolling(window=20).mean()
-        big_underlying_data["3_mo_avg"] = big_underlying_data["c"].rolling(window=60).mean()
-        big_underlying_data['regime'] = big_underlying_data.apply(lambda row: 1 if (row['c'] > row['1_mo_avg']) else 0, axis=1)
-    
-        underlying_data = get_ticker_data(ticker, date, date, 'minute', polygon_api_key)
-        underlying_data.index = pd.to_datetime(underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        
-        index_data = get_ticker_data(index_ticker, date, date, 'minute', polygon_api_key)
-        index_data.index = pd.to_datetime(index_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        
-        # for trend signal
-        etf_underlying_data = get_ticker_data(etf_ticker, date, date, 'minute', polygon_api_key)
-        etf_underlying_data.index = pd.to_datetime(etf_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        
-        underlying_data = underlying_data[underlying_data.index.time >= pd.Timestamp("09:35").time()].copy()
-        index_data = index_data[index_data.index.time >= pd.Timestamp("09:35").time()].copy()
-        etf_underlying_data = etf_underlying_data[etf_underlying_data.index.time >= pd.Timestamp("09:35").time()].copy()
-        
-        prior_day_price = prior_day_underlying_data["c"].iloc[0]
-        index_price = index_data["c"].iloc[0]        
-        price = underlying_data["c"].iloc[0]
-        closing_value = underlying_data["c"].iloc[-1]
-        
-        # 
-        if USE_RVRP:
-            underlying_data_5min = underlying_data.groupby(pd.Grouper(freq='5min')).agg({"o": "first", "l": "min", "h": "max", "c": "last"}).copy()
-
-            underlying_data['c_log_diff'] = np.log(underlying_data['c']) - np.log(underlying_data['c'].shift(1))      
-            realized_vol = ( underlying_data['c_log_diff'] ** 2 ).sum()
-            realized_vol = np.sqrt( realized_vol) *100 *np.sqrt(252)
-            date_object = pd.to_datetime(date).date()
-            underlying_realized_vol.loc[date_object, 'realized_vol'] = realized_vol
-            underlying_realized_vol.loc[date_object, 'vix1d_935'] = index_data['c'].iloc[0]   # get the vix1d at 9:35
-            # calculate the daily difference between the realized vol and the vix1d at 9:35
-            underlying_realized_vol['rvrp'] =    underlying_realized_vol['vix1d_935'] - underlying_realized_vol['realized_vol']
-            underlying_realized_vol.loc[date_object, 'actual_move'] =  np.abs(   ( index_data['c'].iloc[-1]  - index_data['c'].iloc[0] ) / index_data['c'].iloc[0] )      
-            
-            # Assuming a 21-day trailing moving average
-            window_size = 21
-            # Calculate the trailing moving average for 'rvrp'
-            underlying_realized_vol['rvrp_ma'] = underlying_realized_vol['rvrp'].rolling(window=window_size).mean()
-            # Shift the moving average back by one day
-            underlying_realized_vol['rvrp_ma_shifted'] = underlying_realized_vol['rvrp_ma'].shift(1)
-            # print(underlying_realized_vol[['rvrp', 'rvrp_ma', 'rvrp_ma_shifted']])
-            underlying_realized_vol['expected_move_rvrp'] = EXPECTED_MOVE_SCALAR * ( underlying_realized_vol['vix1d_935'] - underlying_realized_vol['rvrp_ma_shifted'] ) /(100* np.sqrt(252))       
-            
-            overnight_move = round(((price - prior_day_price) / prior_day_price)*100, 2)
-            
-            expected_move_original = (round((index_price / np.sqrt(252)), 2)/100)*EXPECTED_MOVE_SCALAR
-            
-            underlying_realized_vol.loc[date_object, 'expected_move_original'] = expected_move_original
-        
-            try:
-                expected_move = underlying_realized_vol['expected_move_rvrp'][date_object]
-            except:
-                continue
+    # SPXW strikes, sorted, looked up by binary search
+    right = "call" if direction == 0 else "put"
+    with instrumentation.span("chain_lookup"):
+        chain = chains.get(options_ticker, date, exp_date, right)
+    if direction == 0:
+        short_strike, short_ticker = chain.first_at_or_above(upper_price, 0)
+        long_strike, long_ticker = chain.first_at_or_above(upper_price, 1)
+
+    elif direction == 1:
+        short_strike, short_ticker = chain.nth_at_or_below(lower_price, 0)
+        long_strike, long_ticker = chain.nth_at_or_below(lower_price, 1)
+
+    band = None
+    if USE_STRIKE_BANDS:
+        with instrumentation.span("strike_band"):
+            band = bands.get_rights(options_ticker, date, exp_date, ["call", "put"], price)[right]
+    if band is not None and band.contains(short_strike) and band.contains(long_strike):
+        spread_value = band.spread_series(short_strike, long_strike)
+        spread_value = spread_value[spread_value.index.time >= ENTRY_TIME]
+    else:
+        spread_value = load_spread_value(short_ticker, long_ticker, date)
+    if PRICE_ENTRY_ON_QUOTES:
+        with instrumentation.span("entry_quotes"):
+            short_leg, long_leg = client.get_quote_summaries([short_ticker, long_ticker], *entry_window(date))
+        cost = short_leg.mid - long_leg.mid
+    else:
+        cost = spread_value.iloc[0]
+    final_value = spread_value.iloc[-1]
+    gross_pnl = cost - final_value
+    gross_pnl_percent = round((gross_pnl / cost)*100,2)
+
+    return {"date": date, "cost": cost, "final_price": final_value, "gross_pnl": gross_pnl, "gross_pnl_percent": gross_pnl_percent, "ticker": ticker, "direction": direction}
+
+def record_day_trade(date: str, price: float, direction: int, expected_move: float) -> dict:
+    """run_day_trade, checkpointed in the trade ledger with the inputs it was run with"""
+    trade = run_day_trade(date, price, direction, expected_move)
+    trade_ledger.append(date, {"inputs": [price, direction, expected_move], "trade": trade})
+    return trade
+
+def same_inputs(record: dict, args: tuple) -> bool:
+    return record is not None and record["inputs"][1] == args[2] and np.allclose(
+        [record["inputs"][0], record["inputs"][2]], [args[1], args[3]], rtol = 1e-12, atol = 0)
+
+def features_with_ledger(trading_dates: list, trend_regime: TrendRegime) -> pd.DataFrame:
+    """Per-day features of trading_dates[1:], computing only the days missing from the feature ledger"""
+    missing = feature_ledger.missing(trading_dates[1:])
+    if missing:
+        if USE_BAR_STORE:
+            # one pass from the session before the first missing day, the bar store only fetches new bars
+            computed = compute_features_from_store(trading_dates[trading_dates.index(missing[0]) - 1:], trend_regime)
         else:
-            expected_move = (round((index_price / np.sqrt(252)), 2)/100)*EXPECTED_MOVE_SCALAR
-
-        lower_price = round(price - (price * expected_move))
-        upper_price = round(price + (price * expected_move))
-        
-        #0DTE contracts
-        exp_date = date
-        
-        # Pull the data at 9:35 to represent the most up-to-date regime that would be available
-        concatenated_regime_dataset = pd.concat([big_underlying_data, etf_underlying_data.head(1)], axis = 0)
-        concatenated_regime_dataset["1_mo_avg"] = concatenated_regime_dataset["c"].rolling(window=20).mean()
-        concatenated_regime_dataset["3_mo_avg"] = concatenated_regime_dataset["c"].rolling(window=60).mean()
-        concatenated_regime_dataset['regime'] = concatenated_regime_dataset.apply(lambda row: 1 if (row['c'] > row['1_mo_avg']) else 0, axis=1)
-        
-        direction = concatenated_regime_dataset["regime"].iloc[-1] # downtrend == 0, uptrend == 1
-
-        if direction == 0:
-            
-            valid_calls = get_historical_option_contracts(options_ticker, date, exp_date, "call", polygon_api_key)
-            valid_calls = valid_calls[valid_calls["ticker"].str.contains("SPXW")].copy()
-            valid_calls["days_to_exp"] = (pd.to_datetime(valid_calls["expiration_date"]) - pd.to_datetime(date)).dt.days
-            valid_calls["distance_from_price"] = abs(valid_calls["strike_price"] - price)
-            
-            otm_calls = valid_calls[valid_calls["strike_price"] >= upper_price]
-            
-            short_call = otm_calls.iloc[[0]]
-            long_call = otm_calls.iloc[[1]]
-            
-            short_call_ohlcv = get_ticker_data(short_call['ticker'].iloc[0], date, date, 'minute', polygon_api_key)
-            short_call_ohlcv.index = pd.to_datetime(short_call_ohlcv.index, unit = "ms", utc = True).tz_convert("America/New_York") 
-            
-            long_call_ohlcv = get_ticker_data(long_call['ticker'].iloc[0], date, date, 'minute', polygon_api_key)
-            long_call_ohlcv.index = pd.to_datetime(long_call_ohlcv.index, unit = "ms", utc = True).tz_convert("America/New_York") 
-            
-            spread = pd.concat([short_call_ohlcv.add_prefix("short_call_"), long_call_ohlcv.add_prefix("long_call_")], axis = 1).dropna()
-            spread = spread[spread.index.time >= pd.Timestamp("09:35").time()].copy()
-            spread["spread_value"] = spread["short_call_c"] - spread["long_call_c"]
-            cost = spread["spread_value"].iloc[0]
-            
-            underlying_data["distance_from_short_strike"] = round(((short_call["strike_price"].iloc[0] - underlying_data["c"]) / underlying_data["c"].iloc[0])*100, 2)
-            
-            
-        elif direction == 1:
-        
-            valid_puts = get_historical_option_contracts(options_ticker, date, exp_date, "put", polygon_api_key)
-            valid_puts = valid_puts[valid_puts["ticker"].str.contains("SPXW")].copy()
-            valid_puts["days_to_exp"] = (pd.to_datetime(valid_puts["expiration_date"]) - pd.to_datetime(date)).dt.days
-            valid_puts["distance_from_price"] = abs(price - valid_puts["strike_price"])
-            
-            otm_puts = valid_puts[valid_puts["strike_price"] <= lower_price].sort_values("distance_from_price", ascending = True)
-            
-            short_put = otm_puts.iloc[[0]]
-            long_put = otm_puts.iloc[[1]]
-        
-            short_put_ohlcv = get_ticker_data(short_put['ticker'].iloc[0], date, date, 'minute', polygon_api_key)
-            short_put_ohlcv.index = pd.to_datetime(short_put_ohlcv.index, unit = "ms", utc = True).tz_convert("America/New_York")   
-            
-            long_put_ohlcv = get_ticker_data(long_put['ticker'].iloc[0], date, date, 'minute', polygon_api_key)
-            long_put_ohlcv.index = pd.to_datetime(long_put_ohlcv.index, unit = "ms", utc = True).tz_convert("America/New_York")
-            
-            spread = pd.concat([short_put_ohlcv.add_prefix("short_put_"), long_put_ohlcv.add_prefix("long_put_")], axis = 1).dropna()
-            spread = spread[spread.index.time >= pd.Timestamp("09:35").time()].copy()
-            spread["spread_value"] = spread["short_put_c"] - spread["long_put_c"]
-            cost = spread["spread_value"].iloc[0]
-            
-            underlying_data["distance_from_short_strike"] = round(((underlying_data["c"] - short_put["strike_price"].iloc[0]) / short_put["strike_price"].iloc[0])*100, 2)
-            
-        final_value = spread["spread_value"].iloc[-1]
-        gross_pnl = cost - final_value
-        gross_pnl_percent = round((gross_pnl / cost)*100,2)
-        
-        trade_data = pd.DataFrame([{"date": date, "cost": cost, "final_price": final_value, "gross_pnl": gross_pnl, "gross_pnl_percent": gross_pnl_percent, "ticker": ticker, "direction": direction}])
-
-        trade_list.append(trade_data)
-            
-        end_time = datetime.now()
-        seconds_to_complete = (end_time - start_time).total_seconds()
-        times.append(seconds_to_complete)
-        iteration = round((np.where(trading_dates==date)[0][0]/len(trading_dates))*100,2)
-        iterations_remaining = len(trading_dates) - np.where(trading_dates==date)[0][0]
-        average_time_to_complete = np.mean(times)
-        estimated_completion_time = (datetime.now() + timedelta(seconds = int(average_time_to_complete*iterations_remaining)))
-        time_remaining = estimated_completion_time - datetime.now()
-        print(f"{iteration}% complete, {time_remaining} left, ETA: {estimated_completion_time}")
-
-    except Exception as data_error:
-        print(data_error)
-        continue
-
-
-all_trades = pd.concat(trade_list).drop_duplicates("date").set_index("date")
-all_trades.index = pd.to_datetime(all_trades.index).tz_localize("America/New_York")
-
-all_trades["max_loss"] = (5 - all_trades["cost"])
-all_trades['gross_pnl'] = all_trades.apply(lambda row: row['max_loss']*-1 if (row['gross_pnl'] < row['max_loss']*-1) else row["gross_pnl"], axis=1)
-
-all_trades["contracts"] = (5 / all_trades["max_loss"]).astype(int)
-all_trades["max_loss"] = (all_trades["max_loss"]) * all_trades["contracts"]
-all_trades["fees"] = all_trades["contracts"] * .04
-all_trades["net_pnl"] = (all_trades["gross_pnl"] * all_trades["contracts"]) - all_trades["fees"]
-
-all_trades["net_capital"] = 20000 + (all_trades["net_pnl"]*100).cumsum()
-
-####
-
-monthly = all_trades.resample("M").sum(numeric_only=True)
-
-total_return = round(((all_trades["net_capital"].iloc[-1] - 2000) / 2000)*100, 2)
-sd = round(all_trades["gross_pnl_percent"].std(), 2)
-
-wins = all_trades[all_trades["net_pnl"] > 0]
-losses = all_trades[all_trades["net_pnl"] < 0]
-
-avg_win = wins["net_pnl"].mean()
-avg_loss = losses["net_pnl"].mean()
-
-win_rate = round(len(wins) / len(all_trades), 2)
-
-expected_value = round((win_rate * avg_win) + ((1-win_rate) * avg_loss), 2)
-
-all_trades.to_pickle("backtest_23_24_rvrp.pkl") 
-
-plt.figure(dpi=200)
-plt.xticks(rotation=45)
-plt.suptitle("Selling 0-DTE Credit Spreads - Trend Following")
-plt.plot(all_trades.index, all_trades["net_capital"])
-plt.legend(["Net PnL (Incl. Fees)"])
-plt.show()
-
-print(f"EV per trade: ${expected_value*100}")
-print(f"Win Rate: {win_rate*100}%")
-print(f"Avg Profit: ${round(avg_win*100,2)}")
-print(f"Avg Loss: ${round(avg_loss*100,2)}")
-print(f"Total Profit: ${all_trades['net_pnl'].sum()*100}")
+            prior_days = dict(zip(trading_dates[1:], trading_dates[:-1]))
+            computed = run_parallel(compute_day_features, [(date, prior_days[date], trend_regime) for date in missing],
+                                    MAX_WORKERS, EXECUTOR, desc = "features: ")
+            computed = pd.DataFrame([f for f in computed if f is not None], columns = FEATURE_COLUMNS)
+        computed = computed[FEATURE_COLUMNS].set_index("date")
+        # only computed days are recorded, failed days and days without market data are retried by the next run
+        for date in missing:
+            if date in computed.index:
+                feature_ledger.append(date, computed.loc[date].to_dict())
+    records = feature_ledger.records()
+    features = pd.DataFrame([{"date": date, **records[date]} for date in trading_dates[1:] if records.get(date)], columns = FEATURE_COLUMNS)
+    return features
+
+feature_ledger = Ledger(os.path.join(LEDGER_DIR, "features.jsonl"),
+                        params = {"tickers": [ticker, index_ticker, etf_ticker], "entry_time": str(ENTRY_TIME),
+                                  "expected_move_scalar": EXPECTED_MOVE_SCALAR, "bar_store": USE_BAR_STORE},
+                        code = [compute_day_features, compute_features_from_store, session_features])
+# the expected move (RVRP or not) is part of the recorded inputs, a trade is rerun when it changes
+trade_ledger = Ledger(os.path.join(LEDGER_DIR, "trades.jsonl"),
+                      params = {"options_ticker": options_ticker, "entry_time": str(ENTRY_TIME),
+                                "price_entry_on_quotes": PRICE_ENTRY_ON_QUOTES, "band_pct": bands.band_pct},
+                      code = [run_day_trade, load_spread_value, entry_window])
+
+
+if __name__ == "__main__":
+
+    trading_dates = schedule_trading_dates("NYSE", "2023-05-01", (datetime.today()-timedelta(days = 1)))
+
+    # trend regime history is loaded once, each day then only appends its 9:35 bar
+    with instrumentation.span("spy_history"):
+        trend_regime = TrendRegime(client.get_ticker_data(etf_ticker, "2020-01-01", trading_dates[-1], 'day'), window = 20)
+
+    with instrumentation.span("features"):
+        features = features_with_ledger(list(trading_dates), trend_regime)
+    features = features[FEATURE_COLUMNS]
+    features = features.set_index("date").reindex(trading_dates)
+    with instrumentation.span("rvrp"):
+        feature_store = build_feature_store(features)
+        feature_store.save(RVRP_STORE_PATH) # the live app picks up the trailing RVRP from here
+    if USE_RVRP:
+        features["expected_move"] = feature_store.to_frame(EXPECTED_MOVE_SCALAR)["expected_move_rvrp"]
+    else:
+        features["expected_move"] = features["expected_move_original"]
+
+    # days without a full RVRP window (or without market data) have no expected move and are not traded
+    tradable = features.dropna(subset = ["expected_move"])
+    trade_args = [(date, row["price"], int(row["direction"]), row["expected_move"]) for date, row in tradable.iterrows()]
+    done = trade_ledger.records()
+    pending = [args for args in trade_args if not same_inputs(done.get(args[0]), args)]
+    print(f"{len(trade_args) - len(pending)} trades from the ledger, {len(pending)} to run")
+    run_parallel(record_day_trade, pending, MAX_WORKERS, EXECUTOR, desc = "trades: ")
+    done = trade_ledger.records()
+    trade_list = [done[args[0]]["trade"] for args in trade_args if same_inputs(done.get(args[0]), args)]
+
+    all_trades = pd.DataFrame(trade_list).drop_duplicates("date").set_index("date")
+    all_trades.index = pd.to_datetime(all_trades.index).tz_localize("America/New_York")
+
+    all_trades = analytics.size_trades(all_trades, width = 5, capital = STARTING_CAPITAL)
+
+    ####
+
+    stats = analytics.summary(all_trades, STARTING_CAPITAL)
+    monthly = analytics.monthly(all_trades, STARTING_CAPITAL)
+    regimes = analytics.by_regime(all_trades, "direction", STARTING_CAPITAL)
+    risk = analytics.monte_carlo(all_trades["net_pnl"] * analytics.MULTIPLIER, STARTING_CAPITAL, n_paths = 20000, seed = 0)
+
+    all_trades.to_pickle("backtest_23_24_rvrp.pkl")
+
+    plt.figure(dpi=200)
+    plt.xticks(rotation=45)
+    plt.suptitle("Selling 0-DTE Credit Spreads - Trend Following")
+    plt.plot(all_trades.index, all_trades["net_capital"])
+    plt.legend(["Net PnL (Incl. Fees)"])
+    plt.show()
 
+    print(f"EV per trade: ${round(stats['expected_value'],2)}")
+    print(f"Win Rate: {stats['win_rate']*100}%")
+    print(f"Avg Profit: ${round(stats['avg_win'],2)}")
+    print(f"Avg Loss: ${round(stats['avg_loss'],2)}")
+    print(f"Total Profit: ${round(stats['total_profit'],2)}")
+    print(f"Total Return: {stats['total_return_pct']}% | Sharpe: {round(stats['sharpe'],2)} | Sortino: {round(stats['sortino'],2)} | Max Drawdown: {round(stats['max_drawdown_pct'],2)}%")
+    print(monthly)
+    print(regimes)
+    print(f"Monte Carlo: median final capital ${round(risk['terminal'][0.5],2)}, P(loss) {risk['prob_loss']:.2%}, risk of ruin {risk['risk_of_ruin']:.2%}")
+    print(instrumentation.summary(client))
+    print(client.stats_frame())
+    instrumentation.close()
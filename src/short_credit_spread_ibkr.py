@@ -4,19 +4,25 @@ Production code for Short Credit Spread strategy using IBKR API (ib_async)
 Reference: https://github.com/quantgalore/selling-volatility/blob/main/spread-production-tastytrade.py
 """
 import sys
+import time
 import datetime
 import pandas as pd
 import numpy as np
 from termcolor import cprint
+import ib_async
 from ib_async import *
 from dotenv import dotenv_values
+from typing import Optional
 from zoneinfo import ZoneInfo
-from utils.ibkr import specific_option_contract, convert_tickers_to_full_chain, noChainFoundException
+from utils.ibkr import specific_option_contract, noChainFoundException, batched, strikes_in_band, ticker_ready, wait_for_tickers, credit_spread_combo, limit_prices, wait_for_fill
 from zoneinfo import ZoneInfo
 from utils.alerts import Alerts
-from utils.polygon import get_ticker_data, schedule_trading_dates
+from utils.polygon import PolygonClient, schedule_trading_dates
 from datetime import timedelta
-from utils.options import find_closest_strike
+from utils.option_chain import OptionChain
+from utils.regime_state import RegimeState
+from utils.spread_monitor import SpreadMonitor
+from utils.features import RVRPFeatureStore, session_features
 
 def get_date_today(tz : str = "US/Eastern") -> str:
     """Return today date in yyyymmdd format"""
@@ -48,18 +54,33 @@ class ShortCreditSpread:
         self.size = 1
         self.dist_factor = 0.5 
         self.spread_width = 5
+        self.use_rvrp = params.get("use_rvrp", False)
+        self.rvrp_window = params.get("rvrp_window", 21)
+        self.strike_band = params.get("strike_band", 25) # points around the short/long strikes to request
+        self.max_market_data_lines = params.get("max_market_data_lines", 90) # stay under the account's line limit (100 by default)
+        self.chain_ready_timeout = params.get("chain_ready_timeout", 10) # seconds to wait for quotes + greeks per batch
+        self.chain_ready_threshold = params.get("chain_ready_threshold", 1.0) # share of contracts that must be ready
+        self.price_improvement_step = params.get("price_improvement_step", 0.05) # credit conceded per attempt
+        self.price_improvement_timeout = params.get("price_improvement_timeout", 5) # seconds per limit price
+        self.price_improvement_max_steps = params.get("price_improvement_max_steps", 4) # attempts before the market price
+        self.monitor_interval = params.get("monitor_interval", 10) # seconds between P&L updates
+        self.stop_loss = params.get("stop_loss") # fraction of the credit lost, None to hold until expiry
+        self.take_profit = params.get("take_profit") # fraction of the credit kept, None to hold until expiry
 
         # configs
         self.host = auth_config['TWS_HOST']
         self.port = int(auth_config['TWS_PORT'])
         self.polygon_api_key = auth_config['POLYGON_API_KEY']
+        self.polygon = PolygonClient(self.polygon_api_key, requests_per_minute = float(auth_config['POLYGON_REQUESTS_PER_MINUTE']) if auth_config.get('POLYGON_REQUESTS_PER_MINUTE') else None)
+        self.rvrp_store_path = auth_config.get('RVRP_STORE_PATH') or "rvrp_features.npz"
+        self.regime_state_path = auth_config.get('REGIME_STATE_PATH') or "regime_state.json"
+        # services (before connecting, connection failures are alerted)
+        self.alerts = Alerts(services) 
         # IB Client
         self.ib = IB()
         self.subscribe_events()
         self.clientId = 0
         self.connect()
-        # services
-        self.alerts = Alerts(services) 
 
         # tickers for polygon
         self.ticker = "I:SPX"
@@ -86,6 +107,8 @@ class ShortCreditSpread:
         self.filtered_contracts = dict()
         self.positions = self.ib.positions()
         self.trade_dict = dict()
+        self.monitor = None
+        self.monitor_tickers = dict()
 
     def connect(self):
         curr_reconnect = 0 
@@ -109,9 +132,11 @@ class ShortCreditSpread:
     
     def stop(self):
         self.ib.disconnect()
+        self.alerts.close() # flush queued alerts
         
     def exit_program(self):
         self.alerts.info(f"Program exited at market close")
+        self.stop_monitor()
         self.stop()
         sys.exit()
     
@@ -128,36 +153,28 @@ class ShortCreditSpread:
     ##################
 
     def compute_regimes(self):
-        # calculate regimes with Polygon endpoints
-        trading_dates = schedule_trading_dates("NYSE", "2024-05-01", (datetime.datetime.today()-timedelta(days = 1)))
-        last_trading_date = trading_dates[-1]
+        # calculate regimes with Polygon endpoints from the local state of the previous days' closes
+        # only the sessions since the last run are requested
+        state = RegimeState.load_or_new(self.regime_state_path, [self.vix_ticker, self.underlying_ticker], log = self.alerts.warning)
+        added = state.update(self.polygon, get_date_today() - timedelta(days = 1))
+        state.save(self.regime_state_path)
+        cprint(f"Regime state updated with {added} daily closes", "green")
 
         # calculate previous day's market variables
         # calculate vix1D
-        vix_data = get_ticker_data(self.vix_ticker, "2024-01-01", last_trading_date, polygon_api_key=self.polygon_api_key)
-        vix_data.index = pd.to_datetime(vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        vix_data["1_mo_avg"] = vix_data["c"].rolling(window=20).mean()
-        vix_data["3_mo_avg"] = vix_data["c"].rolling(window=60).mean()
-        vix_data['vol_regime'] = vix_data.apply(lambda row: 1 if (row['1_mo_avg'] > row['3_mo_avg']) else 0, axis=1)
-        vix_data["str_date"] = vix_data.index.strftime("%Y-%m-%d")
-        self.vol_regime = vix_data["vol_regime"].iloc[-1]
-        cprint(f"Vol regime: {self.vol_regime}, vix last close: {vix_data['c'].iloc[-1]}", "green")
+        self.vol_regime = state.vol(self.vix_ticker)
+        cprint(f"Vol regime: {self.vol_regime}, vix last close: {state.last_close(self.vix_ticker)}", "green")
         # underlying trend regime
         # TODO: why SPY instead of SPX here.
-        hist_underlying_data = get_ticker_data(self.underlying_ticker, "2024-01-01", last_trading_date, polygon_api_key=self.polygon_api_key)
-        hist_underlying_data.index = pd.to_datetime(hist_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        hist_underlying_data["1_mo_avg"] = hist_underlying_data["c"].rolling(window=20).mean()
-        hist_underlying_data["3_mo_avg"] = hist_underlying_data["c"].rolling(window=60).mean()
-        hist_underlying_data['regime'] = hist_underlying_data.apply(lambda row: 1 if (row['c'] > row['1_mo_avg']) else 0, axis=1)
-        self.trend_regime = hist_underlying_data['regime'].iloc[-1]
+        self.trend_regime = state.trend(self.underlying_ticker)
         cprint(f"trend regime: {self.trend_regime}", "green")
 
     def compute_expected_move(self):
         # calculate expected move
-        underlying_data = get_ticker_data(self.ticker, start_date = self.today, end_date= self.today, timespan = "minute", polygon_api_key=self.polygon_api_key)
+        underlying_data = self.polygon.get_ticker_data(self.ticker, start_date = self.today, end_date= self.today, timespan = "minute")
         underlying_data.index = pd.to_datetime(underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
 
-        live_vix_data = get_ticker_data(self.vix_ticker, start_date = self.today, end_date= self.today, timespan = "minute", polygon_api_key=self.polygon_api_key)
+        live_vix_data = self.polygon.get_ticker_data(self.vix_ticker, start_date = self.today, end_date= self.today, timespan = "minute")
 
         live_vix_data.index = pd.to_datetime(live_vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
         
@@ -165,6 +182,12 @@ class ShortCreditSpread:
         price = underlying_data[underlying_data.index.time >= pd.Timestamp("09:35").time()]["c"].iloc[0]
 
         expected_move = (round((index_price / np.sqrt(252)), 2)/100) * self.dist_factor
+        if self.use_rvrp:
+            rvrp_expected_move = self.update_rvrp_features().next_expected_move(index_price, self.dist_factor)
+            if np.isnan(rvrp_expected_move):
+                self.alerts.warning("RVRP window incomplete, using the VIX1D expected move")
+            else:
+                expected_move = rvrp_expected_move
         cprint(f"Expected_move: {expected_move}", "red")
 
         if self.trend_regime == 1: # put
@@ -178,50 +201,107 @@ class ShortCreditSpread:
             self.long_strike = self.short_strike + self.spread_width
 
         cprint(f"short strike: {self.short_strike}, long strike: {self.long_strike}", "red")
+    def load_session(self, ticker: str, date: str) -> pd.DataFrame:
+        """Minute bars of a session from the 9:35 bar on"""
+        data = self.polygon.get_ticker_data(ticker, start_date = date, end_date = date, timespan = "minute")
+        data.index = pd.to_datetime(data.index, unit="ms", utc=True).tz_convert("America/New_York")
+        return data[data.index.time >= pd.Timestamp("09:35").time()]
+
+    def update_rvrp_features(self) -> RVRPFeatureStore:
+        """Append the sessions missing from the RVRP store (shared with the backtest) up to yesterday"""
+        try:
+            store = RVRPFeatureStore.load(self.rvrp_store_path)
+        except FileNotFoundError:
+            store = RVRPFeatureStore(window = self.rvrp_window)
+        start = store.last_date + timedelta(days = 1) if store.last_date else get_date_today() - timedelta(days = 3 * self.rvrp_window)
+        missing_dates = [d for d in schedule_trading_dates("NYSE", start, get_date_today() - timedelta(days = 1))]
+        for date in missing_dates:
+            try:
+                features = session_features(self.load_session(self.ticker, date), self.load_session(self.vix_ticker, date))
+            except Exception as e:
+                self.alerts.warning(f"RVRP features missing for {date}: {e}")
+                features = {}
+            store.append(date, **features)
+        if missing_dates:
+            store.save(self.rvrp_store_path)
+        return store
+
+    def get_sec_def_chain(self) -> ib_async.OptionChain:
+        chains = self.ib.reqSecDefOptParams(self.underlying_contract.symbol, 
+                                            '', 
+                                            self.underlying_contract.secType, 
+                                            self.underlying_contract.conId)
+        return next(c for c in chains if c.tradingClass == self.trading_class and c.exchange == self.exchange)
+
     def get_all_expirations(self):
-            chains = self.ib.reqSecDefOptParams(self.underlying_contract.symbol, 
-                                                '', 
-                                                self.underlying_contract.secType, 
-                                                self.underlying_contract.conId)
-            chain = next(c for c in chains if c.tradingClass == self.trading_class and c.exchange == self.exchange)
+            chain = self.get_sec_def_chain()
             all_expirations = sorted(exp for exp in chain.expirations)
             return all_expirations
     
     def get_all_contracts(self):
-        # exp_list = self.get_all_expirations()
-        expiration = self.today.replace("-", "") # exp_list[0] expiration only accepts YYYYMMDD
-        ## SHORT LEG 
-        short_cds = self.ib.reqContractDetails(
-            Option(
-                symbol = self.underlying_contract.symbol, 
-                lastTradeDateOrContractMonth=expiration, 
-                right = self.right,
-                exchange = self.exchange,  # for SPX, use SMART (primary exchange). By default, exchange is CBOE for SPX.
-                tradingClass = self.trading_class)
-            )
-        self.contracts = self.ib.qualifyContracts(*[cd.contract for cd in short_cds])
-        self.ib.sleep(15)
+        """Qualify the strikes within strike_band points of the short/long targets only
+
+        The strike list comes from reqSecDefOptParams, so a single request replaces the
+        contract details of the whole day's chain.
+        """
+        expiration = self.today.replace("-", "") # expiration only accepts YYYYMMDD
+        chain = self.get_sec_def_chain()
+        if expiration not in chain.expirations:
+            self.alerts.error(f"No {self.trading_class} expiration on {expiration}. No order placed.")
+            raise noChainFoundException
+        low, high = sorted([self.short_strike, self.long_strike])
+        strikes = strikes_in_band(chain.strikes, low, high, self.strike_band)
+        if not strikes:
+            self.alerts.error(f"No {self.trading_class} strikes within {self.strike_band} of {low}-{high}. No order placed.")
+            raise noChainFoundException
+        options = [Option(
+                        symbol = self.underlying_contract.symbol, 
+                        lastTradeDateOrContractMonth=expiration, 
+                        strike = strike,
+                        right = self.right,
+                        exchange = self.exchange,  # for SPX, use SMART (primary exchange). By default, exchange is CBOE for SPX.
+                        tradingClass = self.trading_class)
+                   for strike in strikes]
+        self.contracts = []
+        for batch in batched(options, self.max_market_data_lines):
+            self.contracts += [c for c in self.ib.qualifyContracts(*batch) if c.conId]
+        self.alerts.info(f"{len(self.contracts)} {self.right} contracts qualified between {strikes[0]} and {strikes[-1]}")
     
+    def request_tickers(self, contracts) -> list[Ticker]:
+        """Stream market data in batches of at most max_market_data_lines contracts, each batch
+        released as soon as it is ready (or its deadline passes). Logs the time-to-ready."""
+        tickers, ready, total, seconds = [], 0, 0, 0.0
+        for batch in batched(list(contracts), self.max_market_data_lines):
+            batch_tickers = [self.ib.reqMktData(contract, "", False, False) for contract in batch]
+            readiness = self.ib.run(wait_for_tickers(self.ib, batch_tickers, self.chain_ready_timeout, self.chain_ready_threshold))
+            for contract in batch:
+                self.ib.cancelMktData(contract)
+            tickers += batch_tickers
+            ready, total, seconds = ready + readiness.ready, total + readiness.total, seconds + readiness.seconds
+        status = "ready" if ready >= self.chain_ready_threshold * total else "timed out"
+        self.alerts.info(f"Option chain {status}: {ready}/{total} contracts with quotes and greeks in {seconds:.2f}s")
+        return tickers
     
     def get_option_chain(self, contracts):
         attempts = 1
-        # aggregate full chain (reattempt in 30s if failed for 3 attempts)
+        # aggregate full chain (reattempt immediately if the deadline passed, for 3 attempts)
         while attempts <= self.get_option_chain_attempt:
             self.alerts.info(f"Attempt {attempts}: Requesting option chain...")
-            tickers = self.ib.reqTickers(*contracts)
-            self.ib.sleep(30)
+            tickers = self.request_tickers(contracts)
+            ready = [ticker for ticker in tickers if ticker_ready(ticker)]
             try:
-                df = convert_tickers_to_full_chain(tickers)
+                if not ready or len(ready) < self.chain_ready_threshold * len(tickers):
+                    raise noChainFoundException
+                chain = OptionChain.from_ib_tickers(ready, need_greeks = True)
             except noChainFoundException as e:
                 if attempts == self.get_option_chain_attempt:
                     self.alerts.warning(f"Missing data for tickers. Program exited after 3 attempts. Please troubleshoot market data subscription manually.")
                     sys.exit()
-                self.ib.sleep(30)
                 attempts += 1
             else: 
                 break 
             
-        return df.sort_values('strike').reset_index(drop = True)
+        return chain
     
     def schedule_all_tasks(self):
         """INDICATE WHAT TASKS YOU WANT TO RUN HERE"""
@@ -238,15 +318,20 @@ class ShortCreditSpread:
     
     def run_strategy(self):
         util.startLoop()
+        signal_time = time.perf_counter()
         # Calculate expected move after 5 mins after market opens 9:35
         self.compute_expected_move()
         # Get option chain
-        self.get_all_contracts()
-        self.chain_df = self.get_option_chain(self.contracts)
+        try:
+            self.get_all_contracts()
+        except noChainFoundException:
+            return
+        self.chain = self.get_option_chain(self.contracts)
+        self.alerts.info(f"Option chain acquired {time.perf_counter() - signal_time:.2f}s after the entry signal")
         
         # find SHORT and LONG contract
-        self.short_leg = find_closest_strike(self.chain_df, self.short_strike, self.right) 
-        self.long_leg = find_closest_strike(self.chain_df, self.long_strike, self.right)
+        self.short_leg = self.chain.nearest_strike(self.right, self.short_strike) 
+        self.long_leg = self.chain.nearest_strike(self.right, self.long_strike)
 
         # check if the width found is correct. If not, then do not enter
         if self.right == "P":
@@ -259,8 +344,8 @@ class ShortCreditSpread:
                 return
 
         self.filtered_contracts = {
-            "short_put": specific_option_contract(self.short_leg['index']),
-            "long_put": specific_option_contract(self.long_leg['index']),
+            "short_put": specific_option_contract(self.short_leg['symbol']),
+            "long_put": specific_option_contract(self.long_leg['symbol']),
         }
         # Qualify contracts
         tradable_contracts = self.ib.qualifyContracts(*list(self.filtered_contracts.values()))
@@ -281,19 +366,75 @@ class ShortCreditSpread:
             self.alerts.warning("Incomplete contracts found. No order placed.")
             return
         
-        # Place order (if naked puts not allowed in trading account level, long has to be placed first)
-        long_put_order = MarketOrder('BUY', self.size)
-        long_put_trade = self.ib.placeOrder(self.filtered_contracts['long_put'], long_put_order)
-        
-        self.trade_dict['long_put'] = long_put_trade
-        while not long_put_trade.isActive():
-            self.ib.waitOnUpdate()
-            
-        short_put_order = MarketOrder('SELL', self.size) # use limit order if possible
-        short_put_trade = self.ib.placeOrder(self.filtered_contracts['short_put'], short_put_order)
-        while not short_put_trade.isActive():
-            self.ib.waitOnUpdate()
-        
+        # Place order: one combo, both legs fill together (no leg risk, no naked short even for a moment)
+        trade = self.place_spread_order()
+        self.alerts.info(f"Entry done {time.perf_counter() - signal_time:.2f}s after the entry signal")
+        if trade is not None:
+            self.start_monitor(trade)
+
+    def place_spread_order(self) -> Optional[Trade]:
+        """Sell the vertical as a BAG, starting at the mid credit and conceding
+        price_improvement_step every price_improvement_timeout seconds down to the market credit"""
+        combo = credit_spread_combo(self.filtered_contracts['short_put'], self.filtered_contracts['long_put'], self.exchange)
+        prices = limit_prices(self.optimal_price, self.buy_at_mkt_price, self.price_improvement_step, self.price_improvement_max_steps)
+        trade = None
+        start = time.perf_counter()
+        for price in prices:
+            if trade is None:
+                trade = self.ib.placeOrder(combo, LimitOrder('SELL', self.size, price))
+                self.trade_dict['spread'] = trade
+            else:
+                # same orderId, modifies the working order
+                trade.order.lmtPrice = price
+                self.ib.placeOrder(combo, trade.order)
+            self.alerts.info(f"Credit spread order working @ {price}")
+            if self.ib.run(wait_for_fill(trade, self.price_improvement_timeout)):
+                self.alerts.info(f"Credit spread filled @ {trade.orderStatus.avgFillPrice} in {time.perf_counter() - start:.2f}s")
+                return trade
+            if trade.isDone():
+                return self.filled_position(trade, f"order {trade.orderStatus.status}")
+        self.ib.cancelOrder(trade.order)
+        # the order can still fill until the cancel is confirmed, wait for its final status
+        self.ib.run(wait_for_fill(trade, self.price_improvement_timeout))
+        if not trade.isDone():
+            self.alerts.error(f"Credit spread cancel not confirmed ({trade.orderStatus.status}), check the order {trade.order.orderId}")
+        return self.filled_position(trade, f"not filled down to {prices[-1]}, order cancelled")
+
+    def filled_position(self, trade: Trade, reason: str) -> Optional[Trade]:
+        """The trade when any of it filled (a partial fill is a live position too), else None"""
+        if trade.orderStatus.filled > 0:
+            self.alerts.warning(f"Credit spread {reason} after filling {trade.orderStatus.filled} of {trade.order.totalQuantity} "
+                                f"@ {trade.orderStatus.avgFillPrice}, monitoring the filled part")
+            return trade
+        self.alerts.warning(f"Credit spread {reason}, no position opened")
+        return None
+
+    def start_monitor(self, trade: Trade):
+        """Stream both legs and SPX, P&L and exits are evaluated on their tick events"""
+        self.monitor = SpreadMonitor(self.right, self.short_leg['strike'], self.long_leg['strike'], trade.orderStatus.avgFillPrice,
+                                     int(trade.orderStatus.filled), interval = self.monitor_interval, stop_loss = self.stop_loss, take_profit = self.take_profit)
+        self.monitor_tickers = {
+            "short": self.ib.reqMktData(self.filtered_contracts['short_put'], "", False, False),
+            "long": self.ib.reqMktData(self.filtered_contracts['long_put'], "", False, False),
+            "spot": self.ib.reqMktData(self.underlying_contract, "", False, False),
+        }
+        self.ib.pendingTickersEvent += self.on_pending_tickers
+
+    def stop_monitor(self):
+        if not self.monitor_tickers:
+            return
+        self.ib.pendingTickersEvent -= self.on_pending_tickers
+        for ticker in self.monitor_tickers.values():
+            self.ib.cancelMktData(ticker.contract)
+        self.monitor_tickers = dict()
+
+    def close_spread(self, reason: str):
+        """Buy back the vertical in one combo order"""
+        combo = credit_spread_combo(self.filtered_contracts['short_put'], self.filtered_contracts['long_put'], self.exchange)
+        self.trade_dict['close'] = self.ib.placeOrder(combo, MarketOrder('BUY', self.monitor.size))
+        self.alerts.warning(f"*{reason}*: closing the credit spread at market")
+        self.stop_monitor()
+
     ##################
     # EVENT HANDLERS #
     ##################
@@ -311,6 +452,19 @@ class ShortCreditSpread:
             self.alerts.info(fill_msg)
 
     
+    def on_pending_tickers(self, tickers):
+        """Incremental P&L / risk update on every tick of the monitored contracts"""
+        if self.monitor is None or not any(t in tickers for t in self.monitor_tickers.values()):
+            return
+        short, long, spot = self.monitor_tickers["short"], self.monitor_tickers["long"], self.monitor_tickers["spot"]
+        state, report = self.monitor.update(short.midpoint(), long.midpoint(), spot.marketPrice())
+        if not report:
+            return
+        self.alerts.info(f"Live PnL: ${round(state.pnl,2)} | {state.pnl_percent}% | spread value: {round(state.mark,2)} | "
+                         f"spot: {state.spot} | % away from short strike: {state.distance_from_short_strike}%")
+        if state.exit_reason is not None:
+            self.close_spread(state.exit_reason)
+
     def on_disconnection(self):
         self.connect()
 
@@ -321,7 +475,7 @@ if __name__ == "__main__":
     
     auth_config = dotenv_values(".env")
     services = None
-    params = {}
+    params = {"use_rvrp": False}
 
     trading_app = ShortCreditSpread(auth_config, params, services)
     
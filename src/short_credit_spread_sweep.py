@@ -0,0 +1,79 @@
+""" Parameter sweep for the short 0DTE call/put spread
+
+Loads every trading day once (index bars plus a band of SPXW strikes around the open)
+and evaluates a grid of expected move scalars, spread widths and entry times on the
+loaded arrays. Results are a tidy frame, one row per (date, entry_time, scalar, width).
+"""
+import asyncio
+import numpy as np
+from datetime import datetime, timedelta
+from dotenv import dotenv_values
+from utils.date_util import schedule_trading_dates
+from utils.polygon import PolygonClient
+from utils.polygon_async import AsyncPolygonClient
+from utils.cache import AggregatesCache
+from utils.chain_reference import ChainReference
+from utils.strike_band import StrikeBandLoader
+from utils.signals import TrendRegime
+from utils.features import RVRPFeatureStore
+from utils.executor import run_parallel
+from utils.sweep import load_sweep_day, evaluate_grid, results_cube
+
+
+config = dotenv_values(".env")
+polygon_api_key = config['POLYGON_API_KEY']
+
+cache_dir = config.get('POLYGON_CACHE_DIR') or ".cache/polygon"
+client = PolygonClient(polygon_api_key,
+                       requests_per_minute = float(config['POLYGON_REQUESTS_PER_MINUTE']) if config.get('POLYGON_REQUESTS_PER_MINUTE') else None,
+                       cache = AggregatesCache(cache_dir, offline = config.get('POLYGON_OFFLINE') == "1"))
+chains = ChainReference(client, cache_dir)
+
+etf_ticker = "SPY"
+
+SCALARS = np.round(np.arange(0.25, 1.01, 0.05), 2)
+WIDTHS = [1, 2, 3, 4]
+ENTRY_TIMES = ["09:35", "09:45", "10:00", "10:30", "11:00"]
+# strikes loaded per day, must cover the largest scalar and width
+BAND_PCT = 0.03
+# use the trailing RVRP saved by the backtest instead of the plain VIX1D expected move
+USE_RVRP = False
+RVRP_STORE_PATH = config.get('RVRP_STORE_PATH') or "rvrp_features.npz"
+
+bands = StrikeBandLoader(client, chains, cache_dir, BAND_PCT)
+
+MAX_WORKERS = int(config.get('BACKTEST_WORKERS') or 8)
+EXECUTOR = config.get('BACKTEST_EXECUTOR') or "thread"
+
+
+def load_day(date: str, prior_day: str):
+    async def fetch():
+        async with AsyncPolygonClient.from_client(client) as aclient:
+            return await load_sweep_day(aclient, bands, date, prior_day)
+    return asyncio.run(fetch())
+
+
+if __name__ == "__main__":
+
+    trading_dates = schedule_trading_dates("NYSE", "2023-05-01", (datetime.today()-timedelta(days = 1)))
+    trend_regime = TrendRegime(client.get_ticker_data(etf_ticker, "2020-01-01", trading_dates[-1], 'day'), window = 20)
+
+    day_args = [(date, trading_dates[i-1]) for i, date in enumerate(trading_dates) if i > 0]
+    days = [d for d in run_parallel(load_day, day_args, MAX_WORKERS, EXECUTOR, desc = "loading: ") if d is not None]
+
+    rvrp_ma_shifted = RVRPFeatureStore.load(RVRP_STORE_PATH).to_frame()["rvrp_ma_shifted"] if USE_RVRP else None
+
+    start_time = datetime.now()
+    results = evaluate_grid(days, SCALARS, WIDTHS, ENTRY_TIMES, trend_regime, rvrp_ma_shifted)
+    print(f"{len(SCALARS) * len(WIDTHS) * len(ENTRY_TIMES)} combinations x {len(days)} days evaluated in {datetime.now() - start_time}")
+
+    results.to_pickle("sweep_results.pkl")
+    results_cube(results).to_pickle("sweep_cube.pkl")
+
+    summary = results.groupby(["scalar", "width", "entry_time"]).agg(
+        trades = ("gross_pnl", "count"),
+        total_pnl = ("gross_pnl", "sum"),
+        avg_pnl = ("gross_pnl", "mean"),
+        win_rate = ("gross_pnl", lambda pnl: (pnl > 0).mean()),
+    )
+    print(summary.sort_values("total_pnl", ascending = False).head(20))
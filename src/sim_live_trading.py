@@ -5,137 +5,177 @@ with a directional regime indicator, short the opposite direction spread at x ti
 This code simulates live trading using Polygon API. 
 For IBKR integration please refer to the _ibkr script.
 
+The entry phase runs once: strikes from the 9:35 prices and the 9:35 - 9:36 credit.
+After that each tick only polls the latest quote of both legs and the SPX bars
+newer than the last one held.
+
 Reference:
 https://polygon.io/docs/options/get_v3_quotes__optionsticker 
 
 """
 
-import time
-import requests
+import asyncio
 import pandas as pd
 import numpy as np
+from dataclasses import dataclass
 from dotenv import dotenv_values
 from datetime import datetime, timedelta
 from pandas_market_calendars import get_calendar
 from termcolor import cprint
-from utils.polygon import get_ticker_data, get_option_chain, get_historical_option_contracts, get_ticker_quote
+from utils.polygon import PolygonClient
+from utils.polygon_async import AsyncPolygonClient
+from utils.chain_reference import ChainReference
 from utils.date_util import schedule_trading_dates
+from utils.signals import trend_regime, vol_regime
 
 
-def initial_spread(short_ticker, long_ticker, start, end, polygon_api_key=None):
-    """Short call/put spread price"""
-    short_leg_mid = get_ticker_quote(short_ticker, start, end, polygon_api_key=polygon_api_key)
-    long_leg_mid = get_ticker_quote(long_ticker, start, end , polygon_api_key=polygon_api_key)
-    return short_leg_mid - long_leg_mid # short_call_quote["bid_price"].iloc[0] - long_call_quote["ask_price"].iloc[0]
-
-def get_latest_ticker_quote(ticker, polygon_api_key=None):
-    """For streaming latest mid-price quote of option ticker"""
-    quotes = pd.json_normalize(requests.get(f"https://api.polygon.io/v3/quotes/{ticker}?order=desc&limit=100&sort=timestamp&apiKey={polygon_api_key}").json()["results"]).set_index("sip_timestamp")
-    quotes.index = pd.to_datetime(quotes.index, unit = "ns", utc = True).tz_convert("America/New_York")
-    quotes["mid_price"] = (quotes["bid_price"] + quotes["ask_price"]) / 2
-    return quotes.index[0], quotes["mid_price"].iloc[0]
-
-def stream_spread_quote(short_ticker, long_ticker, polygon_api_key = None):
-    short_ts, short_leg_mid = get_latest_ticker_quote(short_ticker, polygon_api_key=polygon_api_key)
-    long_ts, long_leg_mid = get_latest_ticker_quote(long_ticker, polygon_api_key=polygon_api_key)
-    return short_ts, short_leg_mid - long_leg_mid
-
 config = dotenv_values(".env")
 polygon_api_key = config['POLYGON_API_KEY']
-
-trading_dates = schedule_trading_dates("NYSE", "2024-05-01", (datetime.today()-timedelta(days = 1)))
+client = PolygonClient(polygon_api_key, requests_per_minute = float(config['POLYGON_REQUESTS_PER_MINUTE']) if config.get('POLYGON_REQUESTS_PER_MINUTE') else None)
+chains = ChainReference(client, config.get('POLYGON_CACHE_DIR') or ".cache/polygon")
 
 ticker = "I:SPX"
 vix_ticker = "I:VIX1D"
 options_ticker = "SPX"
 underlying_ticker = "SPY"
 
-date = trading_dates[-1]
-
-# calculate previous day's market variables
-# calculate vix1D
-vix_data = get_ticker_data(vix_ticker, "2024-01-01", date, polygon_api_key=polygon_api_key)
-vix_data.index = pd.to_datetime(vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-vix_data["1_mo_avg"] = vix_data["c"].rolling(window=20).mean()
-vix_data["3_mo_avg"] = vix_data["c"].rolling(window=60).mean()
-vix_data['vol_regime'] = vix_data.apply(lambda row: 1 if (row['1_mo_avg'] > row['3_mo_avg']) else 0, axis=1)
-vix_data["str_date"] = vix_data.index.strftime("%Y-%m-%d")
-vol_regime = vix_data["vol_regime"].iloc[-1]
-cprint(f"Vol regime: {vol_regime}, vix last close: {vix_data['c'].iloc[-1]}", "green")
-# underlying trend regime
-# TODO: why SPY instead of SPX here.
-hist_underlying_data = get_ticker_data(underlying_ticker, "2024-01-01", date, polygon_api_key=polygon_api_key)
-hist_underlying_data.index = pd.to_datetime(hist_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-hist_underlying_data["1_mo_avg"] = hist_underlying_data["c"].rolling(window=20).mean()
-hist_underlying_data["3_mo_avg"] = hist_underlying_data["c"].rolling(window=60).mean()
-hist_underlying_data['regime'] = hist_underlying_data.apply(lambda row: 1 if (row['c'] > row['1_mo_avg']) else 0, axis=1)
-trend_regime = hist_underlying_data['regime'].iloc[-1]
-cprint(f"Trend regime: {trend_regime}", "green")
-# real time trades
-calendar = get_calendar("NYSE")
-real_trading_dates = calendar.schedule(start_date = (datetime.today()-timedelta(days=10)), end_date = (datetime.today())).index.strftime("%Y-%m-%d").values
-
-today = real_trading_dates[-1]
-exp_date = today
-
-# get market open quote timestamp
-quote_start_timestamp = (pd.to_datetime(today).tz_localize("America/New_York") + timedelta(hours = pd.Timestamp("09:35").time().hour, minutes = pd.Timestamp("09:35").time().minute)).value
-quote_end_timestamp = (pd.to_datetime(today).tz_localize("America/New_York") + timedelta(hours = pd.Timestamp("09:36").time().hour, minutes = pd.Timestamp("09:36").time().minute)).value
-
-trade_list = [] 
-side = "call" if trend_regime == 0 else "put"
+
+def prior_regimes(date: str) -> tuple:
+    """Vol and trend regime as of the close of date (the previous trading day)"""
+    # calculate previous day's market variables
+    # calculate vix1D
+    vix_data = client.get_ticker_data(vix_ticker, "2024-01-01", date)
+    vix_data.index = pd.to_datetime(vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
+    vix_data['vol_regime'] = vol_regime(vix_data["c"].to_numpy())
+    cprint(f"Vol regime: {vix_data['vol_regime'].iloc[-1]}, vix last close: {vix_data['c'].iloc[-1]}", "green")
+    # underlying trend regime
+    # TODO: why SPY instead of SPX here.
+    hist_underlying_data = client.get_ticker_data(underlying_ticker, "2024-01-01", date)
+    hist_underlying_data.index = pd.to_datetime(hist_underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
+    hist_underlying_data['regime'] = trend_regime(hist_underlying_data["c"].to_numpy())
+    cprint(f"Trend regime: {hist_underlying_data['regime'].iloc[-1]}", "green")
+    return vix_data["vol_regime"].iloc[-1], hist_underlying_data['regime'].iloc[-1]
+
+def entry_window(today: str) -> tuple:
+    """ns timestamps of the 9:35 - 9:36 entry quotes"""
+    quote_start_timestamp = (pd.to_datetime(today).tz_localize("America/New_York") + timedelta(hours = pd.Timestamp("09:35").time().hour, minutes = pd.Timestamp("09:35").time().minute)).value
+    quote_end_timestamp = (pd.to_datetime(today).tz_localize("America/New_York") + timedelta(hours = pd.Timestamp("09:36").time().hour, minutes = pd.Timestamp("09:36").time().minute)).value
+    return quote_start_timestamp, quote_end_timestamp
+
+@dataclass
+class Entry:
+    """Legs and credit frozen by the entry phase"""
+    side: str
+    short_strike: float
+    short_ticker: str
+    long_strike: float
+    long_ticker: str
+    init_spread_value: float
+
+
+class SpotBars:
+    """Today's SPX minute closes, extended with only the bars newer than the last one held"""
+    def __init__(self, bars: pd.DataFrame, today: str):
+        self.today = today
+        self.t = bars.index.to_numpy(dtype=np.int64)
+        self.c = bars["c"].to_numpy(dtype=np.float64) if len(bars) else np.empty(0)
+
+    async def update(self, aclient: AsyncPolygonClient):
+        # the last bar is refetched too, it keeps changing until its minute is over
+        start = int(self.t[-1]) if len(self.t) else int(entry_window(self.today)[0] // 1_000_000)
+        close = pd.to_datetime(self.today).tz_localize("America/New_York") + timedelta(hours = 16)
+        end = int(min(pd.Timestamp.now(tz = "UTC"), close).value // 1_000_000)
+        new = await aclient.fetch_ticker_data(ticker, start, end, "minute")
+        if len(new):
+            keep = self.t < new.index[0]
+            self.t = np.concatenate([self.t[keep], new.index.to_numpy(dtype=np.int64)])
+            self.c = np.concatenate([self.c[keep], new["c"].to_numpy(dtype=np.float64)])
+
+async def enter(aclient: AsyncPolygonClient, today: str, trend_regime: int) -> tuple:
+    """One-time entry phase: strikes from the 9:35 prices and the 9:35 - 9:36 credit -> (Entry, SpotBars)"""
+    exp_date = today
+    side = "call" if trend_regime == 0 else "put"
+    quote_start_timestamp, quote_end_timestamp = entry_window(today)
+
+    # index bars and the option chain don't depend on each other
+    bars, valid_chain = await asyncio.gather(aclient.get_tickers_data([ticker, vix_ticker], today, today, "minute"),
+                                             chains.aget(aclient, options_ticker, today, exp_date, side))
+    spot = SpotBars(bars[ticker], today)
+    underlying_data, live_vix_data = bars[ticker].copy(), bars[vix_ticker].copy()
+    underlying_data.index = pd.to_datetime(underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
+    live_vix_data.index = pd.to_datetime(live_vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
+
+    index_price = live_vix_data[live_vix_data.index.time >= pd.Timestamp("09:35").time()]["c"].iloc[0]
+    price = underlying_data[underlying_data.index.time >= pd.Timestamp("09:35").time()]["c"].iloc[0]
+
+    expected_move = (round((index_price / np.sqrt(252)), 2)/100)*.50
+
+    lower_price = round(price - (price*expected_move))
+    upper_price = round(price + (price*expected_move))
+
+    # weekly (SPXW) options only, 1 tick width
+    if trend_regime == 0:
+        short_strike, short_ticker = valid_chain.first_at_or_above(upper_price, 0)
+        long_strike, long_ticker = valid_chain.first_at_or_above(upper_price, 1)
+    elif trend_regime == 1:
+        short_strike, short_ticker = valid_chain.nth_at_or_below(lower_price, 0)
+        long_strike, long_ticker = valid_chain.nth_at_or_below(lower_price, 1)
+
+    init_spread_value = await aclient.initial_spread(short_ticker, long_ticker, start = quote_start_timestamp, end = quote_end_timestamp)
+    return Entry(side, short_strike, short_ticker, long_strike, long_ticker, init_spread_value), spot
+
+async def poll(aclient: AsyncPolygonClient, entry: Entry, spot: SpotBars) -> dict:
+    """Monitoring tick: latest quotes of both legs and the newest SPX bars, nothing else"""
+    (quote_ts, updated_spread_value), _ = await asyncio.gather(aclient.stream_spread_quote(entry.short_ticker, entry.long_ticker),
+                                                               spot.update(aclient))
+    if entry.side == "call":
+        distance_from_short_strike = round(((entry.short_strike - spot.c[-1]) / spot.c[0])*100, 2)
+    else:
+        distance_from_short_strike = round(((spot.c[-1] - entry.short_strike) / entry.short_strike)*100, 2)
+    return {"updated_spread_value": updated_spread_value, "quote_ts": quote_ts,
+            "distance_from_short_strike": distance_from_short_strike, "spot": spot.c[-1]}
 
 # monitoring during trading
-while True:
-    try:
-        underlying_data = get_ticker_data(ticker, start_date = today, end_date= today, timespan = "minute", polygon_api_key=polygon_api_key)
-        underlying_data.index = pd.to_datetime(underlying_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-
-        live_vix_data = get_ticker_data(vix_ticker, start_date = today, end_date= today, timespan = "minute", polygon_api_key=polygon_api_key)
-        live_vix_data.index = pd.to_datetime(live_vix_data.index, unit="ms", utc=True).tz_convert("America/New_York")
-        
-        index_price = live_vix_data[live_vix_data.index.time >= pd.Timestamp("09:35").time()]["c"].iloc[0]
-        price = underlying_data[underlying_data.index.time >= pd.Timestamp("09:35").time()]["c"].iloc[0]
-        
-        expected_move = (round((index_price / np.sqrt(252)), 2)/100)*.50
-
-        lower_price = round(price - (price*expected_move))
-        upper_price = round(price + (price*expected_move))
-
-        valid_chain = get_option_chain(options_ticker, side, today, exp_date, polygon_api_key=polygon_api_key)
-        valid_chain = valid_chain[valid_chain["ticker"].str.contains("SPXW")].copy() # get weekly options only
-        valid_chain["days_to_exp"] = (pd.to_datetime(valid_chain["expiration_date"]) - pd.to_datetime(date)).dt.days
-        valid_chain["distance_from_price"] = abs(valid_chain["strike_price"] - price) 
-
-        if trend_regime == 0:
-            otm_chain = valid_chain[valid_chain["strike_price"] >= upper_price]
-        elif trend_regime == 1: 
-            otm_chain = valid_chain[valid_chain["strike_price"] <= lower_price].sort_values("distance_from_price", ascending = True)
-        
-        short_leg = otm_chain.iloc[[0]]
-        long_leg = otm_chain.iloc[[1]] # 1 tick width
-        short_ticker = short_leg['ticker'].iloc[0]
-        long_ticker = long_leg['ticker'].iloc[0]
-        short_strike = short_leg["strike_price"].iloc[0]
-        long_strike = long_leg["strike_price"].iloc[0]
-        
-        init_spread_value = initial_spread(short_ticker, long_ticker, start = quote_start_timestamp, end = quote_end_timestamp, polygon_api_key=polygon_api_key)
-        quote_ts, updated_spread_value = stream_spread_quote(short_ticker, long_ticker, polygon_api_key=polygon_api_key)
-
-        if trend_regime == 0:
-            underlying_data["distance_from_short_strike"] = round(((short_strike - underlying_data["c"]) / underlying_data["c"].iloc[0])*100, 2)
-        elif trend_regime == 1:
-            underlying_data["distance_from_short_strike"] = round(((underlying_data["c"] - short_strike) / short_strike)*100, 2)
-            
-        gross_pnl = init_spread_value - updated_spread_value
-        gross_pnl_percent = round((gross_pnl / init_spread_value)*100,2)
-            
-        cprint(f"Live PnL: ${round(gross_pnl*100,2)} | {gross_pnl_percent}% | {quote_ts.strftime('%H:%M')}", "green")
-        cprint(f"initial premium: {round(init_spread_value,2)} | current spread value: {round(updated_spread_value,2)}", "yellow")
-        print(f"Side: {side} | Short Strike: {short_strike} | Long Strike: {long_strike} | % Away from strike: {underlying_data['distance_from_short_strike'].iloc[-1]}% | spot: {underlying_data['c'].iloc[-1]}")
-
-        time.sleep(10)
-        
-    except Exception as e:
-        cprint(e, "red")
-        continue
\ No newline at end of file
+async def monitor(today: str, trend_regime: int, interval: float = 10, iterations: int = None):
+    async with AsyncPolygonClient.from_client(client) as aclient:
+        # entry phase, retried until the 9:35 bars and the entry quotes exist
+        entry = None
+        while entry is None:
+            try:
+                entry, spot = await enter(aclient, today, trend_regime)
+            except Exception as e:
+                cprint(e, "red")
+                await asyncio.sleep(interval)
+        cprint(f"Entered {entry.side} spread {entry.short_strike}/{entry.long_strike} for {round(entry.init_spread_value,2)}", "green")
+
+        i = 0
+        while iterations is None or i < iterations:
+            i += 1
+            try:
+                state = await poll(aclient, entry, spot)
+
+                gross_pnl = entry.init_spread_value - state["updated_spread_value"]
+                gross_pnl_percent = round((gross_pnl / entry.init_spread_value)*100,2)
+
+                cprint(f"Live PnL: ${round(gross_pnl*100,2)} | {gross_pnl_percent}% | {state['quote_ts'].strftime('%H:%M')}", "green")
+                cprint(f"initial premium: {round(entry.init_spread_value,2)} | current spread value: {round(state['updated_spread_value'],2)}", "yellow")
+                print(f"Side: {entry.side} | Short Strike: {entry.short_strike} | Long Strike: {entry.long_strike} | % Away from strike: {state['distance_from_short_strike']}% | spot: {state['spot']}")
+
+            except Exception as e:
+                cprint(e, "red")
+
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+
+    trading_dates = schedule_trading_dates("NYSE", "2024-05-01", (datetime.today()-timedelta(days = 1)))
+    date = trading_dates[-1]
+    current_vol_regime, current_trend_regime = prior_regimes(date)
+
+    # real time trades
+    calendar = get_calendar("NYSE")
+    real_trading_dates = calendar.schedule(start_date = (datetime.today()-timedelta(days=10)), end_date = (datetime.today())).index.strftime("%Y-%m-%d").values
+    today = real_trading_dates[-1]
+
+    asyncio.run(monitor(today, current_trend_regime))
@@ -1,8 +1,16 @@
+import sys
+import time
 import smtplib
+import threading
 from abc import ABC, abstractmethod
+from collections import deque
 from typing import Optional
 from dataclasses import dataclass
 from termcolor import cprint, colored
+from utils.rate_limit import TokenBucket
+
+LEVELS = {"info": "green", "error": "red", "warning": "yellow"}
+POLICIES = ("coalesce", "drop_newest", "drop_oldest")
 
 
 class baseAlerts(ABC):
@@ -18,6 +26,125 @@ class baseAlerts(ABC):
     @abstractmethod
     def warning(self, message:str):
         pass
+
+
+class AlertWorker(threading.Thread):
+    """Background sender of one service
+
+    submit() only appends to a bounded buffer under a lock, so the caller (an IB event
+    handler) never waits on the service. The worker collects the messages that arrive
+    within batch_window seconds, sends them as one message per level and waits on the
+    token bucket between sends (not while close() drains the buffer). When the buffer is full:
+
+    - coalesce:    a message already waiting is counted again instead of queued, new ones are dropped
+    - drop_newest: the incoming message is dropped
+    - drop_oldest: the oldest waiting message is dropped
+
+    Dropped messages are reported with the next batch.
+    """
+    def __init__(self, service: baseAlerts, max_queue: int = 100, policy: str = "coalesce", rate_per_minute: Optional[float] = 20,
+                 batch_window: float = 1.0, max_batch: int = 20):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        super().__init__(name = f"alerts-{type(service).__name__}", daemon = True)
+        self.service = service
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.bucket = TokenBucket(rate_per_minute / 60) if rate_per_minute else None
+        self.dropped = 0
+        self._buffer = deque()  # [level, message, count]
+        self._waiting = {}      # (level, message) -> latest buffered entry, for coalesce
+        self._cond = threading.Condition()
+        self._closing = threading.Event()
+        self.start()
+
+    def submit(self, level: str, message: str) -> bool:
+        """Queue a message without blocking, False if it was dropped"""
+        key = (level, message)
+        with self._cond:
+            if self._closing.is_set():
+                return False
+            if len(self._buffer) >= self.max_queue:
+                if self.policy == "coalesce" and key in self._waiting:
+                    self._waiting[key][2] += 1
+                    return True
+                if self.policy != "drop_oldest":
+                    self.dropped += 1
+                    return False
+                self._forget(self._buffer.popleft())
+                self.dropped += 1
+            entry = [level, message, 1]
+            self._buffer.append(entry)
+            if self.policy == "coalesce":
+                self._waiting[key] = entry
+            self._cond.notify()
+        return True
+
+    def _forget(self, entry: list):
+        key = (entry[0], entry[1])
+        if self._waiting.get(key) is entry:
+            del self._waiting[key]
+
+    def _next_batch(self) -> tuple:
+        with self._cond:
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.max_batch))]
+            for entry in batch:
+                self._forget(entry)
+            dropped, self.dropped = self.dropped, 0
+        return batch, dropped
+
+    def _throttle(self):
+        """Wait for a token, cut short by close() so the flush is not paced by the rate limit"""
+        while self.bucket is not None and not self._closing.is_set():
+            wait = self.bucket.wait_time()
+            if wait == 0.0:
+                return
+            self._closing.wait(wait)
+
+    def _send(self, level: str, text: str):
+        self._throttle()
+        try:
+            getattr(self.service, level)(text)
+        except Exception as e:
+            cprint(f"{type(self.service).__name__} failed to send an alert: {e!r}", "red", file = sys.stderr)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closing.is_set():
+                    self._cond.wait()
+                if not self._buffer and self._closing.is_set():
+                    return
+            # let the rest of a burst arrive, unless shutting down
+            self._closing.wait(self.batch_window)
+            batch, dropped = self._next_batch()
+            by_level = {}
+            for level, message, count in batch:
+                by_level.setdefault(level, []).append(message if count == 1 else f"{message} (x{count})")
+            if dropped:
+                by_level.setdefault("warning", []).append(f"{dropped} alerts dropped, {self.service.__class__.__name__} queue full")
+            for level, messages in by_level.items():
+                self._send(level, "\n".join(messages))
+
+    def stop(self):
+        """Stop accepting messages and start flushing, without waiting"""
+        with self._cond:
+            self._closing.set()
+            self._cond.notify()
+
+    def close(self, timeout: Optional[float] = 5.0) -> bool:
+        """stop(), then wait for the buffered messages to be sent; False (and a warning on stderr) if some were not"""
+        self.stop()
+        self.join(timeout)
+        if self.is_alive():
+            with self._cond:
+                pending = sum(entry[2] for entry in self._buffer)
+            cprint(f"{type(self.service).__name__} alerts not flushed in time, {pending} still queued", "red", file = sys.stderr)
+            return False
+        return True
+
     
 class Alerts(baseAlerts):
     """dispatches messages to all NOTIFICATION services
@@ -25,30 +152,40 @@ class Alerts(baseAlerts):
     Currently implemented services include:
     - telegram
     - logger
+
+    Each service is sent to by its own AlertWorker, info/error/warning return at once.
+    close() flushes the workers, call it before the program exits.
     """
-    def __init__(self, services: Optional[list] = None):
+    def __init__(self, services: Optional[list] = None, max_queue: int = 100, policy: str = "coalesce",
+                 rate_per_minute: Optional[float] = 20, batch_window: float = 1.0):
         self.services = services
+        self.workers = [AlertWorker(service, max_queue, policy, rate_per_minute, batch_window) for service in services or []]
+
+    def _dispatch(self, level: str, message: str):
+        if not self.workers:
+            cprint(message, LEVELS[level])
+        for worker in self.workers:
+            worker.submit(level, message)
     
     def info(self, message):
-        if self.services is None:
-            cprint(message, "green")
-        else:
-            for services in self.services:
-                services.info(message)
+        self._dispatch("info", message)
     
     def error(self, message):
-        if self.services is None:
-            cprint(message, "red")
-        else:
-            for services in self.services:
-                services.error(message)
+        self._dispatch("error", message)
     
     def warning(self, message):
-        if self.services is None:
-            cprint(message, "yellow")
-        else:
-            for services in self.services:
-                services.warning(message)
+        self._dispatch("warning", message)
+
+    def close(self, timeout: Optional[float] = 5.0) -> bool:
+        """Flush every worker in parallel, timeout is shared by all of them"""
+        workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.stop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        flushed = True
+        for worker in workers:
+            flushed &= worker.close(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return flushed
 
 # @dataclass
 # class EmailMessage:
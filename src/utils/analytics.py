@@ -0,0 +1,215 @@
+"""Performance analytics and Monte Carlo for backtest trade ledgers
+
+A trade ledger is the backtest output: one row per date with cost, final_price,
+gross_pnl, gross_pnl_percent and direction (per spread, in index points). Everything
+here is vectorized over the rows:
+
+    trades = size_trades(all_trades)             # clamp, contracts, fees, net pnl, equity
+    summary(trades), monthly(trades), by_regime(trades)
+    monte_carlo(trades["net_pnl"] * MULTIPLIER, n_paths = 20000)
+    position_sizing(trades, fractions = [0.01, 0.02, 0.05])
+
+Monte Carlo paths are bootstrapped from the historical trades (optionally in blocks to
+keep streaks together) and built as one (n_paths, horizon) array.
+"""
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+STARTING_CAPITAL = 20000
+MULTIPLIER = 100
+SPREAD_WIDTH = 5
+FEE_PER_CONTRACT = 0.04
+PERIODS_PER_YEAR = 252
+
+
+###################
+# TRADE LEDGER    #
+###################
+
+def size_trades(trades: pd.DataFrame, width: float = SPREAD_WIDTH, risk_budget: float = SPREAD_WIDTH,
+                fee: float = FEE_PER_CONTRACT, capital: float = STARTING_CAPITAL) -> pd.DataFrame:
+    """Max loss clamp, contract count, fees, net P&L and equity of each trade
+
+    A spread cannot lose more than its width minus the credit; contracts are the
+    number of max losses that fit in risk_budget points.
+    """
+    trades = trades.copy()
+    max_loss = width - trades["cost"]
+    trades["gross_pnl"] = np.maximum(trades["gross_pnl"], -max_loss)
+    trades["contracts"] = (risk_budget / max_loss).astype(int)
+    trades["max_loss"] = max_loss * trades["contracts"]
+    trades["fees"] = trades["contracts"] * fee
+    trades["net_pnl"] = (trades["gross_pnl"] * trades["contracts"]) - trades["fees"]
+    trades["net_capital"] = capital + (trades["net_pnl"] * MULTIPLIER).cumsum()
+    return trades
+
+
+def equity_returns(trades: pd.DataFrame, capital: float = STARTING_CAPITAL) -> pd.Series:
+    """Return of each trade on the equity before it"""
+    equity = trades["net_capital"]
+    return (trades["net_pnl"] * MULTIPLIER) / equity.shift(1).fillna(capital)
+
+
+def drawdown(equity: pd.Series) -> pd.DataFrame:
+    peak = equity.cummax()
+    return pd.DataFrame({"equity": equity, "peak": peak, "drawdown": equity - peak, "drawdown_pct": equity / peak - 1})
+
+
+def longest_run(mask: np.ndarray) -> int:
+    """Longest streak of True in mask"""
+    mask = np.asarray(mask, dtype=bool)
+    if not mask.any():
+        return 0
+    # position of each element minus the position of the last False before it
+    idx = np.arange(len(mask))
+    last_false = np.maximum.accumulate(np.where(~mask, idx, -1))
+    return int((idx - last_false).max())
+
+
+def sharpe(returns, periods: int = PERIODS_PER_YEAR) -> float:
+    returns = np.asarray(returns, dtype=np.float64)
+    sd = returns.std(ddof=1)
+    return float(returns.mean() / sd * np.sqrt(periods)) if sd > 0 else np.nan
+
+
+def sortino(returns, periods: int = PERIODS_PER_YEAR) -> float:
+    returns = np.asarray(returns, dtype=np.float64)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    return float(returns.mean() / downside * np.sqrt(periods)) if downside > 0 else np.nan
+
+
+def tail_stats(pnl) -> dict:
+    """VaR / CVaR (as losses), skew, excess kurtosis and extremes of a P&L sample"""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    centered = pnl - pnl.mean()
+    sd = pnl.std()
+    stats = {}
+    for level in (0.95, 0.99):
+        var = -np.quantile(pnl, 1 - level)
+        stats[f"var_{int(level * 100)}"] = float(var)
+        stats[f"cvar_{int(level * 100)}"] = float(-pnl[pnl <= -var].mean())
+    stats.update({
+        "skew": float((centered ** 3).mean() / sd ** 3) if sd > 0 else np.nan,
+        "excess_kurtosis": float((centered ** 4).mean() / sd ** 4 - 3) if sd > 0 else np.nan,
+        "worst": float(pnl.min()),
+        "best": float(pnl.max()),
+    })
+    return stats
+
+
+def summary(trades: pd.DataFrame, capital: float = STARTING_CAPITAL) -> dict:
+    """Headline statistics of a sized ledger (size_trades), $ amounts per the MULTIPLIER"""
+    pnl = trades["net_pnl"].to_numpy(dtype=np.float64) * MULTIPLIER
+    returns = equity_returns(trades, capital)
+    dd = drawdown(trades["net_capital"])
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    win_rate = len(wins) / len(pnl) if len(pnl) else np.nan
+    avg_win = wins.mean() if len(wins) else 0.0
+    avg_loss = losses.mean() if len(losses) else 0.0
+    return {
+        "trades": len(pnl),
+        "total_profit": float(pnl.sum()),
+        "total_return_pct": round(float(trades["net_capital"].iloc[-1] - capital) / capital * 100, 2),
+        "win_rate": round(win_rate, 4),
+        "avg_win": float(avg_win),
+        "avg_loss": float(avg_loss),
+        "expected_value": float(win_rate * avg_win + (1 - win_rate) * avg_loss),
+        "profit_factor": float(wins.sum() / -losses.sum()) if len(losses) else np.inf,
+        "sd_gross_pnl_percent": round(float(trades["gross_pnl_percent"].std()), 2),
+        "sharpe": sharpe(returns),
+        "sortino": sortino(returns),
+        "max_drawdown": float(dd["drawdown"].min()),
+        "max_drawdown_pct": float(dd["drawdown_pct"].min() * 100),
+        "longest_drawdown_trades": longest_run(dd["drawdown"].to_numpy() < 0),
+        "max_consecutive_losses": longest_run(pnl < 0),
+        **tail_stats(pnl),
+    }
+
+
+def _breakdown(pnl: pd.Series, returns: pd.Series, keys) -> pd.DataFrame:
+    frame = pd.DataFrame({"pnl": pnl, "log_return": np.log1p(returns), "win": pnl > 0})
+    grouped = frame.groupby(keys)
+    return pd.DataFrame({
+        "trades": grouped["pnl"].size(),
+        "pnl": grouped["pnl"].sum(),
+        "return_pct": np.expm1(grouped["log_return"].sum()) * 100,
+        "win_rate": grouped["win"].mean(),
+        "avg_pnl": grouped["pnl"].mean(),
+        "worst": grouped["pnl"].min(),
+    })
+
+
+def monthly(trades: pd.DataFrame, capital: float = STARTING_CAPITAL) -> pd.DataFrame:
+    """Trades, $ P&L, compounded return and win rate per calendar month"""
+    pnl = trades["net_pnl"] * MULTIPLIER
+    return _breakdown(pnl, equity_returns(trades, capital), pd.DatetimeIndex(trades.index).tz_localize(None).to_period("M"))
+
+
+def by_regime(trades: pd.DataFrame, column: str = "direction", capital: float = STARTING_CAPITAL) -> pd.DataFrame:
+    """The monthly() breakdown per value of a regime column (direction: 0 call spreads in downtrends, 1 put spreads in uptrends)"""
+    pnl = trades["net_pnl"] * MULTIPLIER
+    return _breakdown(pnl, equity_returns(trades, capital), trades[column])
+
+
+###################
+# MONTE CARLO     #
+###################
+
+def bootstrap_indices(n: int, n_paths: int, horizon: int, block: int = 1, seed: Optional[int] = None) -> np.ndarray:
+    """(n_paths, horizon) indices into a sample of n trades, drawn in blocks of consecutive trades"""
+    rng = np.random.default_rng(seed)
+    block = max(1, min(block, n))
+    n_blocks = -(-horizon // block)
+    starts = rng.integers(0, n - block + 1, size=(n_paths, n_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :horizon]
+
+
+def monte_carlo(pnl, capital: float = STARTING_CAPITAL, n_paths: int = 20000, horizon: Optional[int] = None,
+                block: int = 1, ruin_fraction: float = 0.5, seed: Optional[int] = None) -> dict:
+    """Resampled equity paths of $ P&L per trade
+
+    Returns the (n_paths, horizon) equity array with terminal equity and max drawdown
+    percentiles, and the risk of ruin: the share of paths that touch
+    ruin_fraction * capital at any point.
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    horizon = horizon or len(pnl)
+    paths = capital + np.cumsum(pnl[bootstrap_indices(len(pnl), n_paths, horizon, block, seed)], axis=1)
+    peaks = np.maximum(np.maximum.accumulate(paths, axis=1), capital)
+    max_drawdown = ((paths - peaks) / peaks).min(axis=1)
+    quantiles = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+    return {
+        "paths": paths,
+        "terminal": dict(zip(quantiles, np.quantile(paths[:, -1], quantiles))),
+        "max_drawdown_pct": dict(zip(quantiles, np.quantile(max_drawdown, quantiles) * 100)),
+        "prob_loss": float((paths[:, -1] < capital).mean()),
+        "risk_of_ruin": float((paths.min(axis=1) <= ruin_fraction * capital).mean()),
+    }
+
+
+def position_sizing(trades: pd.DataFrame, fractions, width: float = SPREAD_WIDTH, capital: float = STARTING_CAPITAL, n_paths: int = 20000,
+                    horizon: Optional[int] = None, block: int = 1, ruin_fraction: float = 0.5, seed: Optional[int] = None) -> pd.DataFrame:
+    """Fixed fractional sizing: each trade risks fraction of the current equity on its max loss
+
+    A trade's return on risk is gross_pnl / (width - cost), so equity compounds by
+    (1 + fraction * return on risk). All fractions use the same resampled paths.
+    """
+    max_loss = width - trades["cost"].to_numpy(dtype=np.float64)
+    on_risk = np.maximum(trades["gross_pnl"].to_numpy(dtype=np.float64), -max_loss) / max_loss
+    horizon = horizon or len(on_risk)
+    sampled = on_risk[bootstrap_indices(len(on_risk), n_paths, horizon, block, seed)]
+    rows = []
+    for fraction in fractions:
+        growth = np.log1p(np.maximum(fraction * sampled, -1 + 1e-12))
+        log_equity = np.cumsum(growth, axis=1)
+        terminal = capital * np.exp(log_equity[:, -1])
+        rows.append({
+            "fraction": fraction,
+            "median_terminal": float(np.median(terminal)),
+            "p05_terminal": float(np.quantile(terminal, 0.05)),
+            "growth_per_trade": float(growth.mean()),
+            "prob_loss": float((terminal < capital).mean()),
+            "risk_of_ruin": float((log_equity.min(axis=1) <= np.log(ruin_fraction)).mean()),
+        })
+    return pd.DataFrame(rows).set_index("fraction")
@@ -0,0 +1,235 @@
+"""Memory-mapped columnar store for minute bars
+
+Each ticker is kept under <root>/bars/<ticker>/ as one raw file per column:
+t.i8 (int64 epoch ns) and v, vw, o, c, h, l, n as float64, plus an index.npz with
+(day, offset, length) per New York trading date. Files are opened with numpy.memmap,
+so a session is a zero-copy slice and whole-history features (realized vol, entry
+prices, session closes) are computed on the arrays without building DataFrames.
+
+Like AggregatesCache only finalised dates are stored and a _coverage.json records
+the ranges already ingested, empty days included. Column files are append-only;
+a day is visible once the index has been rewritten, so an interrupted write only
+leaves unreferenced rows at the end of the files. Writes are meant to come from a
+single process (sync() before a parallel run), readers can be many.
+"""
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from utils.cache import (to_date, ny_dates, last_final_date, merge_intervals, subtract_intervals,
+                         split_segment, empty_aggregates, MAX_GAP_DAYS)
+
+# same column order as a /v2/aggs frame
+PRICE_COLUMNS = ("v", "vw", "o", "c", "h", "l", "n")
+NS_PER_MS = 1_000_000
+NS_PER_MINUTE = 60 * 1_000_000_000
+ANNUALIZATION = np.sqrt(252)
+
+
+def _memmap(path: str, dtype) -> np.ndarray:
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size < np.dtype(dtype).itemsize:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def _rows(offsets: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Row numbers of the given (offset, length) runs, concatenated"""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.repeat(offsets - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+
+def _minutes(time: str) -> int:
+    time = pd.Timestamp(time)
+    return time.hour * 60 + time.minute
+
+
+class BarSeries:
+    """Read-only view of one ticker: sorted day index over memory-mapped columns"""
+    def __init__(self, days: np.ndarray, offsets: np.ndarray, lengths: np.ndarray, t: np.ndarray, columns: dict):
+        self.days = days
+        self.offsets = offsets
+        self.lengths = lengths
+        self.t = t
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def dates(self) -> pd.Index:
+        return pd.Index(self.days.astype(str), name="date")
+
+    def day_slice(self, date) -> slice:
+        day = np.datetime64(to_date(date), "D")
+        i = int(np.searchsorted(self.days, day))
+        if i == len(self.days) or self.days[i] != day:
+            return slice(0, 0)
+        return slice(int(self.offsets[i]), int(self.offsets[i] + self.lengths[i]))
+
+    def session(self, date) -> dict:
+        """Zero-copy column views of one session, "t" in epoch ns"""
+        rows = self.day_slice(date)
+        return {"t": self.t[rows], **{c: values[rows] for c, values in self.columns.items()}}
+
+    def frame(self, start_date, end_date) -> pd.DataFrame:
+        """Bars of [start_date, end_date] shaped like PolygonClient.get_ticker_data (index t in ms)"""
+        lo = np.searchsorted(self.days, np.datetime64(to_date(start_date), "D"), side="left")
+        hi = np.searchsorted(self.days, np.datetime64(to_date(end_date), "D"), side="right")
+        rows = _rows(self.offsets[lo:hi], self.lengths[lo:hi])
+        if not len(rows):
+            return empty_aggregates()
+        return pd.DataFrame({c: values[rows] for c, values in self.columns.items()},
+                            index=pd.Index(self.t[rows] // NS_PER_MS, name="t"))
+
+    ##########################
+    # WHOLE-HISTORY FEATURES #
+    ##########################
+
+    def _from(self, time: str) -> tuple:
+        """(rows, day positions) of the bars at or after a New York time, in day then time order"""
+        rows = _rows(self.offsets, self.lengths)
+        day_ids = np.repeat(np.arange(len(self.days)), self.lengths)
+        # the UTC offset is resolved once per day instead of converting every timestamp
+        local = pd.DatetimeIndex(self.days.astype("datetime64[ns]")).tz_localize("America/New_York")
+        utc_offset = ((local.tz_localize(None) - local.tz_convert("UTC").tz_localize(None)) // pd.Timedelta(minutes=1)).to_numpy(dtype=np.int64)
+        minute_of_day = (self.t[rows] // NS_PER_MINUTE + utc_offset[day_ids]) % (24 * 60)
+        keep = minute_of_day >= _minutes(time)
+        return rows[keep], day_ids[keep]
+
+    def first_at_or_after(self, time: str, column: str = "c") -> pd.Series:
+        """Per day value of the first bar at or after the New York time (e.g. the 9:35 price)"""
+        rows, day_ids = self._from(time)
+        first = np.flatnonzero(np.r_[True, day_ids[1:] != day_ids[:-1]]) if len(day_ids) else np.empty(0, dtype=np.int64)
+        values = np.full(len(self.days), np.nan)
+        values[day_ids[first]] = self.columns[column][rows[first]]
+        return pd.Series(values, index=self.dates(), name=column)
+
+    def last(self, column: str = "c") -> pd.Series:
+        """Per day value of the last bar of the session"""
+        values = np.full(len(self.days), np.nan)
+        has_bars = self.lengths > 0
+        values[has_bars] = self.columns[column][self.offsets[has_bars] + self.lengths[has_bars] - 1]
+        return pd.Series(values, index=self.dates(), name=column)
+
+    def realized_vol(self, start_time: str = "09:35") -> pd.Series:
+        """Per day annualized realized vol (in vol points) of the closes from start_time on,
+        the same quantity as utils.features.session_features"""
+        rows, day_ids = self._from(start_time)
+        squared = np.diff(np.log(self.columns["c"][rows])) ** 2
+        squared[day_ids[1:] != day_ids[:-1]] = 0.0
+        total = np.bincount(day_ids[1:], weights=squared, minlength=len(self.days))
+        values = np.sqrt(total) * 100 * ANNUALIZATION
+        values[np.bincount(day_ids, minlength=len(self.days)) == 0] = np.nan
+        return pd.Series(values, index=self.dates(), name="realized_vol")
+
+
+class MinuteBarStore:
+    """Columnar memmap store of 1 minute bars, keyed by ticker"""
+    def __init__(self, root: str = ".cache/polygon"):
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series_dir(self, ticker: str) -> str:
+        safe_ticker = ticker.replace(":", "_").replace("/", "_")
+        return os.path.join(self.root, "bars", safe_ticker)
+
+    def _index_path(self, ticker: str) -> str:
+        return os.path.join(self.series_dir(ticker), "index.npz")
+
+    def _coverage_path(self, ticker: str) -> str:
+        return os.path.join(self.series_dir(ticker), "_coverage.json")
+
+    def coverage(self, ticker: str) -> list:
+        path = self._coverage_path(ticker)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return merge_intervals([[to_date(s), to_date(e)] for s, e in json.load(f)])
+
+    def missing(self, ticker: str, start_date, end_date) -> list:
+        """Date segments of the requested range that are not stored yet"""
+        return subtract_intervals(to_date(start_date), to_date(end_date), self.coverage(ticker))
+
+    def open(self, ticker: str) -> BarSeries:
+        """Memory-mapped series of a ticker, reopened when another writer updated the index"""
+        path = self._index_path(ticker)
+        version = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        with self._lock:
+            cached = self._series.get(ticker)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        series_dir = self.series_dir(ticker)
+        if version is None:
+            series = BarSeries(np.empty(0, dtype="datetime64[D]"), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                               np.empty(0, dtype=np.int64), {c: np.empty(0) for c in PRICE_COLUMNS})
+        else:
+            with np.load(path) as index:
+                days, offsets, lengths = index["days"], index["offsets"], index["lengths"]
+            series = BarSeries(days, offsets, lengths, _memmap(os.path.join(series_dir, "t.i8"), np.int64),
+                               {c: _memmap(os.path.join(series_dir, f"{c}.f8"), np.float64) for c in PRICE_COLUMNS})
+        with self._lock:
+            self._series[ticker] = (version, series)
+        return series
+
+    def read(self, ticker: str, start_date, end_date) -> pd.DataFrame:
+        return self.open(ticker).frame(start_date, end_date)
+
+    def write(self, ticker: str, df: pd.DataFrame, start_date, end_date):
+        """Append the bars fetched for [start_date, end_date] (index t in ms) and mark the finalised part as covered"""
+        start, end = to_date(start_date), min(to_date(end_date), last_final_date())
+        if start > end:
+            return
+        series_dir = self.series_dir(ticker)
+        with self._lock:
+            self._series.pop(ticker, None)
+        series = self.open(ticker)
+
+        with self._lock:
+            os.makedirs(series_dir, exist_ok=True)
+            if len(df):
+                df = df.sort_index()
+                dates = np.array(ny_dates(df.index), dtype="datetime64[D]")
+                # finalised days never change, days already stored are kept as they are
+                new = (dates >= np.datetime64(start)) & (dates <= np.datetime64(end)) & ~np.isin(dates, series.days)
+                df, dates = df[new], dates[new]
+
+            if len(df):
+                t_path = os.path.join(series_dir, "t.i8")
+                first_row = (os.path.getsize(t_path) if os.path.exists(t_path) else 0) // 8
+                with open(t_path, "ab") as f:
+                    f.write(df.index.to_numpy(dtype=np.int64) * NS_PER_MS)
+                for c in PRICE_COLUMNS:
+                    values = df[c].to_numpy(dtype=np.float64) if c in df.columns else np.full(len(df), np.nan)
+                    with open(os.path.join(series_dir, f"{c}.f8"), "ab") as f:
+                        f.write(np.ascontiguousarray(values).tobytes())
+
+                new_days, day_starts, day_lengths = np.unique(dates, return_index=True, return_counts=True)
+                days = np.concatenate([series.days, new_days])
+                offsets = np.concatenate([series.offsets, first_row + day_starts.astype(np.int64)])
+                lengths = np.concatenate([series.lengths, day_lengths.astype(np.int64)])
+                order = np.argsort(days, kind="stable")
+                tmp_path = f"{self._index_path(ticker)}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+                np.savez(tmp_path, days=days[order], offsets=offsets[order], lengths=lengths[order])
+                os.replace(tmp_path, self._index_path(ticker))
+
+            intervals = self.coverage(ticker) + [[start, end]]
+            payload = [[s.isoformat(), e.isoformat()] for s, e in merge_intervals(intervals)]
+            tmp_path = f"{self._coverage_path(ticker)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self._coverage_path(ticker))
+            self._series.pop(ticker, None)
+
+    def sync(self, client, ticker: str, start_date, end_date) -> BarSeries:
+        """Ingest the missing finalised days of the range through client.get_ticker_data"""
+        end = min(to_date(end_date), last_final_date())
+        for gap_start, gap_end in self.missing(ticker, start_date, end) if to_date(start_date) <= end else []:
+            for seg_start, seg_end in split_segment(gap_start, gap_end, MAX_GAP_DAYS["minute"]):
+                df = client.get_ticker_data(ticker, seg_start.isoformat(), seg_end.isoformat(), "minute")
+                self.write(ticker, df, seg_start, seg_end)
+        return self.open(ticker)
@@ -0,0 +1,150 @@
+"""Vectorized Black-Scholes prices, implied vols and greeks
+
+Every function broadcasts its inputs, so a whole (day x strike x minute) cube of
+closes is priced or inverted in one call:
+
+    T = year_fraction(minutes, expiry_close(dates))           # intraday, 0DTE friendly
+    iv = implied_vol(closes, spot[..., None], strikes[None, :, None], T, is_call = False)
+    g = greeks(spot, strikes, T, iv, is_call = False)
+
+Conventions follow IB's model greeks: vega per vol point (1%), theta per calendar
+day. Time is measured in seconds to the 16:00 New York close over a 365 day year
+and floored at MIN_T, so the last minutes of a 0DTE session stay finite.
+
+The normal CDF comes from scipy.special.ndtr when scipy is installed, otherwise from
+an erfc approximation accurate to ~1e-7, far below a price tick.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.special import ndtr
+except ImportError:
+    ndtr = None
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+MIN_T = 60 / SECONDS_PER_YEAR  # one minute
+MIN_VOL, MAX_VOL = 1e-4, 5.0
+_SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def _erfc(x: np.ndarray) -> np.ndarray:
+    """Complementary error function (Numerical Recipes erfcc, |error| < 1.2e-7)"""
+    z = np.abs(x)
+    t = 1 / (1 + 0.5 * z)
+    poly = -z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (0.27886807
+           + t * (-1.13520398 + t * (1.48851587 + t * (-0.82215223 + t * 0.17087277))))))))
+    r = t * np.exp(poly)
+    return np.where(x >= 0, r, 2 - r)
+
+
+def norm_cdf(x) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    if ndtr is not None:
+        return ndtr(x)
+    return 0.5 * _erfc(-x / np.sqrt(2))
+
+
+def norm_pdf(x) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    return np.exp(-0.5 * x * x) / _SQRT_2PI
+
+
+def expiry_close(dates, close: str = "16:00") -> np.ndarray:
+    """Epoch ms of the New York close of each expiration date"""
+    dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates)))
+    dates = dates.tz_localize("America/New_York") if dates.tz is None else dates.tz_convert("America/New_York")
+    closes = dates.normalize() + pd.Timedelta(f"{close}:00")
+    return np.asarray((closes - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(milliseconds=1), dtype=np.int64)
+
+
+def year_fraction(times_ms, expiry_ms) -> np.ndarray:
+    """Years from epoch ms times to epoch ms expiries, floored at MIN_T"""
+    seconds = (np.asarray(expiry_ms, dtype=np.float64) - np.asarray(times_ms, dtype=np.float64)) / 1000
+    return np.maximum(seconds / SECONDS_PER_YEAR, MIN_T)
+
+
+def _d1_d2(S, K, T, sigma, r, q) -> tuple:
+    vol_sqrt_t = sigma * np.sqrt(T)
+    d1 = (np.log(S / K) + (r - q + 0.5 * sigma * sigma) * T) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
+
+
+def price(S, K, T, sigma, r=0.0, q=0.0, is_call=True) -> np.ndarray:
+    S, K, T, sigma, r, q = (np.asarray(a, dtype=np.float64) for a in (S, K, T, sigma, r, q))
+    d1, d2 = _d1_d2(S, K, T, sigma, r, q)
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    call = S * df_q * norm_cdf(d1) - K * df_r * norm_cdf(d2)
+    put = K * df_r * norm_cdf(-d2) - S * df_q * norm_cdf(-d1)
+    return np.where(is_call, call, put)
+
+
+def vega(S, K, T, sigma, r=0.0, q=0.0) -> np.ndarray:
+    """dPrice/dsigma per unit vol (not per vol point), the Newton step denominator"""
+    S, K, T, sigma, r, q = (np.asarray(a, dtype=np.float64) for a in (S, K, T, sigma, r, q))
+    d1, _ = _d1_d2(S, K, T, sigma, r, q)
+    return S * np.exp(-q * T) * norm_pdf(d1) * np.sqrt(T)
+
+
+def greeks(S, K, T, sigma, r=0.0, q=0.0, is_call=True) -> dict:
+    """delta, gamma, vega (per vol point) and theta (per calendar day) of the broadcast inputs"""
+    S, K, T, sigma, r, q = (np.asarray(a, dtype=np.float64) for a in (S, K, T, sigma, r, q))
+    d1, d2 = _d1_d2(S, K, T, sigma, r, q)
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(T)
+    call_delta = df_q * norm_cdf(d1)
+    decay = -S * df_q * pdf * sigma / (2 * sqrt_t)
+    call_theta = decay - r * K * df_r * norm_cdf(d2) + q * S * df_q * norm_cdf(d1)
+    put_theta = decay + r * K * df_r * norm_cdf(-d2) - q * S * df_q * norm_cdf(-d1)
+    return {
+        "delta": np.where(is_call, call_delta, call_delta - df_q),
+        "gamma": df_q * pdf / (S * sigma * sqrt_t),
+        "vega": S * df_q * pdf * sqrt_t / 100,
+        "theta": np.where(is_call, call_theta, put_theta) / 365,
+    }
+
+
+def implied_vol(option_price, S, K, T, r=0.0, q=0.0, is_call=True, tol: float = 1e-10, vol_tol: float = 1e-7, max_iter: int = 100) -> np.ndarray:
+    """Vol matching option_price, element-wise, NaN outside the no-arbitrage bounds or without time value
+
+    Newton steps are kept inside a bisection bracket [lo, hi] that shrinks every
+    iteration, so deep OTM / near expiry options with a vanishing vega still converge.
+    An element stops once its price is within tol or its bracket narrower than vol_tol.
+    """
+    arrays = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64) for a in (option_price, S, K, T, r, q)), np.asarray(is_call, dtype=bool))
+    shape = arrays[0].shape
+    option_price, S, K, T, r, q, is_call = (a.ravel() for a in arrays)
+    df_r, df_q = np.exp(-r * T), np.exp(-q * T)
+    intrinsic = np.where(is_call, np.maximum(S * df_q - K * df_r, 0), np.maximum(K * df_r - S * df_q, 0))
+    upper = np.where(is_call, S * df_q, K * df_r)
+    with np.errstate(invalid="ignore"):
+        valid = np.isfinite(option_price) & (option_price - intrinsic > tol) & (option_price < upper) & (S > 0) & (K > 0)
+
+    lo, hi = np.full(len(S), MIN_VOL), np.full(len(S), MAX_VOL)
+    sigma = np.full(len(S), 0.2)
+    active = np.flatnonzero(valid)
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        args = S[active], K[active], T[active]
+        diff = price(*args, sigma[active], r[active], q[active], is_call[active]) - option_price[active]
+        # shrink the bracket around the root: price increases with vol
+        lo[active] = np.where(diff < 0, sigma[active], lo[active])
+        hi[active] = np.where(diff > 0, sigma[active], hi[active])
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            newton = sigma[active] - diff / vega(*args, sigma[active], r[active], q[active])
+        inside = np.isfinite(newton) & (newton > lo[active]) & (newton < hi[active])
+        converged = np.abs(diff) < tol
+        sigma[active] = np.where(converged, sigma[active], np.where(inside, newton, (lo[active] + hi[active]) / 2))
+        active = active[~converged & (hi[active] - lo[active] > vol_tol)]
+    return np.where(valid, sigma, np.nan).reshape(shape)
+
+
+def chain_greeks(closes, spot, strikes, times_ms, expiry_ms, is_call=True, r=0.0, q=0.0) -> dict:
+    """iv and greeks of option closes in one call, e.g. closes (day, strike, minute) with spot
+    (day, 1, minute), strikes (1, strike, 1), times_ms (day, 1, minute) and expiry_ms (day, 1, 1)"""
+    T = year_fraction(times_ms, expiry_ms)
+    iv = implied_vol(closes, spot, strikes, T, r, q, is_call)
+    with np.errstate(invalid="ignore"):
+        return {"iv": iv, **greeks(spot, strikes, T, iv, r, q, is_call)}
@@ -0,0 +1,219 @@
+"""Local on-disk cache for Polygon aggregates
+
+Bars are stored as Parquet partitions under
+<root>/aggs/<ticker>/<multiplier><timespan>/ with one file per trading date for
+intraday timespans and one file per year for daily (and coarser) timespans.
+A small _coverage.json per series records which date ranges have already been
+fetched, so empty days (weekends, holidays) are not requested twice. Coverage only
+extends to the last session the fetched bars reach: an empty or truncated response
+leaves its sessions uncovered, so they are fetched again by the next request.
+
+Only finalised dates (strictly before today in New York) are persisted, the
+current session is always refetched.
+"""
+import os
+import json
+import threading
+import datetime
+import functools
+import pandas as pd
+from typing import Callable, Optional
+from pandas_market_calendars import get_calendar
+
+INTRADAY_TIMESPANS = ("second", "minute", "hour")
+# largest range requested in one call so a gap never overflows the 50000 row limit
+MAX_GAP_DAYS = {"second": 1, "minute": 30, "hour": 365}
+
+
+class cacheMissException(Exception):
+    pass
+
+
+def to_date(value) -> datetime.date:
+    return pd.Timestamp(value).date()
+
+
+def ny_dates(index) -> pd.Index:
+    """Polygon ms timestamps -> New York calendar dates"""
+    return pd.Index(pd.to_datetime(index, unit="ms", utc=True).tz_convert("America/New_York").date)
+
+
+def last_final_date() -> datetime.date:
+    """Most recent date whose bars can no longer change"""
+    return pd.Timestamp.now(tz="America/New_York").date() - datetime.timedelta(days=1)
+
+
+def merge_intervals(intervals: list) -> list:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def subtract_intervals(start: datetime.date, end: datetime.date, covered: list) -> list:
+    """Segments of [start, end] not contained in the covered intervals"""
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start - datetime.timedelta(days=1)))
+        cursor = max(cursor, c_end + datetime.timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+@functools.lru_cache(maxsize=None)
+def _calendar(exchange: str):
+    return get_calendar(exchange)
+
+
+def sessions_between(start: datetime.date, end: datetime.date, exchange: str = "NYSE") -> list:
+    return [d.date() for d in _calendar(exchange).valid_days(start, end)]
+
+
+def covered_span(start: datetime.date, end: datetime.date, bar_dates, exchange: str = "NYSE") -> Optional[tuple]:
+    """Part of a fetched [start, end] that can be marked as cached, None if nothing can
+
+    That is up to the last date with bars and the non-sessions after it: sessions past
+    the last bar may be missing from an empty, throttled or truncated response.
+    """
+    bar_dates = [d for d in bar_dates if start <= d <= end]
+    last = max(bar_dates) if bar_dates else start - datetime.timedelta(days=1)
+    later_sessions = sessions_between(last + datetime.timedelta(days=1), end, exchange) if last < end else []
+    stop = later_sessions[0] - datetime.timedelta(days=1) if later_sessions else end
+    return (start, stop) if stop >= start else None
+
+
+def split_segment(start: datetime.date, end: datetime.date, max_days: Optional[int]) -> list:
+    if max_days is None:
+        return [(start, end)]
+    segments = []
+    while start <= end:
+        stop = min(end, start + datetime.timedelta(days=max_days - 1))
+        segments.append((start, stop))
+        start = stop + datetime.timedelta(days=1)
+    return segments
+
+
+class AggregatesCache:
+    """Partitioned Parquet cache for /v2/aggs bars
+
+    offline=True turns every cache miss into a cacheMissException instead of a network call.
+    """
+    def __init__(self, root: str = ".cache/polygon", offline: bool = False):
+        self.root = root
+        self.offline = offline
+        self._lock = threading.Lock()
+
+    def series_dir(self, ticker: str, multiplier: int, timespan: str) -> str:
+        safe_ticker = ticker.replace(":", "_").replace("/", "_")
+        return os.path.join(self.root, "aggs", safe_ticker, f"{multiplier}{timespan}")
+
+    @staticmethod
+    def partition_key(date: datetime.date, timespan: str) -> str:
+        return date.isoformat() if timespan in INTRADAY_TIMESPANS else str(date.year)
+
+    def _coverage_path(self, series_dir: str) -> str:
+        return os.path.join(series_dir, "_coverage.json")
+
+    def coverage(self, ticker: str, multiplier: int, timespan: str) -> list:
+        path = self._coverage_path(self.series_dir(ticker, multiplier, timespan))
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return merge_intervals([[to_date(s), to_date(e)] for s, e in json.load(f)])
+
+    def missing(self, ticker: str, start_date, end_date, timespan: str = "day", multiplier: int = 1) -> list:
+        """Date segments of the requested range that are not cached yet"""
+        return subtract_intervals(to_date(start_date), to_date(end_date), self.coverage(ticker, multiplier, timespan))
+
+    def read(self, ticker: str, start_date, end_date, timespan: str = "day", multiplier: int = 1) -> pd.DataFrame:
+        start, end = to_date(start_date), to_date(end_date)
+        series_dir = self.series_dir(ticker, multiplier, timespan)
+        first, last = self.partition_key(start, timespan), self.partition_key(end, timespan)
+        frames = []
+        if os.path.isdir(series_dir):
+            for name in sorted(os.listdir(series_dir)):
+                if name.endswith(".parquet") and first <= name[:-len(".parquet")] <= last:
+                    frames.append(pd.read_parquet(os.path.join(series_dir, name)))
+        if not frames:
+            return empty_aggregates()
+        df = pd.concat(frames).sort_index()
+        dates = ny_dates(df.index)
+        return df[(dates >= start) & (dates <= end)]
+
+    def write(self, ticker: str, df: pd.DataFrame, start_date, end_date, timespan: str = "day", multiplier: int = 1):
+        """Persist the bars fetched for [start_date, end_date] and mark the finalised part they cover (covered_span)"""
+        start, end = to_date(start_date), min(to_date(end_date), last_final_date())
+        if start > end:
+            return
+        series_dir = self.series_dir(ticker, multiplier, timespan)
+        if timespan in INTRADAY_TIMESPANS or timespan == "day":
+            span = covered_span(start, end, set(ny_dates(df.index)) if len(df) else [])
+        else:
+            # weekly and coarser bars are dated at the start of their period
+            span = (start, end) if len(df) else None
+        with self._lock:
+            os.makedirs(series_dir, exist_ok=True)
+            if len(df):
+                dates = ny_dates(df.index)
+                df = df[(dates >= start) & (dates <= end)]
+                keys = pd.Index([self.partition_key(d, timespan) for d in ny_dates(df.index)])
+                for key, part in df.groupby(keys.values):
+                    path = os.path.join(series_dir, f"{key}.parquet")
+                    if os.path.exists(path):
+                        part = pd.concat([pd.read_parquet(path), part])
+                        part = part[~part.index.duplicated(keep="last")]
+                    atomic_write_parquet(part.sort_index(), path)
+
+            if span is None:
+                return
+            # re-read so concurrent writers only ever add coverage
+            intervals = self.coverage(ticker, multiplier, timespan) + [list(span)]
+            payload = [[s.isoformat(), e.isoformat()] for s, e in merge_intervals(intervals)]
+            tmp_path = f"{self._coverage_path(series_dir)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self._coverage_path(series_dir))
+
+    def get(self, ticker: str, start_date, end_date, fetch: Callable, timespan: str = "day", multiplier: int = 1) -> pd.DataFrame:
+        """Return bars for the range, calling fetch(start, end) only for the missing segments"""
+        gaps = self.missing(ticker, start_date, end_date, timespan, multiplier)
+        if gaps and self.offline:
+            raise cacheMissException(f"{ticker} {multiplier}{timespan} not cached for {gaps}")
+
+        final = last_final_date()
+        live_frames = []
+        for gap_start, gap_end in gaps:
+            for seg_start, seg_end in split_segment(gap_start, gap_end, MAX_GAP_DAYS.get(timespan)):
+                df = fetch(seg_start.isoformat(), seg_end.isoformat())
+                self.write(ticker, df, seg_start, seg_end, timespan, multiplier)
+                if seg_end > final and len(df):
+                    live_frames.append(df[ny_dates(df.index) > final])
+
+        df = self.read(ticker, start_date, end_date, timespan, multiplier)
+        if live_frames:
+            df = pd.concat([df] + live_frames).sort_index()
+        return df
+
+
+def empty_aggregates() -> pd.DataFrame:
+    df = pd.DataFrame()
+    df.index.name = "t"
+    return df
+
+
+def atomic_write_parquet(df: pd.DataFrame, path: str):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
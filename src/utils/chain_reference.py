@@ -0,0 +1,112 @@
+"""Option contract reference with a local strike index
+
+Each (underlying, as_of, expiration, right) chain is fetched once, following
+Polygon's pagination, filtered to the trading class (SPXW), sorted by strike and
+kept in memory. Chains of finalised dates are also written to
+<root>/chains/... as small .npz files, so later runs never download them again.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Optional
+from utils.cache import last_final_date, to_date
+from utils.polygon import PolygonClient
+
+
+class StrikeIndex:
+    """Strike sorted contracts of a single chain, answering strike lookups by binary search"""
+    def __init__(self, strikes, tickers):
+        strikes = np.asarray(strikes, dtype=np.float64)
+        order = np.argsort(strikes, kind="stable")
+        self.strikes = strikes[order]
+        self.tickers = np.asarray(tickers, dtype=str)[order]
+
+    @classmethod
+    def from_contracts(cls, contracts: pd.DataFrame, trading_class: str = "SPXW") -> "StrikeIndex":
+        if contracts.empty:
+            return cls([], [])
+        contracts = contracts[contracts["ticker"].str.contains(trading_class)]
+        return cls(contracts["strike_price"].to_numpy(), contracts["ticker"].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.strikes)
+
+    def first_at_or_above(self, price: float, n: int = 0) -> tuple:
+        """(strike, ticker) of the n-th strike >= price, n = 0 is the closest"""
+        i = int(np.searchsorted(self.strikes, price, side="left")) + n
+        if i >= len(self.strikes):
+            raise IndexError(f"no strike {n} steps at or above {price}")
+        return self.strikes[i], self.tickers[i]
+
+    def nth_at_or_below(self, price: float, n: int = 0) -> tuple:
+        """(strike, ticker) of the n-th strike <= price, n = 0 is the closest"""
+        i = int(np.searchsorted(self.strikes, price, side="right")) - 1 - n
+        if i < 0:
+            raise IndexError(f"no strike {n} steps at or below {price}")
+        return self.strikes[i], self.tickers[i]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, strikes=self.strikes, tickers=self.tickers)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "StrikeIndex":
+        with np.load(path) as data:
+            return cls(data["strikes"], data["tickers"])
+
+
+class ChainReference:
+    """Fetch-once store of option chains keyed by (underlying, as_of, expiration, right)
+
+    right is Polygon's contract_type, "call" or "put".
+    """
+    def __init__(self, client: PolygonClient, root: Optional[str] = ".cache/polygon", trading_class: str = "SPXW"):
+        self.client = client
+        self.root = root
+        self.trading_class = trading_class
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def _path(self, underlying: str, as_of: str, expiration: str, right: str) -> str:
+        return os.path.join(self.root, "chains", underlying, self.trading_class, expiration, f"{as_of}_{right}.npz")
+
+    def _persistable(self, as_of: str) -> bool:
+        # today's chain can still gain strikes, keep it in memory only
+        return self.root is not None and to_date(as_of) <= last_final_date()
+
+    def _lookup(self, key: tuple) -> Optional[StrikeIndex]:
+        with self._lock:
+            if key in self._chains:
+                return self._chains[key]
+        if self._persistable(key[1]) and os.path.exists(self._path(*key)):
+            index = StrikeIndex.load(self._path(*key))
+            with self._lock:
+                self._chains[key] = index
+            return index
+        return None
+
+    def _store(self, key: tuple, contracts: pd.DataFrame) -> StrikeIndex:
+        index = StrikeIndex.from_contracts(contracts, self.trading_class)
+        if self._persistable(key[1]):
+            index.save(self._path(*key))
+        with self._lock:
+            self._chains[key] = index
+        return index
+
+    def get(self, underlying: str, as_of: str, expiration: str, right: str) -> StrikeIndex:
+        key = (underlying, as_of, expiration, right)
+        index = self._lookup(key)
+        if index is None:
+            index = self._store(key, self.client.get_historical_option_contracts(underlying, as_of, expiration, right))
+        return index
+
+    async def aget(self, aclient, underlying: str, as_of: str, expiration: str, right: str) -> StrikeIndex:
+        """get() for an AsyncPolygonClient"""
+        key = (underlying, as_of, expiration, right)
+        index = self._lookup(key)
+        if index is None:
+            index = self._store(key, await aclient.get_historical_option_contracts(underlying, as_of, expiration, right))
+        return index
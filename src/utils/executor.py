@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+
+def run_parallel(func, args_list: list, max_workers: int = 8, executor: str = "thread", desc: str = "") -> list:
+    """Run func(*args) for every args tuple on a thread or process pool
+
+    Results come back in input order. A failing call is printed (with its first
+    argument, usually the date) and returns None, like the old sequential loop
+    that printed and skipped the day. Use "process" only with module level
+    functions and picklable arguments.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {list(EXECUTORS)}")
+    results = [None] * len(args_list)
+    if not args_list:
+        return results
+    start_time = datetime.now()
+    with EXECUTORS[executor](max_workers=max_workers) as pool:
+        futures = {pool.submit(func, *args): i for i, args in enumerate(args_list)}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as error:
+                print(f"{args_list[i][0]}: {error}")
+            elapsed = (datetime.now() - start_time).total_seconds()
+            time_remaining = timedelta(seconds=int(elapsed / completed * (len(args_list) - completed)))
+            print(f"{desc}{round(completed / len(args_list) * 100, 2)}% complete, {time_remaining} left, ETA: {datetime.now() + time_remaining}")
+    return results
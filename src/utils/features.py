@@ -0,0 +1,118 @@
+"""Daily RVRP (realized vol risk premium) features
+
+rvrp = vix1d at 9:35 - realized vol of the session
+expected_move_rvrp = scalar * (vix1d at 9:35 - trailing mean of rvrp up to yesterday) / (100 * sqrt(252))
+
+RVRPFeatureStore keeps one row per trading date in preallocated arrays and
+updates the trailing mean with a running window sum, so appending a day is
+O(1) instead of a full-frame rolling recompute. A day whose features could not
+be computed is appended as NaN and, like pandas rolling(window).mean(), leaves
+the mean undefined until it drops out of the window.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+ANNUALIZATION = np.sqrt(252)
+
+
+def session_features(underlying_data: pd.DataFrame, index_data: pd.DataFrame) -> dict:
+    """RVRP inputs from one session of SPX and VIX1D minute bars, both starting at the entry bar"""
+    c_log_diff = np.diff(np.log(underlying_data["c"].to_numpy()))
+    vix1d_935 = index_data["c"].iloc[0]
+    return {
+        "realized_vol": np.sqrt((c_log_diff ** 2).sum()) * 100 * ANNUALIZATION,
+        "vix1d_935": vix1d_935,
+        "actual_move": np.abs((index_data["c"].iloc[-1] - vix1d_935) / vix1d_935),
+    }
+
+
+class RVRPFeatureStore:
+    COLUMNS = ("realized_vol", "vix1d_935", "actual_move", "expected_move_original", "rvrp", "rvrp_ma")
+
+    def __init__(self, window: int = 21, capacity: int = 512):
+        self.window = window
+        self.n = 0
+        self.dates = np.empty(capacity, dtype="datetime64[D]")
+        self.columns = {c: np.full(capacity, np.nan) for c in self.COLUMNS}
+        self._window_sum = 0.0
+        self._window_nans = 0
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.dates[self.n - 1]).date() if self.n else None
+
+    def _grow(self):
+        capacity = len(self.dates) * 2
+        self.dates = np.resize(self.dates, capacity)
+        for c, values in self.columns.items():
+            grown = np.full(capacity, np.nan)
+            grown[:self.n] = values[:self.n]
+            self.columns[c] = grown
+
+    def append(self, date, realized_vol: float = np.nan, vix1d_935: float = np.nan, actual_move: float = np.nan, expected_move_original: float = np.nan) -> int:
+        """Add the next trading date (NaN inputs for a day without data), returns its row"""
+        date = np.datetime64(pd.Timestamp(date).date(), "D")
+        if self.n and date <= self.dates[self.n - 1]:
+            raise ValueError(f"{date} is not after the last stored date {self.dates[self.n - 1]}")
+        if self.n == len(self.dates):
+            self._grow()
+
+        i = self.n
+        rvrp = vix1d_935 - realized_vol
+        self.dates[i] = date
+        for c, value in (("realized_vol", realized_vol), ("vix1d_935", vix1d_935), ("actual_move", actual_move),
+                         ("expected_move_original", expected_move_original), ("rvrp", rvrp)):
+            self.columns[c][i] = value
+
+        # running window of the last `window` rvrp values
+        if np.isnan(rvrp):
+            self._window_nans += 1
+        else:
+            self._window_sum += rvrp
+        if i >= self.window:
+            dropped = self.columns["rvrp"][i - self.window]
+            if np.isnan(dropped):
+                self._window_nans -= 1
+            else:
+                self._window_sum -= dropped
+        if i + 1 >= self.window and self._window_nans == 0:
+            self.columns["rvrp_ma"][i] = self._window_sum / self.window
+
+        self.n += 1
+        return i
+
+    def rvrp_ma(self) -> float:
+        """Trailing rvrp mean as of the last stored day, i.e. the shifted mean for the next session"""
+        return self.columns["rvrp_ma"][self.n - 1] if self.n else np.nan
+
+    def next_expected_move(self, vix1d_935: float, scalar: float) -> float:
+        """Expected move of the session following the last stored day"""
+        return scalar * (vix1d_935 - self.rvrp_ma()) / (100 * ANNUALIZATION)
+
+    def to_frame(self, scalar: float = None) -> pd.DataFrame:
+        df = pd.DataFrame({c: values[:self.n] for c, values in self.columns.items()},
+                          index = pd.Index(self.dates[:self.n].astype(str), name = "date"))
+        df["rvrp_ma_shifted"] = df["rvrp_ma"].shift(1)
+        if scalar is not None:
+            df["expected_move_rvrp"] = scalar * (df["vix1d_935"] - df["rvrp_ma_shifted"]) / (100 * ANNUALIZATION)
+        return df
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, window=self.window, dates=self.dates[:self.n],
+                 **{c: values[:self.n] for c, values in self.columns.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RVRPFeatureStore":
+        with np.load(path) as data:
+            store = cls(window=int(data["window"]), capacity=max(512, 2 * len(data["dates"])))
+            for i, date in enumerate(data["dates"]):
+                store.append(date, data["realized_vol"][i], data["vix1d_935"][i], data["actual_move"][i], data["expected_move_original"][i])
+        return store
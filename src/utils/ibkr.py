@@ -1,49 +1,109 @@
+import time
+import asyncio
 import pandas as pd
 from ib_async import *
+from dataclasses import dataclass
 from typing import Optional
 
 class noChainFoundException(Exception):
     pass
 
 
+def batched(items: list, size: int) -> list:
+    """items in consecutive chunks of at most size, e.g. to stay under the market data line limit"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def strikes_in_band(strikes, low: float, high: float, band: float) -> list:
+    """Sorted strikes of a reqSecDefOptParams chain within band points below low / above high"""
+    return sorted(k for k in strikes if low - band <= k <= high + band)
+
 def round_to(n, precision):
     correction = 0.5 if n >= 0 else -0.5
     return int( n/precision+correction ) * precision
 
-def convert_tickers_to_full_chain(tickers: list[Ticker], need_greeks: bool = True) -> pd.DataFrame:
-    full_chain = {}
-    for ticker in tickers:
-        if ticker.contract.localSymbol not in full_chain:
-            full_chain[ticker.contract.localSymbol] = {}
-            full_chain[ticker.contract.localSymbol]['strike'] = ticker.contract.strike
-            full_chain[ticker.contract.localSymbol]['right'] = ticker.contract.right
-            full_chain[ticker.contract.localSymbol]['expiration'] = ticker.contract.lastTradeDateOrContractMonth
-            full_chain[ticker.contract.localSymbol]['bid'] = ticker.bid
-            full_chain[ticker.contract.localSymbol]['ask'] = ticker.ask
-            full_chain[ticker.contract.localSymbol]['bid_size'] = ticker.bidSize
-            full_chain[ticker.contract.localSymbol]['ask_size'] = ticker.askSize
-            full_chain[ticker.contract.localSymbol]['volume'] = ticker.volume
-            # full_chain[ticker.contract.localSymbol]['put_OI'] = ticker.putOpenInterest
-            # full_chain[ticker.contract.localSymbol]['call_OI'] = ticker.callOpenInterest
-
-            # handle missing greeks
-            if ticker.modelGreeks is None:
-                if need_greeks:               
-                    raise noChainFoundException
-                else:
-                    continue
-            else:
-                full_chain[ticker.contract.localSymbol]['IV'] = ticker.modelGreeks.impliedVol
-                full_chain[ticker.contract.localSymbol]['delta'] = ticker.modelGreeks.delta
-                full_chain[ticker.contract.localSymbol]['gamma'] = ticker.modelGreeks.gamma
-                full_chain[ticker.contract.localSymbol]['vega'] = ticker.modelGreeks.vega
-                full_chain[ticker.contract.localSymbol]['theta'] = ticker.modelGreeks.theta
-                full_chain[ticker.contract.localSymbol]['undprice'] = ticker.modelGreeks.undPrice
-
-        else:
-            continue
-
-    return pd.DataFrame(full_chain).T.reset_index()
+def credit_spread_combo(short_leg: Contract, long_leg: Contract, exchange: str = "SMART") -> Contract:
+    """BAG of a vertical for a SELL order at a positive limit (the credit): sell short_leg, buy long_leg
+
+    Both legs must be qualified (conId set). Selling the combo sells each leg with
+    action BUY, so the legs carry the opposite actions.
+    """
+    return Contract(
+        secType = "BAG",
+        symbol = short_leg.symbol,
+        exchange = exchange,
+        currency = short_leg.currency,
+        comboLegs = [
+            ComboLeg(conId = short_leg.conId, ratio = 1, action = "BUY", exchange = exchange),
+            ComboLeg(conId = long_leg.conId, ratio = 1, action = "SELL", exchange = exchange),
+        ])
+
+def limit_prices(optimal_price: float, market_price: float, step: float = 0.05, max_steps: Optional[int] = None) -> list[float]:
+    """Credits to work a spread order at: from the mid, conceding step per attempt, down to the market price
+
+    The credit never goes below one tick, max_steps caps the attempts between the
+    mid and the final one at the market price.
+    """
+    floor = max(round_to(market_price, step), step)
+    price = round_to(optimal_price, step)
+    prices = []
+    while price > floor + 1e-9 and (max_steps is None or len(prices) < max_steps):
+        prices.append(round(price, 2))
+        price -= step
+    return prices + [round(floor, 2)]
+
+async def wait_for_fill(trade: Trade, timeout: float) -> bool:
+    """Wait on order status updates until the trade is filled (True), done unfilled or the timeout passes (False)"""
+    deadline = time.monotonic() + timeout
+    while not trade.isDone():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            await asyncio.wait_for(trade.statusEvent, remaining)
+        except asyncio.TimeoutError:
+            return False
+    return trade.orderStatus.status == "Filled"
+
+def ticker_ready(ticker: Ticker, need_greeks: bool = True) -> bool:
+    """A two-sided quote (and model greeks when needed) has arrived"""
+    has_quote = not util.isNan(ticker.bid) and not util.isNan(ticker.ask) and ticker.bid >= 0 and ticker.ask > 0
+    return has_quote and (not need_greeks or ticker.modelGreeks is not None)
+
+@dataclass
+class ChainReadiness:
+    ready: int
+    total: int
+    seconds: float
+    timed_out: bool
+
+    @property
+    def share(self) -> float:
+        return self.ready / self.total if self.total else 0.0
+
+async def wait_for_tickers(ib: IB, tickers: list[Ticker], timeout: float, threshold: float = 1.0, need_greeks: bool = True) -> ChainReadiness:
+    """Wait on ticker updates until a threshold share of the tickers is ready, or the deadline passes
+
+    Completes as soon as the share reaches threshold (every ticker with the default 1.0)
+    instead of sleeping a fixed time after the market data requests.
+    """
+    start = time.perf_counter()
+    done = asyncio.Event()
+    count = lambda: sum(ticker_ready(t, need_greeks) for t in tickers)
+
+    def on_pending(pending):
+        if count() >= threshold * len(tickers):
+            done.set()
+
+    ib.pendingTickersEvent += on_pending
+    try:
+        on_pending(None)
+        await asyncio.wait_for(done.wait(), timeout)
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        ib.pendingTickersEvent -= on_pending
+    return ChainReadiness(count(), len(tickers), time.perf_counter() - start, timed_out)
 
 def dist_from_ITM(contract: Contract, und_price: float) -> float:
     """if +ve, it will be ITM """
@@ -0,0 +1,181 @@
+"""Per-stage timing and opt-in profiling for the backtest
+
+    inst = Instrumentation("backtest_log.jsonl", profile_day="2024-03-12")
+    with inst.day(date), inst.profile(date):
+        with inst.span("chain_lookup"):
+            ...
+
+Every span is written as one JSON line (stage, seconds, day, thread) to the log and
+kept in memory for the end-of-run summary: count, total, mean, p50, p95 and max per
+stage, plus the per-endpoint latencies of a PolygonClient.
+
+profile_day turns on cProfile (or pyinstrument when installed and asked for) for the
+work done under profile(day) on that one day; the report is written next to the log.
+Spans recorded in worker processes (BACKTEST_EXECUTOR=process) reach the log file
+but not the in-memory summary of the parent.
+"""
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def percentiles(seconds: list) -> dict:
+    values = np.asarray(seconds, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "total_s": round(float(values.sum()), 3),
+        "mean_ms": round(float(values.mean()) * 1000, 2),
+        "p50_ms": round(float(np.percentile(values, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(values, 95)) * 1000, 2),
+        "max_ms": round(float(values.max()) * 1000, 2),
+    }
+
+
+class Instrumentation:
+    """Span timer with a JSON lines log, log_path=None keeps everything in memory"""
+    def __init__(self, log_path: Optional[str] = None, profile_day: Optional[str] = None, profiler: str = "cprofile"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"profiler must be one of {PROFILERS}")
+        if profiler == "pyinstrument" and pyinstrument is None:
+            print("pyinstrument is not installed, profiling with cProfile")
+            profiler = "cprofile"
+        self.log_path = log_path
+        self.profile_day = profile_day
+        self.profiler = profiler
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log = None
+        if log_path:
+            if os.path.dirname(log_path):
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self._log = open(log_path, "a", buffering=1)
+
+    def log(self, event: str, **fields):
+        if self._log is None:
+            return
+        line = json.dumps({"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"), "event": event, **fields}, default=str)
+        with self._lock:
+            self._log.write(line + "\n")
+
+    def record(self, stage: str, seconds: float, **fields):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+        self.log("span", stage=stage, seconds=round(seconds, 6), day=getattr(self._local, "day", None),
+                 thread=threading.current_thread().name, **fields)
+
+    @contextmanager
+    def day(self, date: str):
+        """Tag the spans of this thread with the trading day"""
+        previous = getattr(self._local, "day", None)
+        self._local.day = date
+        try:
+            yield
+        finally:
+            self._local.day = previous
+
+    @contextmanager
+    def span(self, stage: str, **fields):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            if error is not None:
+                fields["error"] = error
+            self.record(stage, time.perf_counter() - start, **fields)
+
+    def timed(self, stage: Optional[str] = None):
+        """Decorator form of span, the stage defaults to the function name"""
+        def decorator(func):
+            name = stage or func.__name__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def per_day(self, stage: str):
+        """Decorator for per-day steps whose first argument is the date: day tag, profile hook and span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(date, *args, **kwargs):
+                with self.day(date), self.profile(date), self.span(stage):
+                    return func(date, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def profile(self, date: str):
+        """Profile the enclosed work when date is the chosen profile_day"""
+        if self.profile_day is None or str(date) != str(self.profile_day):
+            yield
+            return
+        base = os.path.splitext(self.log_path or "backtest")[0] + f"_profile_{date}"
+        if self.profiler == "pyinstrument":
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(f"{base}.html", "w") as f:
+                    f.write(profiler.output_html())
+                report = profiler.output_text(unicode=False, color=False)
+                self.log("profile", day=date, profiler="pyinstrument", path=f"{base}.html", report=report)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(f"{base}.prof")
+                report = io.StringIO()
+                pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(25)
+                self.log("profile", day=date, profiler="cprofile", path=f"{base}.prof", report=report.getvalue())
+
+    def summary_frame(self) -> pd.DataFrame:
+        with self._lock:
+            samples = {stage: list(seconds) for stage, seconds in self.samples.items()}
+        frame = pd.DataFrame({stage: percentiles(seconds) for stage, seconds in samples.items()}).T
+        return frame.sort_values("total_s", ascending=False) if len(frame) else frame
+
+    def summary(self, client=None) -> pd.DataFrame:
+        """Log and return the per-stage table, with the client's per-endpoint latencies when given"""
+        stages = self.summary_frame()
+        for stage, row in stages.iterrows():
+            self.log("stage_summary", stage=stage, **row.to_dict())
+        if client is not None:
+            for endpoint, row in client.stats_frame().iterrows():
+                self.log("endpoint_summary", endpoint=endpoint, **row.to_dict())
+        return stages
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
@@ -0,0 +1,74 @@
+"""Append-only ledger of per-day backtest results
+
+Every computed day is written as one JSON line as soon as it is done:
+
+    {"date": "2024-03-12", "params": "3f1c...", "code": "9a0b...", "ts": ..., "record": {...}}
+
+params is a hash of the parameters the result depends on and code a hash of the
+source of the functions that produce it. records() only returns lines matching the
+current hashes (the latest one per date), so a rerun recomputes just the days that
+are missing or were produced with other parameters / code, and an interrupted run
+resumes where it stopped. A line cut short by a crash is skipped on load.
+
+Lines are written with a single append, so thread and process workers of the same
+run can record into one file.
+"""
+import os
+import json
+import inspect
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime, timezone
+
+
+def param_hash(params: dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def code_version(functions: list) -> str:
+    """Hash of the source of functions (decorated functions hash their wrapped source)"""
+    source = "".join(inspect.getsource(inspect.unwrap(f)) for f in functions)
+    return hashlib.sha1(source.encode()).hexdigest()[:12]
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class Ledger:
+    def __init__(self, path: str, params: dict, code: list = ()):
+        self.path = path
+        self.params = param_hash(params)
+        self.code = code_version(code) if code else None
+        self._lock = threading.Lock()
+
+    def append(self, date: str, record: dict):
+        line = json.dumps({"date": str(date), "params": self.params, "code": self.code,
+                           "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"), "record": record}, default=_json_default)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def records(self) -> dict:
+        """date -> latest record of the current params and code"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("params") == self.params and entry.get("code") == self.code:
+                    records[entry["date"]] = entry["record"]
+        return records
+
+    def missing(self, dates: list) -> list:
+        """dates without a non-empty record (empty records of earlier versions count as not done)"""
+        done = self.records()
+        return [date for date in dates if not done.get(date)]
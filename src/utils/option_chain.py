@@ -0,0 +1,218 @@
+"""Option chain of one expiration as strike sorted, typed NumPy columns per right
+
+    chain = OptionChain.from_ib_tickers(tickers)
+    short = chain.nearest_strike("P", short_strike)
+    long = chain.nearest_strike("P", short["strike"] - 5)
+    verticals = chain.verticals("P", width = 5)
+
+One chain type for the three sources the scripts read: ib_async tickers (the live
+app), Polygon option chain snapshots and the cached StrikeIndex / StrikeBand data.
+Lookups are binary searches: strikes are sorted once when the chain is built, and
+the orders by delta and by bid/ask are sorted on first use and then reused.
+"""
+import numpy as np
+import pandas as pd
+from typing import Optional, TYPE_CHECKING
+from utils.black_scholes import chain_greeks, expiry_close
+
+if TYPE_CHECKING:  # the live app builds chains without the Polygon async stack
+    from utils.chain_reference import StrikeIndex
+    from utils.strike_band import StrikeBand
+
+RIGHTS = ("C", "P")
+COLUMNS = ("strike", "bid", "ask", "bid_size", "ask_size", "volume", "iv", "delta", "gamma", "vega", "theta", "und_price")
+
+
+def _float(value) -> float:
+    """NaN for the missing values of the sources (None, IB's -1 / nan)"""
+    return np.nan if value is None else float(value)
+
+
+class OptionSide:
+    """Contracts of a single right, rows sorted by strike"""
+    def __init__(self, right: str, symbols, **columns):
+        if right not in RIGHTS:
+            raise ValueError(f"right must be one of {RIGHTS}")
+        strikes = np.asarray(columns["strike"], dtype=np.float64)
+        order = np.argsort(strikes, kind="stable")
+        self.right = right
+        self.symbols = np.asarray(symbols, dtype=str)[order] if len(strikes) else np.empty(0, dtype=str)
+        self.columns = {}
+        for column in COLUMNS:
+            values = columns.get(column)
+            values = np.full(len(strikes), np.nan) if values is None else np.asarray(values, dtype=np.float64)
+            self.columns[column] = values[order]
+        self._sorted = {}
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    @property
+    def strikes(self) -> np.ndarray:
+        return self.columns["strike"]
+
+    @property
+    def mid(self) -> np.ndarray:
+        return (self.columns["bid"] + self.columns["ask"]) / 2
+
+    def row(self, i: int) -> dict:
+        return {"symbol": str(self.symbols[i]), "right": self.right, **{c: float(v[i]) for c, v in self.columns.items()}}
+
+    def _nearest(self, values: np.ndarray, target: float) -> int:
+        """Position in values (sorted, no NaN) closest to target, the lower one on ties"""
+        if not len(values):
+            raise KeyError(f"no {self.right} contracts to search")
+        i = int(np.searchsorted(values, target))
+        if i == len(values) or (i > 0 and target - values[i - 1] <= values[i] - target):
+            i -= 1
+        return i
+
+    def _by(self, column: str) -> tuple:
+        """(rows sorted by column, the sorted values), NaN rows left out"""
+        if column not in self._sorted:
+            values = self.columns[column]
+            rows = np.flatnonzero(~np.isnan(values))
+            rows = rows[np.argsort(values[rows], kind="stable")]
+            self._sorted[column] = (rows, values[rows])
+        return self._sorted[column]
+
+    def nearest_strike(self, target: float) -> int:
+        return self._nearest(self.strikes, target)
+
+    def nearest(self, column: str, target: float) -> int:
+        rows, values = self._by(column)
+        return int(rows[self._nearest(values, target)])
+
+
+class OptionChain:
+    def __init__(self, expiration: Optional[str], sides: dict):
+        self.expiration = expiration
+        self.sides = {right: sides.get(right) or OptionSide(right, [], strike = []) for right in RIGHTS}
+
+    def side(self, right: str) -> OptionSide:
+        return self.sides[right]
+
+    def __len__(self) -> int:
+        return sum(len(side) for side in self.sides.values())
+
+    ################
+    # CONSTRUCTION #
+    ################
+
+    @classmethod
+    def from_records(cls, records: list, expiration: Optional[str] = None) -> "OptionChain":
+        """records: dicts with symbol, right and any of COLUMNS"""
+        sides = {}
+        for right in RIGHTS:
+            rows = [r for r in records if r["right"] == right]
+            sides[right] = OptionSide(right, [r["symbol"] for r in rows],
+                                      **{c: [_float(r.get(c)) for r in rows] for c in COLUMNS})
+        return cls(expiration, sides)
+
+    @classmethod
+    def from_ib_tickers(cls, tickers: list, need_greeks: bool = False) -> "OptionChain":
+        """Chain of ib_async tickers (one expiration), duplicates of a localSymbol are ignored
+
+        need_greeks drops the contracts without model greeks instead of keeping NaN greeks.
+        """
+        records, seen, expiration = [], set(), None
+        for ticker in tickers:
+            contract = ticker.contract
+            if contract.localSymbol in seen:
+                continue
+            greeks = ticker.modelGreeks
+            if greeks is None and need_greeks:
+                continue
+            seen.add(contract.localSymbol)
+            expiration = contract.lastTradeDateOrContractMonth
+            records.append({
+                "symbol": contract.localSymbol, "right": contract.right, "strike": contract.strike,
+                "bid": ticker.bid if ticker.bid != -1 else np.nan, "ask": ticker.ask if ticker.ask != -1 else np.nan,
+                "bid_size": ticker.bidSize, "ask_size": ticker.askSize, "volume": ticker.volume,
+                **({} if greeks is None else {"iv": greeks.impliedVol, "delta": greeks.delta, "gamma": greeks.gamma,
+                                               "vega": greeks.vega, "theta": greeks.theta, "und_price": greeks.undPrice}),
+            })
+        return cls.from_records(records, expiration)
+
+    @classmethod
+    def from_polygon_snapshot(cls, results: list) -> "OptionChain":
+        """Chain of /v3/snapshot/options results (PolygonClient.get_options_snapshot)"""
+        records, expiration = [], None
+        for result in results:
+            details, quote, greeks = result.get("details", {}), result.get("last_quote", {}), result.get("greeks", {})
+            expiration = details.get("expiration_date", expiration)
+            records.append({
+                "symbol": details.get("ticker"), "right": "C" if details.get("contract_type") == "call" else "P",
+                "strike": details.get("strike_price"), "bid": quote.get("bid"), "ask": quote.get("ask"),
+                "bid_size": quote.get("bid_size"), "ask_size": quote.get("ask_size"), "volume": result.get("day", {}).get("volume"),
+                "iv": result.get("implied_volatility"), "delta": greeks.get("delta"), "gamma": greeks.get("gamma"),
+                "vega": greeks.get("vega"), "theta": greeks.get("theta"), "und_price": result.get("underlying_asset", {}).get("price"),
+            })
+        return cls.from_records(records, expiration)
+
+    @classmethod
+    def from_strike_index(cls, index: "StrikeIndex", right: str, expiration: Optional[str] = None) -> "OptionChain":
+        """Contracts of a cached StrikeIndex, without quotes"""
+        return cls(expiration, {right: OptionSide(right, index.tickers, strike = index.strikes)})
+
+    @classmethod
+    def from_strike_band(cls, band: "StrikeBand", minute: int, spot: Optional[float] = None, r: float = 0.0) -> "OptionChain":
+        """Closes of a cached StrikeBand at minute (epoch ms) as bid = ask, for backtests
+
+        With the underlying spot at that minute, iv and greeks are implied from the closes.
+        """
+        j = int(np.searchsorted(band.minutes, minute))
+        closes = band.prices[:, j] if j < len(band.minutes) and band.minutes[j] == minute else np.full(len(band.strikes), np.nan)
+        columns = {"strike": band.strikes, "bid": closes, "ask": closes}
+        if spot is not None:
+            implied = chain_greeks(closes, spot, band.strikes, minute, expiry_close(band.expiration)[0], band.right == "C", r)
+            columns.update(implied, und_price = np.full(len(closes), spot))
+        return cls(band.expiration, {band.right: OptionSide(band.right, band.tickers, **columns)})
+
+    ###########
+    # LOOKUPS #
+    ###########
+
+    def nearest_strike(self, right: str, target: float) -> dict:
+        side = self.sides[right]
+        return side.row(side.nearest_strike(target))
+
+    def nearest_delta(self, right: str, target: float) -> dict:
+        side = self.sides[right]
+        return side.row(side.nearest("delta", target))
+
+    def nearest_credit(self, right: str, target: float, bidask: str = "ask") -> dict:
+        if bidask not in ("bid", "ask"):
+            raise ValueError("bidask must be 'bid' or 'ask'")
+        side = self.sides[right]
+        return side.row(side.nearest(bidask, target))
+
+    def verticals(self, right: str, width: float) -> pd.DataFrame:
+        """Every credit vertical of width: puts buy strike - width, calls buy strike + width
+
+        credit_mid is short mid - long mid, credit_natural is short bid - long ask.
+        """
+        side = self.sides[right]
+        strikes = side.strikes
+        long_strikes = strikes - width if right == "P" else strikes + width
+        j = np.searchsorted(strikes, long_strikes)
+        hit = (j < len(strikes)) & (strikes[np.minimum(j, len(strikes) - 1)] == long_strikes)
+        short, long = np.flatnonzero(hit), j[hit]
+        mid = side.mid
+        return pd.DataFrame({
+            "short_symbol": side.symbols[short], "long_symbol": side.symbols[long],
+            "short_strike": strikes[short], "long_strike": strikes[long],
+            "credit_mid": mid[short] - mid[long],
+            "credit_natural": side["bid"][short] - side["ask"][long],
+            "short_delta": side["delta"][short],
+        })
+
+    def to_frame(self) -> pd.DataFrame:
+        """Both rights as one strike sorted frame with typed columns"""
+        frames = [pd.DataFrame({"symbol": side.symbols, "right": right, **side.columns}) for right, side in self.sides.items() if len(side)]
+        if not frames:
+            return pd.DataFrame(columns = ["symbol", "right", *COLUMNS])
+        return pd.concat(frames, ignore_index = True).sort_values(["right", "strike"], ignore_index = True)
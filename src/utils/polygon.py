@@ -1,29 +1,311 @@
-
+import os
+import time
+import random
+import threading
 import requests
+import numpy as np
 import pandas as pd
+from typing import Optional
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from pandas_market_calendars import get_calendar
+from utils.cache import AggregatesCache, empty_aggregates
+from utils.bar_store import MinuteBarStore
+from utils.rate_limit import TokenBucket
+from utils.quotes import NBBOSummary, QuoteReducer
+
+POLYGON_BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io")
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_cache: Optional[AggregatesCache] = None
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+class polygonRequestException(Exception):
+    pass
+
+
+def aggregates_frame(payload: dict) -> pd.DataFrame:
+    """/v2/aggs payload -> bars indexed by t (ms), empty frame when Polygon has no bars for the range"""
+    if not payload.get("results"):
+        return empty_aggregates()
+    return pd.json_normalize(payload["results"]).set_index("t")
+
+def latest_mid_price(payload: dict, ticker: str = ""):
+    """Timestamp and mid price of the first quote of a descending /v3/quotes payload"""
+    if not payload.get("results"):
+        raise polygonRequestException(f"{ticker}: no quotes")
+    quote = payload["results"][0]
+    if quote.get("bid_price") is None or quote.get("ask_price") is None or "sip_timestamp" not in quote:
+        raise polygonRequestException(f"{ticker}: incomplete quote {quote}")
+    quote_ts = pd.Timestamp(quote["sip_timestamp"], unit = "ns", tz = "UTC").tz_convert("America/New_York")
+    return quote_ts, (quote["bid_price"] + quote["ask_price"]) / 2
+
+
+class EndpointStats:
+    """Latency and error counters of one Polygon endpoint, percentiles over the last max_samples calls"""
+    def __init__(self, max_samples: int = 10000):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples = deque(maxlen = max_samples)
+
+    def record(self, seconds: float, error: bool = False):
+        self.calls += 1
+        self.errors += int(error)
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "mean_ms": round(self.total_seconds / self.calls * 1000, 2) if self.calls else None,
+            "p50_ms": round(float(np.percentile(self.samples, 50)) * 1000, 2) if self.samples else None,
+            "p95_ms": round(float(np.percentile(self.samples, 95)) * 1000, 2) if self.samples else None,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+class PolygonClient:
+    """Polygon REST client with a pooled keep-alive session
+
+    - requests_per_minute: token bucket matching the plan tier (None for unlimited plans)
+    - 429 / 5xx responses and connection errors are retried with exponential backoff
+    - timeout: (connect, read) seconds for every request
+    - cache: AggregatesCache for /v2/aggs, defaults to the module cache set with set_cache
+    - bar_store: MinuteBarStore answering 1 minute bar requests for the days it already holds
+
+    The rate limit is per client (per process when a backtest runs on a process pool) and
+    is shared with the AsyncPolygonClient built from it.
+    """
+    def __init__(self,
+                 polygon_api_key: str,
+                 requests_per_minute: Optional[float] = None,
+                 timeout: tuple = (5, 30),
+                 max_retries: int = 5,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 pool_size: int = 32,
+                 base_url: Optional[str] = None,
+                 cache: Optional[AggregatesCache] = None,
+                 bar_store: Optional[MinuteBarStore] = None):
+        self.polygon_api_key = polygon_api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.base_url = (base_url or POLYGON_BASE_URL).rstrip("/")
+        self.cache = cache
+        self.bar_store = bar_store
+        self.rate_limiter = TokenBucket(requests_per_minute / 60, capacity = 1) if requests_per_minute else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.stats = defaultdict(EndpointStats)
+        self._stats_lock = threading.Lock()
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None and retry_after.replace(".", "", 1).isdigit():
+            return float(retry_after)
+        return min(self.max_backoff, self.backoff * 2 ** attempt) + random.uniform(0, self.backoff)
+
+    def record(self, endpoint: str, seconds: float, error: bool = False, retry: bool = False):
+        with self._stats_lock:
+            stats = self.stats[endpoint]
+            stats.record(seconds, error)
+            stats.retries += int(retry)
+
+    def request(self, path: str, params: Optional[dict] = None, endpoint: str = "other") -> dict:
+        """GET a Polygon path (or a full next_url) and return the decoded payload"""
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        params = dict(params or {})
+        params["apiKey"] = self.polygon_api_key
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            last_attempt = attempt == self.max_retries
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params = params, timeout = self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(endpoint, time.perf_counter() - start, error = True, retry = not last_attempt)
+                if last_attempt:
+                    raise polygonRequestException(f"{endpoint}: {e}") from e
+                time.sleep(self.retry_delay(attempt))
+                continue
+
+            elapsed = time.perf_counter() - start
+            if response.status_code in RETRY_STATUS_CODES:
+                self.record(endpoint, elapsed, error = True, retry = not last_attempt)
+                if last_attempt:
+                    break
+                time.sleep(self.retry_delay(attempt, response.headers.get("Retry-After")))
+                continue
+
+            if not response.ok:
+                self.record(endpoint, elapsed, error = True)
+                raise polygonRequestException(f"{endpoint}: HTTP {response.status_code} {response.text[:200]}")
+
+            payload = response.json()
+            if payload.get("status") == "ERROR":
+                self.record(endpoint, elapsed, error = True)
+                raise polygonRequestException(f"{endpoint}: {payload.get('error', payload)}")
+            self.record(endpoint, elapsed)
+            return payload
+
+        raise polygonRequestException(f"{endpoint}: HTTP {response.status_code} after {self.max_retries} retries")
+
+    def iter_pages(self, path: str, params: Optional[dict] = None, endpoint: str = "other"):
+        """Results of a v3 endpoint page by page, following next_url until the last page"""
+        payload = self.request(path, params, endpoint)
+        yield payload.get("results", [])
+        while payload.get("next_url"):
+            payload = self.request(payload["next_url"], endpoint = endpoint)
+            yield payload.get("results", [])
+
+    def paginate(self, path: str, params: Optional[dict] = None, endpoint: str = "other") -> list:
+        """All results of a v3 endpoint"""
+        return [result for page in self.iter_pages(path, params, endpoint) for result in page]
+
+    def get_cache(self) -> Optional[AggregatesCache]:
+        return self.cache or _cache
+
+    def stats_frame(self) -> pd.DataFrame:
+        with self._stats_lock:
+            return pd.DataFrame({endpoint: stats.to_dict() for endpoint, stats in self.stats.items()}).T
+
+    ##############
+    # AGGREGATES #
+    ##############
+
+    def fetch_ticker_data(self, ticker: str, start_date: str, end_date: str, timespan: str = "day", multiplier = 1, limit = 50000) -> pd.DataFrame:
+        """Uncached /v2/aggs request, returns an empty frame when Polygon has no bars for the range"""
+        payload = self.request(f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start_date}/{end_date}",
+                               {"adjusted": "true", "sort": "asc", "limit": limit},
+                               endpoint = "aggs")
+        return aggregates_frame(payload)
+
+    def local_bars(self, ticker: str, start_date: str, end_date: str, timespan: str, multiplier) -> Optional[pd.DataFrame]:
+        """Minute bars from the bar store when it covers the whole range, else None"""
+        if self.bar_store is None or timespan != "minute" or multiplier != 1 or self.bar_store.missing(ticker, start_date, end_date):
+            return None
+        return self.bar_store.read(ticker, start_date, end_date)
+
+    def get_ticker_data(self, ticker: str, start_date: str, end_date: str, timespan: str = "day", multiplier = 1, limit = 50000) -> pd.DataFrame:
+        if (local := self.local_bars(ticker, start_date, end_date, timespan, multiplier)) is not None:
+            return local
+        cache = self.get_cache()
+        if cache is None:
+            return self.fetch_ticker_data(ticker, start_date, end_date, timespan, multiplier, limit)
+        fetch = lambda start, end: self.fetch_ticker_data(ticker, start, end, timespan, multiplier, limit)
+        return cache.get(ticker, start_date, end_date, fetch, timespan, multiplier)
+
+    #############
+    # CONTRACTS #
+    #############
+
+    def get_historical_option_contracts(self, options_ticker: str, as_of: str, exp_date: str, contract_type: str, limit: int = 1000) -> pd.DataFrame:
+        """Every contract of the chain, limit is the page size"""
+        results = self.paginate("/v3/reference/options/contracts",
+                                {"underlying_ticker": options_ticker, "contract_type": contract_type, "as_of": as_of, "expiration_date": exp_date, "limit": limit},
+                                endpoint = "contracts")
+        return pd.json_normalize(results)
+
+    def get_option_chain(self, ticker: str, contract_type: str, date: str, exp_date: str, limit: int = 1000) -> pd.DataFrame:
+        return self.get_historical_option_contracts(ticker, date, exp_date, contract_type, limit)
+
+    ##########
+    # QUOTES #
+    ##########
+
+    def get_options_snapshot(self, underlying: str, expiration: str, contract_type: Optional[str] = None,
+                             strike_gte: Optional[float] = None, strike_lte: Optional[float] = None, limit: int = 250) -> list:
+        """Live quotes and greeks of the chain of one expiration, optionally a strike range (see OptionChain.from_polygon_snapshot)"""
+        params = {"expiration_date": expiration, "contract_type": contract_type, "strike_price.gte": strike_gte, "strike_price.lte": strike_lte, "limit": limit}
+        return self.paginate(f"/v3/snapshot/options/{underlying}", {k: v for k, v in params.items() if v is not None}, endpoint = "snapshot")
+
+    def get_quote_summary(self, ticker: str, start, end, limit: int = 50000) -> NBBOSummary:
+        """NBBO summary of every quote in [start, end) (ns), reduced page by page"""
+        reducer = QuoteReducer(ticker, end)
+        for page in self.iter_pages(f"/v3/quotes/{ticker}",
+                                    {"timestamp.gte": start, "timestamp.lt": end, "order": "asc", "limit": limit, "sort": "timestamp"},
+                                    endpoint = "quotes"):
+            reducer.add_page(page)
+        return reducer.summary()
+
+    def get_quote_summaries(self, tickers: list, start, end) -> list[NBBOSummary]:
+        """get_quote_summary of several tickers (both legs of a spread) over the same window, concurrently"""
+        with ThreadPoolExecutor(max_workers = max(len(tickers), 1)) as pool:
+            return list(pool.map(lambda ticker: self.get_quote_summary(ticker, start, end), tickers))
+
+    def get_ticker_quote(self, ticker: str, start, end) -> float:
+        """Get mid price at a specfic price range"""
+        return self.get_quote_summary(ticker, start, end).mid
+
+    def initial_spread(self, short_ticker: str, long_ticker: str, start, end) -> float:
+        """Short call/put spread price"""
+        short_leg, long_leg = self.get_quote_summaries([short_ticker, long_ticker], start, end)
+        return short_leg.mid - long_leg.mid
+
+    def get_latest_ticker_quote(self, ticker: str):
+        """For streaming latest mid-price quote of option ticker"""
+        payload = self.request(f"/v3/quotes/{ticker}", {"order": "desc", "limit": 1, "sort": "timestamp"}, endpoint = "quotes")
+        return latest_mid_price(payload, ticker)
+
+    def stream_spread_quote(self, short_ticker: str, long_ticker: str):
+        short_ts, short_leg_mid = self.get_latest_ticker_quote(short_ticker)
+        long_ts, long_leg_mid = self.get_latest_ticker_quote(long_ticker)
+        return short_ts, short_leg_mid - long_leg_mid
+
+
+def set_cache(cache: Optional[AggregatesCache]):
+    """Route every get_ticker_data call through a local AggregatesCache (None disables caching)"""
+    global _cache
+    _cache = cache
+
+def set_client(client: PolygonClient):
+    """Use client for the module level helpers called with its api key"""
+    with _clients_lock:
+        _clients[client.polygon_api_key] = client
+
+def get_client(polygon_api_key = None) -> PolygonClient:
+    with _clients_lock:
+        if polygon_api_key not in _clients:
+            _clients[polygon_api_key] = PolygonClient(polygon_api_key)
+        return _clients[polygon_api_key]
+
+def fetch_ticker_data(ticker: str, start_date: str, end_date: str, timespan: str = "day", polygon_api_key= None, multiplier = 1, limit = 50000) -> pd.DataFrame:
+    return get_client(polygon_api_key).fetch_ticker_data(ticker, start_date, end_date, timespan, multiplier, limit)
 
 def get_ticker_data(ticker: str, start_date: str, end_date: str, timespan: str = "day", polygon_api_key= None, multiplier = 1, limit = 50000) -> pd.DataFrame:
-    endpoint = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start_date}/{end_date}?adjusted=true&sort=asc&limit={limit}&apiKey={polygon_api_key}"
-    return pd.json_normalize(requests.get(endpoint).json()["results"]).set_index("t")
-
-def get_option_chain(ticker: str, 
-                     contract_type: str, 
-                     date:str, 
-                     exp_date:str, 
-                     limit:int = 1000, 
+    return get_client(polygon_api_key).get_ticker_data(ticker, start_date, end_date, timespan, multiplier, limit)
+
+def get_option_chain(ticker: str,
+                     contract_type: str,
+                     date:str,
+                     exp_date:str,
+                     limit:int = 1000,
                      polygon_api_key=None) -> pd.DataFrame:
-    endpoint = f"https://api.polygon.io/v3/reference/options/contracts?underlying_ticker={ticker}&contract_type={contract_type}&as_of={date}&expiration_date={exp_date}&limit={limit}&apiKey={polygon_api_key}"
-    return pd.json_normalize(requests.get(endpoint).json()["results"])
-
-def get_historical_option_contracts(options_ticker, 
-                                    as_of, 
-                                    exp_date, 
-                                    contract_type, 
-                                    polygon_api_key = None, 
+    return get_client(polygon_api_key).get_option_chain(ticker, contract_type, date, exp_date, limit)
+
+def get_historical_option_contracts(options_ticker,
+                                    as_of,
+                                    exp_date,
+                                    contract_type,
+                                    polygon_api_key = None,
                                     limit = 1000) -> pd.DataFrame:
-    endpoint = f"https://api.polygon.io/v3/reference/options/contracts?underlying_ticker={options_ticker}&contract_type={contract_type}&as_of={as_of}&expiration_date={exp_date}&limit={limit}&apiKey={polygon_api_key}"
-    return pd.json_normalize(requests.get(endpoint).json()["results"])
+    return get_client(polygon_api_key).get_historical_option_contracts(options_ticker, as_of, exp_date, contract_type, limit)
 
 def schedule_trading_dates(exchange, start_date, end_date) -> list[str]:
     """Produces list of available trading dates for a given exchange"""
@@ -32,26 +314,15 @@ def schedule_trading_dates(exchange, start_date, end_date) -> list[str]:
 
 def get_ticker_quote(ticker, start, end, polygon_api_key=None) -> float:
     """Get mid price at a specfic price range"""
-    quotes = pd.json_normalize(requests.get(f"https://api.polygon.io/v3/quotes/{ticker}?timestamp.gte={start}&timestamp.lt={end}&order=asc&limit=5000&sort=timestamp&apiKey={polygon_api_key}").json()["results"]).set_index("sip_timestamp")
-    quotes.index = pd.to_datetime(quotes.index, unit = "ns", utc = True).tz_convert("America/New_York")
-    quote = quotes.median(numeric_only=True).to_frame().copy().T
-    quote["mid_price"] = (quote["bid_price"] + quote["ask_price"]) / 2
-    return quote["mid_price"].iloc[0]
+    return get_client(polygon_api_key).get_ticker_quote(ticker, start, end)
 
 def initial_spread(short_ticker, long_ticker, start, end, polygon_api_key=None) -> float:
     """Short call/put spread price"""
-    short_leg_mid = get_ticker_quote(short_ticker, start, end, polygon_api_key=polygon_api_key)
-    long_leg_mid = get_ticker_quote(long_ticker, start, end , polygon_api_key=polygon_api_key)
-    return short_leg_mid - long_leg_mid # short_call_quote["bid_price"].iloc[0] - long_call_quote["ask_price"].iloc[0]
+    return get_client(polygon_api_key).initial_spread(short_ticker, long_ticker, start, end)
 
 def get_latest_ticker_quote(ticker, polygon_api_key=None):
     """For streaming latest mid-price quote of option ticker"""
-    quotes = pd.json_normalize(requests.get(f"https://api.polygon.io/v3/quotes/{ticker}?order=desc&limit=100&sort=timestamp&apiKey={polygon_api_key}").json()["results"]).set_index("sip_timestamp")
-    quotes.index = pd.to_datetime(quotes.index, unit = "ns", utc = True).tz_convert("America/New_York")
-    quotes["mid_price"] = (quotes["bid_price"] + quotes["ask_price"]) / 2
-    return quotes.index[0], quotes["mid_price"].iloc[0]
+    return get_client(polygon_api_key).get_latest_ticker_quote(ticker)
 
 def stream_spread_quote(short_ticker, long_ticker, polygon_api_key = None):
-    short_ts, short_leg_mid = get_latest_ticker_quote(short_ticker, polygon_api_key=polygon_api_key)
-    long_ts, long_leg_mid = get_latest_ticker_quote(long_ticker, polygon_api_key=polygon_api_key)
-    return short_ts, short_leg_mid - long_leg_mid
+    return get_client(polygon_api_key).stream_spread_quote(short_ticker, long_ticker)
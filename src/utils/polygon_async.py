@@ -0,0 +1,205 @@
+"""asyncio variant of the Polygon helpers
+
+Independent requests (index bars, option legs, quotes of both legs) are issued
+together with asyncio.gather, so a batch costs roughly the slowest round trip
+instead of the sum of all of them.
+
+    async with AsyncPolygonClient.from_client(client) as aclient:
+        bars = await aclient.get_tickers_data(["I:SPX", "I:VIX1D", "SPY"], date, date, "minute")
+"""
+import time
+import asyncio
+import aiohttp
+import pandas as pd
+from typing import Optional
+from utils.cache import cacheMissException, last_final_date, ny_dates, split_segment, MAX_GAP_DAYS
+from utils.polygon import (PolygonClient, polygonRequestException, aggregates_frame, latest_mid_price,
+                           RETRY_STATUS_CODES)
+from utils.quotes import NBBOSummary, QuoteReducer
+
+
+class AsyncPolygonClient:
+    """aiohttp counterpart of PolygonClient
+
+    Built with from_client, it shares the api key, retry/timeout settings, token bucket,
+    aggregates cache and endpoint counters of a PolygonClient, so sync and async calls
+    count against the same rate limit and show up in the same stats.
+    """
+    def __init__(self, client: PolygonClient, max_concurrency: int = 16):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_client(cls, client: PolygonClient, max_concurrency: int = 16) -> "AsyncPolygonClient":
+        return cls(client, max_concurrency)
+
+    async def __aenter__(self) -> "AsyncPolygonClient":
+        connect_timeout, read_timeout = self.client.timeout
+        self.session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(limit = self.max_concurrency),
+            timeout = aiohttp.ClientTimeout(sock_connect = connect_timeout, sock_read = read_timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _acquire(self):
+        if self.client.rate_limiter is None:
+            return
+        while (wait := self.client.rate_limiter.wait_time()) > 0:
+            await asyncio.sleep(wait)
+
+    async def request(self, path: str, params: Optional[dict] = None, endpoint: str = "other") -> dict:
+        """GET a Polygon path (or a full next_url) and return the decoded payload"""
+        if self.session is None:
+            raise RuntimeError("AsyncPolygonClient must be used as an async context manager")
+        client = self.client
+        url = path if path.startswith("http") else f"{client.base_url}{path}"
+        params = {k: str(v) for k, v in (params or {}).items()}
+        params["apiKey"] = client.polygon_api_key
+
+        for attempt in range(client.max_retries + 1):
+            await self._acquire()
+            last_attempt = attempt == client.max_retries
+            start = time.perf_counter()
+            try:
+                async with self.session.get(url, params = params) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    if status in RETRY_STATUS_CODES or status >= 400:
+                        body = await response.text()
+                    else:
+                        payload = await response.json(content_type = None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client.record(endpoint, time.perf_counter() - start, error = True, retry = not last_attempt)
+                if last_attempt:
+                    raise polygonRequestException(f"{endpoint}: {e!r}") from e
+                await asyncio.sleep(client.retry_delay(attempt))
+                continue
+
+            elapsed = time.perf_counter() - start
+            if status in RETRY_STATUS_CODES:
+                client.record(endpoint, elapsed, error = True, retry = not last_attempt)
+                if last_attempt:
+                    break
+                await asyncio.sleep(client.retry_delay(attempt, retry_after))
+                continue
+
+            if status >= 400:
+                client.record(endpoint, elapsed, error = True)
+                raise polygonRequestException(f"{endpoint}: HTTP {status} {body[:200]}")
+
+            if payload.get("status") == "ERROR":
+                client.record(endpoint, elapsed, error = True)
+                raise polygonRequestException(f"{endpoint}: {payload.get('error', payload)}")
+            client.record(endpoint, elapsed)
+            return payload
+
+        raise polygonRequestException(f"{endpoint}: HTTP {status} after {client.max_retries} retries")
+
+    async def iter_pages(self, path: str, params: Optional[dict] = None, endpoint: str = "other"):
+        """Results of a v3 endpoint page by page, following next_url until the last page"""
+        payload = await self.request(path, params, endpoint)
+        yield payload.get("results", [])
+        while payload.get("next_url"):
+            payload = await self.request(payload["next_url"], endpoint = endpoint)
+            yield payload.get("results", [])
+
+    async def paginate(self, path: str, params: Optional[dict] = None, endpoint: str = "other") -> list:
+        """All results of a v3 endpoint"""
+        return [result async for page in self.iter_pages(path, params, endpoint) for result in page]
+
+    ##############
+    # AGGREGATES #
+    ##############
+
+    async def fetch_ticker_data(self, ticker: str, start_date: str, end_date: str, timespan: str = "day", multiplier = 1, limit = 50000) -> pd.DataFrame:
+        payload = await self.request(f"/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start_date}/{end_date}",
+                                     {"adjusted": "true", "sort": "asc", "limit": limit},
+                                     endpoint = "aggs")
+        return aggregates_frame(payload)
+
+    async def get_ticker_data(self, ticker: str, start_date: str, end_date: str, timespan: str = "day", multiplier = 1, limit = 50000) -> pd.DataFrame:
+        """Same as PolygonClient.get_ticker_data, missing cache segments are fetched concurrently"""
+        if (local := self.client.local_bars(ticker, start_date, end_date, timespan, multiplier)) is not None:
+            return local
+        cache = self.client.get_cache()
+        if cache is None:
+            return await self.fetch_ticker_data(ticker, start_date, end_date, timespan, multiplier, limit)
+
+        gaps = cache.missing(ticker, start_date, end_date, timespan, multiplier)
+        if gaps and cache.offline:
+            raise cacheMissException(f"{ticker} {multiplier}{timespan} not cached for {gaps}")
+        segments = [seg for gap_start, gap_end in gaps for seg in split_segment(gap_start, gap_end, MAX_GAP_DAYS.get(timespan))]
+        fetched = await asyncio.gather(*[self.fetch_ticker_data(ticker, s.isoformat(), e.isoformat(), timespan, multiplier, limit) for s, e in segments])
+
+        final = last_final_date()
+        live_frames = []
+        for (seg_start, seg_end), df in zip(segments, fetched):
+            cache.write(ticker, df, seg_start, seg_end, timespan, multiplier)
+            if seg_end > final and len(df):
+                live_frames.append(df[ny_dates(df.index) > final])
+        df = cache.read(ticker, start_date, end_date, timespan, multiplier)
+        if live_frames:
+            df = pd.concat([df] + live_frames).sort_index()
+        return df
+
+    async def get_tickers_data(self, tickers: list, start_date: str, end_date: str, timespan: str = "day", multiplier = 1) -> dict:
+        """Bars of several tickers for the same range, requested concurrently"""
+        frames = await asyncio.gather(*[self.get_ticker_data(t, start_date, end_date, timespan, multiplier) for t in tickers])
+        return dict(zip(tickers, frames))
+
+    #############
+    # CONTRACTS #
+    #############
+
+    async def get_historical_option_contracts(self, options_ticker: str, as_of: str, exp_date: str, contract_type: str, limit: int = 1000) -> pd.DataFrame:
+        """Every contract of the chain, limit is the page size"""
+        results = await self.paginate("/v3/reference/options/contracts",
+                                      {"underlying_ticker": options_ticker, "contract_type": contract_type, "as_of": as_of, "expiration_date": exp_date, "limit": limit},
+                                      endpoint = "contracts")
+        return pd.json_normalize(results)
+
+    async def get_option_chain(self, ticker: str, contract_type: str, date: str, exp_date: str, limit: int = 1000) -> pd.DataFrame:
+        return await self.get_historical_option_contracts(ticker, date, exp_date, contract_type, limit)
+
+    ##########
+    # QUOTES #
+    ##########
+
+    async def get_quote_summary(self, ticker: str, start, end, limit: int = 50000) -> NBBOSummary:
+        """NBBO summary of every quote in [start, end) (ns), reduced page by page"""
+        reducer = QuoteReducer(ticker, end)
+        async for page in self.iter_pages(f"/v3/quotes/{ticker}",
+                                          {"timestamp.gte": start, "timestamp.lt": end, "order": "asc", "limit": limit, "sort": "timestamp"},
+                                          endpoint = "quotes"):
+            reducer.add_page(page)
+        return reducer.summary()
+
+    async def get_quote_summaries(self, tickers: list, start, end) -> list[NBBOSummary]:
+        return list(await asyncio.gather(*[self.get_quote_summary(ticker, start, end) for ticker in tickers]))
+
+    async def get_ticker_quote(self, ticker: str, start, end) -> float:
+        """Get mid price at a specfic price range"""
+        return (await self.get_quote_summary(ticker, start, end)).mid
+
+    async def initial_spread(self, short_ticker: str, long_ticker: str, start, end) -> float:
+        """Short call/put spread price, both legs requested concurrently"""
+        short_leg, long_leg = await self.get_quote_summaries([short_ticker, long_ticker], start, end)
+        return short_leg.mid - long_leg.mid
+
+    async def get_latest_ticker_quote(self, ticker: str):
+        """For streaming latest mid-price quote of option ticker"""
+        payload = await self.request(f"/v3/quotes/{ticker}", {"order": "desc", "limit": 1, "sort": "timestamp"}, endpoint = "quotes")
+        return latest_mid_price(payload, ticker)
+
+    async def stream_spread_quote(self, short_ticker: str, long_ticker: str):
+        (short_ts, short_leg_mid), (long_ts, long_leg_mid) = await asyncio.gather(self.get_latest_ticker_quote(short_ticker),
+                                                                                  self.get_latest_ticker_quote(long_ticker))
+        return short_ts, short_leg_mid - long_leg_mid
@@ -0,0 +1,109 @@
+"""Streaming reduction of /v3/quotes pages into an NBBO summary
+
+Quotes are consumed page by page and never materialised. Bid and ask prices sit on
+the option tick grid, so their exact medians come from per-price counters whose size
+is the number of distinct prices, not the number of quotes. The time-weighted mid
+weighs each quote's mid by how long it stood, up to the next quote or the window end.
+"""
+import numpy as np
+import pandas as pd
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class NBBOSummary:
+    ticker: str
+    count: int
+    median_bid: float
+    median_ask: float
+    twap_mid: float
+    mean_spread_width: float
+    first_ts: Optional[pd.Timestamp]
+    last_ts: Optional[pd.Timestamp]
+
+    @property
+    def mid(self) -> float:
+        """Mid of the median bid and the median ask, the entry price used so far"""
+        return (self.median_bid + self.median_ask) / 2
+
+
+def counter_median(counts: Counter) -> float:
+    """Median of the values counted in counts, the mean of the two middle ones for an even total"""
+    total = sum(counts.values())
+    if total == 0:
+        return np.nan
+    lower_rank, upper_rank = (total - 1) // 2, total // 2
+    seen, lower = 0, None
+    for value in sorted(counts):
+        seen += counts[value]
+        if lower is None and seen > lower_rank:
+            lower = value
+        if seen > upper_rank:
+            return (lower + value) / 2
+    return np.nan
+
+
+class QuoteReducer:
+    """Constant memory accumulator of the quotes of one ticker, fed in timestamp order
+
+    end is the window end in ns, it closes the time weight of the last quote.
+    """
+    def __init__(self, ticker: str, end: Optional[int] = None):
+        self.ticker = ticker
+        self.end = int(end) if end is not None else None
+        self.count = 0
+        self.bids = Counter()
+        self.asks = Counter()
+        self.spread_sum = 0.0
+        self.first_ts = None
+        self.last_ts = None
+        self._last_mid = None
+        self._weighted_mid = 0.0
+        self._weight = 0
+        self._mid_sum = 0.0
+
+    def add(self, quote: dict):
+        bid, ask, ts = quote.get("bid_price"), quote.get("ask_price"), quote["sip_timestamp"]
+        if bid is None or ask is None:
+            return
+        if self._last_mid is not None:
+            self._weighted_mid += self._last_mid * (ts - self.last_ts)
+            self._weight += ts - self.last_ts
+        mid = (bid + ask) / 2
+        self.count += 1
+        self.bids[bid] += 1
+        self.asks[ask] += 1
+        self.spread_sum += ask - bid
+        self._mid_sum += mid
+        self.first_ts = ts if self.first_ts is None else self.first_ts
+        self.last_ts = ts
+        self._last_mid = mid
+
+    def add_page(self, results: list):
+        for quote in results:
+            self.add(quote)
+
+    def twap_mid(self) -> float:
+        if self.count == 0:
+            return np.nan
+        weighted, weight = self._weighted_mid, self._weight
+        if self.end is not None and self.end > self.last_ts:
+            weighted += self._last_mid * (self.end - self.last_ts)
+            weight += self.end - self.last_ts
+        # a single instant (or identical timestamps) has no duration, fall back to the plain mean
+        return weighted / weight if weight > 0 else self._mid_sum / self.count
+
+    def summary(self) -> NBBOSummary:
+        to_ts = lambda ns: pd.Timestamp(ns, unit="ns", tz="UTC").tz_convert("America/New_York") if ns is not None else None
+        return NBBOSummary(
+            ticker = self.ticker,
+            count = self.count,
+            median_bid = counter_median(self.bids),
+            median_ask = counter_median(self.asks),
+            twap_mid = self.twap_mid(),
+            mean_spread_width = self.spread_sum / self.count if self.count else np.nan,
+            first_ts = to_ts(self.first_ts),
+            last_ts = to_ts(self.last_ts),
+        )
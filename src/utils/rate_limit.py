@@ -0,0 +1,39 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Thread safe token bucket: refills rate tokens per second, holds at most capacity tokens"""
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until tokens are available, reserving them if they already are"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        return self.wait_time(tokens) == 0.0
+
+    def acquire(self, tokens: float = 1):
+        """Block until tokens are available"""
+        while True:
+            wait = self.wait_time(tokens)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
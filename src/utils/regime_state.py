@@ -0,0 +1,187 @@
+"""Daily regime history of the live app, kept on disk between runs
+
+    state = RegimeState.load_or_new("regime_state.json", ["I:VIX1D", "SPY"])
+    state.update(client, yesterday)
+    state.save("regime_state.json")
+    state.vol("I:VIX1D"), state.trend("SPY")
+
+Per ticker the file holds the last VOL_SLOW_WINDOW daily closes with their dates and
+the running window sums of a StreamingRegime. update() only requests the trading
+days after the last stored one, so a morning run is one small daily-bars request per
+ticker at most (none when the state is already current). The stored dates must follow
+the ticker's own calendar (Cboe's for I: indices, the exchange's otherwise). Index bars
+are occasionally not published for a session, so up to MAX_CALENDAR_GAPS mismatches in
+the window are tolerated and logged; a state with more is rebuilt from a fresh download.
+"""
+import os
+import json
+import pandas as pd
+from collections import deque
+from datetime import date as Date, timedelta
+from typing import Callable, Optional
+from termcolor import cprint
+from utils.date_util import schedule_trading_dates
+from utils.signals import StreamingRegime, VOL_SLOW_WINDOW
+
+# calendar days requested when building a state from scratch, enough for the longest window
+BOOTSTRAP_DAYS = 2 * VOL_SLOW_WINDOW
+INDEX_CALENDAR = "CBOE_Index_Options"
+# sessions missing from (or dates outside) a ticker's calendar within the stored window
+MAX_CALENDAR_GAPS = 3
+
+
+def calendar_of(ticker: str, exchange: str = "NYSE") -> str:
+    return INDEX_CALENDAR if ticker.startswith("I:") else exchange
+
+
+class RegimeContinuityError(ValueError):
+    pass
+
+
+def _warn(message: str):
+    cprint(message, "yellow")
+
+
+class RegimeState:
+    """log receives the gap / rebuild diagnostics, e.g. Alerts.warning in the live app"""
+    def __init__(self, tickers: list, exchange: str = "NYSE", log: Optional[Callable[[str], None]] = None):
+        self.exchange = exchange
+        self.log = log or _warn
+        self.regimes = {ticker: StreamingRegime() for ticker in tickers}
+        self.dates = {ticker: deque(maxlen=VOL_SLOW_WINDOW) for ticker in tickers}
+
+    def sessions(self, ticker: str, start, end) -> list:
+        return [pd.Timestamp(d).date() for d in schedule_trading_dates(calendar_of(ticker, self.exchange), start, end)]
+
+    def last_date(self, ticker: str) -> Optional[Date]:
+        return self.dates[ticker][-1] if self.dates[ticker] else None
+
+    def trend(self, ticker: str) -> int:
+        return self.regimes[ticker].trend()
+
+    def vol(self, ticker: str) -> int:
+        return self.regimes[ticker].vol()
+
+    def last_close(self, ticker: str) -> float:
+        return self.regimes[ticker].closes[-1]
+
+    def validate(self, ticker: str) -> list:
+        """Stored dates must be increasing sessions of the ticker's calendar, returns the tolerated mismatches"""
+        dates = list(self.dates[ticker])
+        if len(dates) != len(self.regimes[ticker].closes):
+            raise RegimeContinuityError(f"{ticker}: {len(dates)} dates for {len(self.regimes[ticker].closes)} closes")
+        unordered = [later for earlier, later in zip(dates, dates[1:]) if later <= earlier]
+        if unordered:
+            raise RegimeContinuityError(f"{ticker}: stored dates out of order at {[str(d) for d in unordered]}")
+        if not dates:
+            return []
+        sessions = self.sessions(ticker, dates[0], dates[-1])
+        mismatched = sorted(set(sessions).symmetric_difference(dates))
+        if len(mismatched) > MAX_CALENDAR_GAPS:
+            raise RegimeContinuityError(
+                f"{ticker}: stored dates {dates[0]} - {dates[-1]} differ from the {calendar_of(ticker, self.exchange)} calendar "
+                f"on {len(mismatched)} days (at most {MAX_CALENDAR_GAPS}): missing sessions {[str(d) for d in sorted(set(sessions) - set(dates))]}, "
+                f"non-sessions {[str(d) for d in sorted(set(dates) - set(sessions))]}")
+        return mismatched
+
+    def _append(self, ticker: str, day: Date, close: float):
+        self.regimes[ticker].update(close)
+        self.dates[ticker].append(day)
+
+    @staticmethod
+    def _daily_closes(client, ticker: str, start, end) -> pd.Series:
+        daily = client.get_ticker_data(ticker, start, end, "day")
+        dates = pd.to_datetime(daily.index, unit="ms", utc=True).tz_convert("America/New_York").date
+        return pd.Series(daily["c"].to_numpy(dtype=float), index=dates)
+
+    def rebuild(self, client, ticker: str, through):
+        """Refill the state of ticker from the last BOOTSTRAP_DAYS of daily bars"""
+        through = pd.Timestamp(through).date()
+        closes = self._daily_closes(client, ticker, through - timedelta(days=BOOTSTRAP_DAYS), through)
+        self.regimes[ticker] = StreamingRegime()
+        self.dates[ticker].clear()
+        for day, close in closes.items():
+            self._append(ticker, day, close)
+
+    def update(self, client, through) -> dict:
+        """Append the sessions missing up to through (the previous trading day), returns the days added per ticker"""
+        through = pd.Timestamp(through).date()
+        added = {}
+        for ticker in self.regimes:
+            last = self.last_date(ticker)
+            if last is None:
+                self.rebuild(client, ticker, through)
+                added[ticker] = len(self.dates[ticker])
+                continue
+            missing = self.sessions(ticker, last + timedelta(days=1), through) if last < through else []
+            if not missing:
+                added[ticker] = 0
+                continue
+            closes = self._daily_closes(client, ticker, missing[0], missing[-1])
+            closes = closes[[day > last for day in closes.index]]
+            if list(closes.index) != missing:
+                self.log(f"{ticker}: no daily bar for sessions {[str(d) for d in sorted(set(missing) - set(closes.index))]}, "
+                      f"bars outside the calendar {[str(d) for d in sorted(set(closes.index) - set(missing))]}")
+            for day, close in closes.items():
+                self._append(ticker, day, close)
+            try:
+                self.validate(ticker)
+            except RegimeContinuityError as e:
+                # too many gaps would shift the windows, start over instead
+                self.log(f"{e}, rebuilding the regime state")
+                self.rebuild(client, ticker, through)
+                added[ticker] = len(self.dates[ticker])
+                continue
+            added[ticker] = len(closes)
+        return added
+
+    def save(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"exchange": self.exchange,
+                "tickers": {ticker: {"dates": [d.isoformat() for d in self.dates[ticker]], **regime.to_dict()}
+                            for ticker, regime in self.regimes.items()}}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, validate: bool = True, log: Optional[Callable[[str], None]] = None) -> "RegimeState":
+        with open(path) as f:
+            data = json.load(f)
+        state = cls(list(data["tickers"]), data["exchange"], log)
+        for ticker, series in data["tickers"].items():
+            state.regimes[ticker] = StreamingRegime.from_dict(series)
+            state.dates[ticker].extend(pd.Timestamp(d).date() for d in series["dates"])
+            if validate:
+                state.validate(ticker)
+        return state
+
+    @classmethod
+    def load_or_new(cls, path: str, tickers: list, exchange: str = "NYSE", log: Optional[Callable[[str], None]] = None) -> "RegimeState":
+        """Stored state of tickers; a ticker missing, or with more calendar gaps than tolerated, starts empty,
+        as does the whole state when it was kept on another exchange calendar"""
+        log = log or _warn
+        try:
+            state = cls.load(path, validate=False, log=log)
+        except FileNotFoundError:
+            return cls(tickers, exchange, log)
+        except (ValueError, KeyError) as e:
+            log(f"Discarding regime state {path}: {e}")
+            return cls(tickers, exchange, log)
+        if state.exchange != exchange:
+            log(f"Discarding regime state {path}: kept on the {state.exchange} calendar, {exchange} requested")
+            return cls(tickers, exchange, log)
+        for ticker in tickers:
+            if ticker in state.regimes:
+                try:
+                    mismatched = state.validate(ticker)
+                    if mismatched:
+                        log(f"{ticker}: regime state kept, calendar mismatches on {[str(d) for d in mismatched]}")
+                    continue
+                except RegimeContinuityError as e:
+                    log(f"Discarding the {ticker} regime state of {path}: {e}")
+            state.regimes[ticker] = StreamingRegime()
+            state.dates[ticker] = deque(maxlen=VOL_SLOW_WINDOW)
+        return state
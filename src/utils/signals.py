@@ -0,0 +1,138 @@
+"""Regime signals shared by the backtest and the live scripts
+
+trend regime: 1 if close > trailing mean of closes (uptrend), else 0
+vol regime:   1 if fast mean of closes > slow mean of closes (vol rising), else 0
+
+Windows without enough history give NaN means and therefore regime 0,
+matching the original pandas rolling/apply implementation.
+"""
+import numpy as np
+import pandas as pd
+from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
+
+TREND_WINDOW = 20
+VOL_FAST_WINDOW = 20
+VOL_SLOW_WINDOW = 60
+
+
+def rolling_mean(values, window: int) -> np.ndarray:
+    """Trailing mean over window observations, NaN until the window is full"""
+    values = np.asarray(values, dtype=np.float64)
+    mean = np.full(len(values), np.nan)
+    if len(values) >= window:
+        mean[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return mean
+
+
+def trend_regime(close, window: int = TREND_WINDOW) -> np.ndarray:
+    close = np.asarray(close, dtype=np.float64)
+    return (close > rolling_mean(close, window)).astype(np.int8)
+
+
+def vol_regime(close, fast: int = VOL_FAST_WINDOW, slow: int = VOL_SLOW_WINDOW) -> np.ndarray:
+    return (rolling_mean(close, fast) > rolling_mean(close, slow)).astype(np.int8)
+
+
+class StreamingRegime:
+    """Incremental trend/vol regime of a single close series
+
+    Keeps the last max(window) closes and one running sum per window, so every
+    update and query is O(1). Feeding the same closes as the vectorized
+    functions gives the same regimes.
+    """
+    def __init__(self, trend_window: int = TREND_WINDOW, vol_fast: int = VOL_FAST_WINDOW, vol_slow: int = VOL_SLOW_WINDOW):
+        self.trend_window = trend_window
+        self.vol_fast = vol_fast
+        self.vol_slow = vol_slow
+        self.windows = sorted({trend_window, vol_fast, vol_slow})
+        self.closes = deque(maxlen=self.windows[-1])
+        self.sums = {w: 0.0 for w in self.windows}
+
+    @classmethod
+    def from_closes(cls, closes, **windows) -> "StreamingRegime":
+        state = cls(**windows)
+        for close in closes:
+            state.update(close)
+        return state
+
+    def to_dict(self) -> dict:
+        return {"windows": {"trend_window": self.trend_window, "vol_fast": self.vol_fast, "vol_slow": self.vol_slow},
+                "closes": list(self.closes), "sums": {str(w): s for w, s in self.sums.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StreamingRegime":
+        """Restore a to_dict() state, the running sums are recomputed if they drifted from the closes"""
+        state = cls(**data["windows"])
+        state.closes.extend(float(c) for c in data["closes"])
+        closes = np.asarray(state.closes, dtype=np.float64)
+        for w in state.windows:
+            exact = float(closes[-w:].sum()) if len(closes) >= w else float(closes.sum())
+            stored = float(data["sums"].get(str(w), np.nan))
+            state.sums[w] = stored if np.isclose(stored, exact, rtol=1e-9, atol=1e-9) else exact
+        return state
+
+    def _dropped(self, window: int) -> float:
+        """Close leaving the window when a new close is appended"""
+        return self.closes[-window] if len(self.closes) >= window else 0.0
+
+    def update(self, close: float):
+        close = float(close)
+        for w in self.windows:
+            self.sums[w] += close - self._dropped(w)
+        self.closes.append(close)
+
+    def mean(self, window: int) -> float:
+        return self.sums[window] / window if len(self.closes) >= window else np.nan
+
+    def trend(self) -> int:
+        if not self.closes:
+            return 0
+        return int(self.closes[-1] > self.mean(self.trend_window))
+
+    def vol(self) -> int:
+        return int(self.mean(self.vol_fast) > self.mean(self.vol_slow))
+
+    def peek_trend(self, close: float) -> int:
+        """Trend regime if close were appended, without changing the state"""
+        w = self.trend_window
+        if len(self.closes) + 1 < w:
+            return 0
+        return int(close > (self.sums[w] - self._dropped(w) + close) / w)
+
+
+class TrendRegime:
+    """Trend regime precomputed from a single daily history load
+
+    The backtest asks every morning "what is the regime if the 9:35 bar is appended to
+    the history up to yesterday". Prefix sums of the closes answer that in O(1).
+    """
+    def __init__(self, daily: pd.DataFrame, window: int = TREND_WINDOW):
+        dates = pd.to_datetime(daily.index, unit="ms", utc=True).tz_convert("America/New_York").date
+        self.dates = np.array(dates, dtype="datetime64[D]")
+        self.closes = daily["c"].to_numpy(dtype=np.float64)
+        self.window = window
+        self._csum = np.concatenate([[0.0], np.cumsum(self.closes)])
+        self.mean = rolling_mean(self.closes, window)
+        self.regime = trend_regime(self.closes, window)
+
+    def series(self) -> pd.Series:
+        return pd.Series(self.regime, index=pd.Index(self.dates.astype(object), name="date"), name="regime")
+
+    def _count_until(self, date) -> int:
+        """Number of daily bars dated on or before date"""
+        return int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date).date(), "D"), side="right"))
+
+    def regime_at(self, date) -> int:
+        """Regime as of the close of date"""
+        i = self._count_until(date)
+        return int(self.regime[i - 1]) if i else 0
+
+    def regime_with_intraday(self, prior_day, close: float) -> int:
+        """Regime after appending an intraday close to the history up to prior_day"""
+        i = self._count_until(prior_day)
+        n = self.window - 1
+        if i < n:
+            return 0
+        mean = (self._csum[i] - self._csum[i - n] + close) / self.window
+        return int(close > mean)
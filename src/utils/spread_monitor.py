@@ -0,0 +1,75 @@
+"""P&L and risk of an open credit spread, updated tick by tick
+
+The IBKR app feeds the latest leg mids and spot on every market data event. Each
+update is O(1): the spread mark, P&L and distance to the short strike are recomputed
+from the three latest prices. Reports are throttled to one per interval seconds,
+while the stop-loss / take-profit checks run on every tick.
+
+    stop_loss:   exit once the loss reaches this fraction of the credit (1.0 = loss of the full credit)
+    take_profit: exit once the profit reaches this fraction of the credit (0.5 = half the credit kept)
+"""
+import time
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class SpreadState:
+    mark: float           # cost to close: short mid - long mid
+    pnl: float            # $ for the whole position
+    pnl_percent: float    # of the credit received
+    spot: float
+    distance_from_short_strike: float  # % of spot, negative once the short strike is breached
+    exit_reason: Optional[str] = None
+
+
+class SpreadMonitor:
+    def __init__(self, right: str, short_strike: float, long_strike: float, credit: float, size: int = 1,
+                 multiplier: int = 100, interval: float = 10, stop_loss: Optional[float] = None, take_profit: Optional[float] = None):
+        if right not in ("P", "C"):
+            raise ValueError("right must be 'P' or 'C'")
+        self.right = right
+        self.short_strike = short_strike
+        self.long_strike = long_strike
+        self.credit = credit
+        self.size = size
+        self.multiplier = multiplier
+        self.interval = interval
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.state = None
+        self.exited = False
+        self._last_report = -np.inf
+
+    def compute(self, short_mid: float, long_mid: float, spot: float) -> SpreadState:
+        mark = short_mid - long_mid
+        pnl = (self.credit - mark) * self.multiplier * self.size
+        distance = (spot - self.short_strike) if self.right == "P" else (self.short_strike - spot)
+        return SpreadState(mark, pnl, round((self.credit - mark) / self.credit * 100, 2) if self.credit else np.nan,
+                           spot, round(distance / spot * 100, 2) if spot else np.nan)
+
+    def exit_reason(self, state: SpreadState) -> Optional[str]:
+        profit_fraction = (self.credit - state.mark) / self.credit if self.credit else np.nan
+        if self.stop_loss is not None and profit_fraction <= -self.stop_loss:
+            return "stop_loss"
+        if self.take_profit is not None and profit_fraction >= self.take_profit:
+            return "take_profit"
+        return None
+
+    def update(self, short_mid: float, long_mid: float, spot: float, now: Optional[float] = None) -> tuple:
+        """(state, report) for the latest prices; report is True when a throttled update is due
+        or an exit fired. The state is None while a price is missing."""
+        if self.exited or np.isnan(short_mid) or np.isnan(long_mid) or np.isnan(spot):
+            return None, False
+        now = time.monotonic() if now is None else now
+        state = self.compute(short_mid, long_mid, spot)
+        state.exit_reason = self.exit_reason(state)
+        self.state = state
+        if state.exit_reason is not None:
+            self.exited = True
+            return state, True
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            return state, True
+        return state, False
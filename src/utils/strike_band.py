@@ -0,0 +1,181 @@
+"""Minute bars of every strike in a band around the open
+
+For a (date, expiration, right) the loader requests the minute bars of all SPXW
+strikes within band_pct of the spot in one concurrent batch and keeps them as a
+strike x minute close matrix. Any short/long pair inside the band is then priced
+with an array subtraction, so changing the strike logic or the spread width never
+needs another round trip.
+
+Bands of finalised dates are written to <root>/bands/... and reused by any later
+request whose band they cover.
+"""
+import os
+import asyncio
+import threading
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Optional
+from utils.cache import last_final_date, to_date
+from utils.chain_reference import ChainReference
+from utils.polygon import PolygonClient
+from utils.polygon_async import AsyncPolygonClient
+
+
+def align(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """values at times -> values on the sorted grid (NaN where there is no bar)"""
+    aligned = np.full(len(grid), np.nan)
+    if len(times) and len(grid):
+        pos = np.searchsorted(grid, times)
+        hit = (pos < len(grid)) & (grid[np.minimum(pos, len(grid) - 1)] == times)
+        aligned[pos[hit]] = values[hit]
+    return aligned
+
+
+@dataclass
+class StrikeBand:
+    """Closes of a band of strikes: prices[i, j] is strike i at minute j (NaN without a bar)"""
+    date: str
+    expiration: str
+    right: str
+    band_low: float
+    band_high: float
+    strikes: np.ndarray  # (K,) sorted
+    tickers: np.ndarray  # (K,)
+    minutes: np.ndarray  # (T,) epoch ms, union of the bar timestamps
+    prices: np.ndarray   # (K, T)
+
+    def covers(self, low: float, high: float) -> bool:
+        return self.band_low <= low and high <= self.band_high
+
+    def contains(self, strike: float) -> bool:
+        return self.band_low <= strike <= self.band_high and bool(np.isin(strike, self.strikes))
+
+    def row(self, strike: float) -> int:
+        i = int(np.searchsorted(self.strikes, strike))
+        if i == len(self.strikes) or self.strikes[i] != strike:
+            raise KeyError(f"strike {strike} is not in the {self.right} band [{self.band_low}, {self.band_high}] of {self.date}")
+        return i
+
+    def spread(self, short_strike: float, long_strike: float) -> np.ndarray:
+        """short - long close per minute, NaN unless both legs traded that minute"""
+        return self.prices[self.row(short_strike)] - self.prices[self.row(long_strike)]
+
+    def spread_series(self, short_strike: float, long_strike: float) -> pd.Series:
+        """spread() over the minutes both legs traded, indexed in New York time like load_spread_value"""
+        spread = self.spread(short_strike, long_strike)
+        traded = ~np.isnan(spread)
+        index = pd.to_datetime(self.minutes[traded], unit="ms", utc=True).tz_convert("America/New_York")
+        return pd.Series(spread[traded], index=index)
+
+    def sliced(self, low: float, high: float) -> "StrikeBand":
+        keep = (self.strikes >= low) & (self.strikes <= high)
+        return StrikeBand(self.date, self.expiration, self.right, low, high,
+                          self.strikes[keep], self.tickers[keep], self.minutes, self.prices[keep])
+
+    def on_grid(self, grid: np.ndarray) -> "StrikeBand":
+        """Same band on another (sorted, epoch ms) minute axis"""
+        prices = np.array([align(self.minutes, row, grid) for row in self.prices]).reshape(len(self.strikes), len(grid))
+        return StrikeBand(self.date, self.expiration, self.right, self.band_low, self.band_high,
+                          self.strikes, self.tickers, grid, prices)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp_path, date=self.date, expiration=self.expiration, right=self.right,
+                 band=np.array([self.band_low, self.band_high]), strikes=self.strikes, tickers=self.tickers,
+                 minutes=self.minutes, prices=self.prices)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "StrikeBand":
+        with np.load(path) as data:
+            return cls(str(data["date"]), str(data["expiration"]), str(data["right"]), float(data["band"][0]), float(data["band"][1]),
+                       data["strikes"], data["tickers"], data["minutes"], data["prices"])
+
+
+class StrikeBandLoader:
+    """Fetch-once store of strike bands keyed by (underlying, date, expiration, right)
+
+    spot is the price the band is centred on (the open / entry price), band_pct its half width.
+    """
+    def __init__(self, client: PolygonClient, chains: ChainReference, root: Optional[str] = ".cache/polygon", band_pct: float = 0.03):
+        self.client = client
+        self.chains = chains
+        self.root = root
+        self.band_pct = band_pct
+        self._bands = {}
+        self._lock = threading.Lock()
+
+    def _path(self, underlying: str, date: str, expiration: str, right: str) -> str:
+        return os.path.join(self.root, "bands", underlying, self.chains.trading_class, expiration, f"{date}_{right}.npz")
+
+    def _persistable(self, date: str) -> bool:
+        return self.root is not None and to_date(date) <= last_final_date()
+
+    def bounds(self, spot: float, band_pct: Optional[float] = None) -> tuple:
+        band_pct = self.band_pct if band_pct is None else band_pct
+        return spot * (1 - band_pct), spot * (1 + band_pct)
+
+    def _lookup(self, key: tuple) -> Optional[StrikeBand]:
+        with self._lock:
+            if key in self._bands:
+                return self._bands[key]
+        if self._persistable(key[1]) and os.path.exists(self._path(*key)):
+            band = StrikeBand.load(self._path(*key))
+            with self._lock:
+                self._bands[key] = band
+            return band
+        return None
+
+    async def aget(self, aclient: AsyncPolygonClient, underlying: str, date: str, expiration: str, right: str,
+                   spot: float, band_pct: Optional[float] = None) -> StrikeBand:
+        """Band of `right` strikes within band_pct of spot, fetching all its contracts concurrently"""
+        key = (underlying, date, expiration, right)
+        low, high = self.bounds(spot, band_pct)
+        band = self._lookup(key)
+        if band is not None and band.covers(low, high):
+            return band.sliced(low, high)
+        elif band is not None:
+            # widen to the union, strikes fetched before come from the aggregates cache
+            low, high = min(low, band.band_low), max(high, band.band_high)
+
+        chain = await self.chains.aget(aclient, underlying, date, expiration, right)
+        keep = (chain.strikes >= low) & (chain.strikes <= high)
+        strikes, tickers = chain.strikes[keep], chain.tickers[keep]
+        bars = await aclient.get_tickers_data(list(tickers), date, date, "minute")
+
+        times = [bars[t].index.to_numpy(dtype=np.int64) for t in tickers]
+        minutes = np.unique(np.concatenate(times)) if times else np.empty(0, dtype=np.int64)
+        prices = np.array([align(t, bars[ticker]["c"].to_numpy(dtype=np.float64) if len(t) else np.empty(0), minutes)
+                           for t, ticker in zip(times, tickers)]).reshape(len(tickers), len(minutes))
+        band = StrikeBand(date, expiration, right, low, high, strikes, tickers, minutes, prices)
+
+        if self._persistable(date):
+            band.save(self._path(*key))
+        with self._lock:
+            self._bands[key] = band
+        return band.sliced(*self.bounds(spot, band_pct))
+
+    def get(self, underlying: str, date: str, expiration: str, right: str, spot: float, band_pct: Optional[float] = None) -> StrikeBand:
+        """aget() on its own event loop, for thread pool callers"""
+        return self.get_rights(underlying, date, expiration, [right], spot, band_pct)[right]
+
+    def get_rights(self, underlying: str, date: str, expiration: str, rights: list, spot: float,
+                   band_pct: Optional[float] = None) -> dict:
+        """right -> band for several rights, the uncached ones fetched concurrently on one event loop"""
+        low, high = self.bounds(spot, band_pct)
+        result = {}
+        for right in rights:
+            band = self._lookup((underlying, date, expiration, right))
+            if band is not None and band.covers(low, high):
+                result[right] = band.sliced(low, high)
+        missing = [right for right in rights if right not in result]
+        if not missing:
+            return result
+
+        async def fetch():
+            async with AsyncPolygonClient.from_client(self.client) as aclient:
+                return await asyncio.gather(*(self.aget(aclient, underlying, date, expiration, right, spot, band_pct) for right in missing))
+        result.update(zip(missing, asyncio.run(fetch())))
+        return result
@@ -0,0 +1,163 @@
+"""Vectorized parameter sweep for the 0DTE credit spread
+
+A day is loaded once (SPX, VIX1D and SPY minute bars plus the StrikeBand of every
+SPXW strike within a band around the open) onto a fixed 09:30-16:00 minute grid.
+A whole grid of expected move scalars, spread widths and entry times is then
+evaluated with NumPy indexing on those arrays, no further requests needed.
+
+Widths are counted in strikes, 1 is the adjacent strike as in the backtest.
+"""
+import asyncio
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Optional
+from utils.signals import TrendRegime
+from utils.strike_band import StrikeBand, StrikeBandLoader, align
+
+SESSION_OPEN = "09:30"
+SESSION_CLOSE = "16:00"
+ANNUALIZATION = np.sqrt(252)
+
+
+def session_grid(date: str) -> np.ndarray:
+    """Epoch ms of every minute bar start of the regular session"""
+    day = pd.Timestamp(date).tz_localize("America/New_York")
+    minutes = pd.date_range(day + pd.Timedelta(SESSION_OPEN + ":00"), day + pd.Timedelta(SESSION_CLOSE + ":00"), freq="1min")
+    return ((minutes.tz_convert("UTC").tz_localize(None) - pd.Timestamp("1970-01-01")) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+
+
+def to_grid(bars: pd.DataFrame, grid: np.ndarray, column: str = "c") -> np.ndarray:
+    """Bars indexed by epoch ms -> values on the minute grid (NaN where there is no bar)"""
+    if not len(bars):
+        return np.full(len(grid), np.nan)
+    return align(bars.index.to_numpy(dtype=np.int64), bars[column].to_numpy(dtype=np.float64), grid)
+
+
+@dataclass
+class SweepDay:
+    date: str
+    prior_day: str
+    minutes: np.ndarray      # (T,) epoch ms
+    spx: np.ndarray          # (T,)
+    vix: np.ndarray          # (T,)
+    spy: np.ndarray          # (T,)
+    calls: StrikeBand        # (Kc, T) on the same grid
+    puts: StrikeBand         # (Kp, T)
+
+
+async def load_sweep_day(aclient, bands: StrikeBandLoader, date: str, prior_day: str, band_pct: Optional[float] = None,
+                         ticker: str = "I:SPX", index_ticker: str = "I:VIX1D", etf_ticker: str = "SPY", options_ticker: str = "SPX") -> SweepDay:
+    """Every bar a sweep over this day can touch, requested concurrently"""
+    grid = session_grid(date)
+    bars = await aclient.get_tickers_data([ticker, index_ticker, etf_ticker], date, date, "minute")
+    spx = to_grid(bars[ticker], grid)
+    spot = spx[~np.isnan(spx)][0]
+    calls, puts = await asyncio.gather(bands.aget(aclient, options_ticker, date, date, "call", spot, band_pct),
+                                       bands.aget(aclient, options_ticker, date, date, "put", spot, band_pct))
+
+    return SweepDay(date, prior_day, grid, spx, to_grid(bars[index_ticker], grid), to_grid(bars[etf_ticker], grid),
+                    calls.on_grid(grid), puts.on_grid(grid))
+
+
+def first_valid(valid: np.ndarray) -> tuple:
+    """(index of the first True along the last axis, any True)"""
+    return valid.argmax(axis=-1), valid.any(axis=-1)
+
+
+def evaluate_day(day: SweepDay, scalars, widths, entry_times, trend_regime: TrendRegime, rvrp_ma_shifted: Optional[float] = None) -> pd.DataFrame:
+    """P&L of every (entry_time, scalar, width) combination for one day
+
+    Matches the backtest: the short leg is the first strike beyond price * (1 +/- expected move),
+    the long leg `width` strikes further out, cost is the first spread value at or after
+    the entry minute with both legs trading, final value the last one of the day.
+    With rvrp_ma_shifted the RVRP expected move is used instead of the VIX1D one.
+    """
+    scalars = np.asarray(scalars, dtype=np.float64)
+    widths = np.asarray(widths, dtype=np.int64)
+    minute_of_day = pd.to_datetime(day.minutes, unit="ms", utc=True).tz_convert("America/New_York")
+    minute_of_day = np.asarray(minute_of_day.hour * 60 + minute_of_day.minute)
+    rows = []
+
+    for entry_time in entry_times:
+        entry = pd.Timestamp(entry_time)
+        after_entry = minute_of_day >= entry.hour * 60 + entry.minute
+        te_spx, ok_spx = first_valid(after_entry & ~np.isnan(day.spx))
+        te_vix, ok_vix = first_valid(after_entry & ~np.isnan(day.vix))
+        if not (ok_spx and ok_vix):
+            continue
+        price, vix = day.spx[te_spx], day.vix[te_vix]
+
+        te_spy, ok_spy = first_valid(after_entry & ~np.isnan(day.spy))
+        if ok_spy:
+            direction = trend_regime.regime_with_intraday(day.prior_day, day.spy[te_spy])
+        else:
+            direction = trend_regime.regime_at(day.prior_day)
+
+        if rvrp_ma_shifted is None:
+            expected_move = (round(vix / ANNUALIZATION, 2) / 100) * scalars
+        else:
+            expected_move = scalars * (vix - rvrp_ma_shifted) / (100 * ANNUALIZATION)
+
+        # (S,) short strike index, (S, W) long strike index
+        if direction == 0:
+            target = np.round(price * (1 + expected_move))
+            band = day.calls
+            short_idx = np.searchsorted(band.strikes, target, side="left")
+            long_idx = short_idx[:, None] + widths[None, :]
+        else:
+            target = np.round(price * (1 - expected_move))
+            band = day.puts
+            short_idx = np.searchsorted(band.strikes, target, side="right") - 1
+            long_idx = short_idx[:, None] - widths[None, :]
+        strikes, prices = band.strikes, band.prices
+        short_idx = np.broadcast_to(short_idx[:, None], long_idx.shape)
+        in_band = ((target >= band.band_low) & (target <= band.band_high))[:, None]
+        selectable = in_band & (short_idx >= 0) & (short_idx < len(strikes)) & (long_idx >= 0) & (long_idx < len(strikes))
+
+        safe_short = np.where(selectable, short_idx, 0)
+        safe_long = np.where(selectable, long_idx, 0)
+        spread = prices[safe_short] - prices[safe_long] if len(strikes) else np.full(short_idx.shape + (len(day.minutes),), np.nan)
+        traded = ~np.isnan(spread)
+        entry_col, has_entry = first_valid(traded & after_entry)
+        last_col = traded.shape[-1] - 1 - traded[..., ::-1].argmax(axis=-1)
+        cost = np.take_along_axis(spread, entry_col[..., None], axis=-1)[..., 0]
+        final_value = np.take_along_axis(spread, last_col[..., None], axis=-1)[..., 0]
+        valid = selectable & has_entry
+        cost = np.where(valid, cost, np.nan)
+        final_value = np.where(valid, final_value, np.nan)
+
+        n_scalars, n_widths = long_idx.shape
+        rows.append(pd.DataFrame({
+            "date": day.date,
+            "entry_time": entry.strftime("%H:%M"),
+            "scalar": np.repeat(scalars, n_widths),
+            "width": np.tile(widths, n_scalars),
+            "direction": direction,
+            "short_strike": np.where(valid, strikes[safe_short] if len(strikes) else np.nan, np.nan).ravel(),
+            "long_strike": np.where(valid, strikes[safe_long] if len(strikes) else np.nan, np.nan).ravel(),
+            "cost": cost.ravel(),
+            "final_value": final_value.ravel(),
+        }))
+
+    if not rows:
+        return pd.DataFrame()
+    results = pd.concat(rows, ignore_index=True)
+    results["gross_pnl"] = results["cost"] - results["final_value"]
+    return results
+
+
+def evaluate_grid(days: list, scalars, widths, entry_times, trend_regime: TrendRegime, rvrp_ma_shifted: Optional[pd.Series] = None) -> pd.DataFrame:
+    """Tidy results over all days, one row per (date, entry_time, scalar, width)"""
+    frames = []
+    for day in days:
+        ma = None if rvrp_ma_shifted is None else rvrp_ma_shifted.get(day.date, np.nan)
+        if ma is not None and np.isnan(ma):
+            continue
+        frames.append(evaluate_day(day, scalars, widths, entry_times, trend_regime, ma))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def results_cube(results: pd.DataFrame, value: str = "gross_pnl") -> pd.DataFrame:
+    """parameter x day matrix: rows (scalar, width, entry_time), columns date"""
+    return results.pivot_table(index=["scalar", "width", "entry_time"], columns="date", values=value)
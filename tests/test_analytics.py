@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import analytics
+
+
+@pytest.fixture
+def trades() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    n = 250
+    cost = rng.uniform(0.2, 1.5, n)
+    final = np.where(rng.random(n) < 0.85, 0.0, rng.uniform(0, 7, n))
+    return pd.DataFrame({"cost": cost, "final_price": final, "gross_pnl": cost - final,
+                         "gross_pnl_percent": np.round((cost - final) / cost * 100, 2), "direction": rng.integers(0, 2, n)},
+                        index = pd.bdate_range("2023-05-01", periods = n, tz = "America/New_York"))
+
+
+def reference_sizing(all_trades: pd.DataFrame) -> pd.DataFrame:
+    """The row by row post-processing of the original backtest script"""
+    all_trades = all_trades.copy()
+    all_trades["max_loss"] = (5 - all_trades["cost"])
+    all_trades['gross_pnl'] = all_trades.apply(lambda row: row['max_loss']*-1 if (row['gross_pnl'] < row['max_loss']*-1) else row["gross_pnl"], axis=1)
+    all_trades["contracts"] = (5 / all_trades["max_loss"]).astype(int)
+    all_trades["max_loss"] = (all_trades["max_loss"]) * all_trades["contracts"]
+    all_trades["fees"] = all_trades["contracts"] * .04
+    all_trades["net_pnl"] = (all_trades["gross_pnl"] * all_trades["contracts"]) - all_trades["fees"]
+    all_trades["net_capital"] = 20000 + (all_trades["net_pnl"]*100).cumsum()
+    return all_trades
+
+
+def test_size_trades_matches_the_original_post_processing(trades):
+    sized = analytics.size_trades(trades)
+    pd.testing.assert_frame_equal(sized, reference_sizing(trades)[sized.columns])
+    assert (sized["gross_pnl"] >= -(5 - trades["cost"])).all()
+
+
+def test_size_trades_other_width(trades):
+    sized = analytics.size_trades(trades, width = 10, risk_budget = 10)
+    assert (sized["gross_pnl"] >= -(10 - trades["cost"]) - 1e-12).all()
+    assert (sized["contracts"] == (10 / (10 - trades["cost"])).astype(int)).all()
+
+
+def test_summary_total_return_is_on_the_starting_capital(trades):
+    sized = analytics.size_trades(trades)
+    stats = analytics.summary(sized)
+    assert stats["total_return_pct"] == round((sized["net_capital"].iloc[-1] - 20000) / 20000 * 100, 2)
+    assert stats["trades"] == len(trades)
+
+
+def test_longest_run():
+    assert analytics.longest_run(np.array([0, 1, 1, 0, 1, 1, 1, 0], dtype = bool)) == 3
+    assert analytics.longest_run(np.zeros(4, dtype = bool)) == 0
+
+
+def test_position_sizing_uses_the_width(trades):
+    narrow = analytics.position_sizing(trades, [0.02], n_paths = 200, seed = 1)
+    wide = analytics.position_sizing(trades, [0.02], width = 10, n_paths = 200, seed = 1)
+    # a wider spread puts more at risk per credit, each trade's return on risk shrinks
+    assert abs(wide.loc[0.02, "growth_per_trade"]) < abs(narrow.loc[0.02, "growth_per_trade"])
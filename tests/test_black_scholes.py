@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import black_scholes as bs
+
+
+def test_implied_vol_round_trip():
+    S = 5000.0
+    K = np.arange(4850.0, 5155.0, 25.0)[:, None, None]
+    T = np.array([bs.MIN_T, 1 / 365, 30 / 365])[None, :, None]
+    sigma = np.array([0.08, 0.2, 0.6])[None, None, :]
+    for is_call in (True, False):
+        prices = bs.price(S, K, T, sigma, r = 0.05, q = 0.01, is_call = is_call)
+        iv = bs.implied_vol(prices, S, K, T, r = 0.05, q = 0.01, is_call = is_call)
+        assert iv.shape == prices.shape
+        # away from the money, near expiry prices carry no time value and stay NaN
+        priced = ~np.isnan(iv)
+        np.testing.assert_allclose(bs.price(S, K, T, iv, 0.05, 0.01, is_call)[priced], prices[priced], atol = 1e-8)
+        atm = np.broadcast_to(K == S, prices.shape)
+        np.testing.assert_allclose(iv[atm], np.broadcast_to(sigma, prices.shape)[atm], rtol = 1e-6)
+        month = np.broadcast_to(T == 30 / 365, prices.shape)
+        assert priced[month].all()
+
+
+def test_implied_vol_is_nan_outside_the_bounds():
+    S, K, T = 5000.0, 4900.0, 1 / 365
+    # below intrinsic, above the underlying, not finite, no strike
+    iv = bs.implied_vol([90.0, 5001.0, np.nan, 5.0], S, [K, K, K, 0.0], T)
+    assert np.isnan(iv).all()
+
+
+def test_put_call_parity():
+    S, K, T, sigma, r, q = 5000.0, np.array([4900.0, 5000.0, 5100.0]), 0.1, 0.15, 0.04, 0.015
+    call = bs.price(S, K, T, sigma, r, q, True)
+    put = bs.price(S, K, T, sigma, r, q, False)
+    np.testing.assert_allclose(call - put, S * np.exp(-q * T) - K * np.exp(-r * T), atol = 1e-9)
+
+
+def test_erfc_fallback_matches_ndtr():
+    x = np.linspace(-8, 8, 401)
+    np.testing.assert_allclose(0.5 * bs._erfc(-x / np.sqrt(2)), bs.norm_cdf(x), atol = 2e-7)
+
+
+def test_year_fraction_to_the_close():
+    expiry = bs.expiry_close(["2024-03-12"])
+    one_hour_before = int(pd.Timestamp("2024-03-12 15:00", tz = "America/New_York").value // 1_000_000)
+    assert bs.year_fraction(one_hour_before, expiry)[0] == pytest.approx(3600 / bs.SECONDS_PER_YEAR)
+    assert bs.year_fraction(expiry[0], expiry)[0] == bs.MIN_T
@@ -0,0 +1,69 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from utils.cache import AggregatesCache, cacheMissException, covered_span, merge_intervals, subtract_intervals
+
+d = datetime.date
+
+
+def bars(dates, minutes = (0,)) -> pd.DataFrame:
+    """One bar per date (at 10:00 New York plus minutes), indexed by ms like Polygon"""
+    stamps = [pd.Timestamp(f"{day} 10:00", tz = "America/New_York") + pd.Timedelta(minutes = m) for day in dates for m in minutes]
+    index = pd.Index([int(ts.timestamp() * 1000) for ts in stamps], name = "t")
+    return pd.DataFrame({"c": np.arange(len(index), dtype = float)}, index = index)
+
+
+@pytest.mark.parametrize("covered, gaps", [
+    ([], [(d(2024, 3, 1), d(2024, 3, 31))]),
+    ([[d(2024, 3, 1), d(2024, 3, 31)]], []),
+    ([[d(2024, 2, 1), d(2024, 3, 10)]], [(d(2024, 3, 11), d(2024, 3, 31))]),
+    ([[d(2024, 3, 5), d(2024, 3, 10)], [d(2024, 3, 20), d(2024, 4, 5)]],
+     [(d(2024, 3, 1), d(2024, 3, 4)), (d(2024, 3, 11), d(2024, 3, 19))]),
+    ([[d(2024, 1, 1), d(2024, 1, 31)], [d(2024, 5, 1), d(2024, 5, 2)]], [(d(2024, 3, 1), d(2024, 3, 31))]),
+])
+def test_subtract_intervals(covered, gaps):
+    assert subtract_intervals(d(2024, 3, 1), d(2024, 3, 31), covered) == gaps
+
+
+def test_merge_intervals_joins_adjacent_days():
+    merged = merge_intervals([[d(2024, 3, 11), d(2024, 3, 15)], [d(2024, 3, 1), d(2024, 3, 10)], [d(2024, 3, 20), d(2024, 3, 21)]])
+    assert merged == [[d(2024, 3, 1), d(2024, 3, 15)], [d(2024, 3, 20), d(2024, 3, 21)]]
+
+
+def test_covered_span():
+    # bars through the last session, the trailing weekend is covered too
+    assert covered_span(d(2024, 3, 1), d(2024, 3, 31), [d(2024, 3, 1), d(2024, 3, 28)]) == (d(2024, 3, 1), d(2024, 3, 31))
+    # truncated response: only up to the day before the first session without bars
+    assert covered_span(d(2024, 3, 1), d(2024, 3, 31), [d(2024, 3, 1), d(2024, 3, 15)]) == (d(2024, 3, 1), d(2024, 3, 17))
+    # empty response for sessions marks nothing, for non-sessions (weekend + Good Friday) all of it
+    assert covered_span(d(2024, 3, 1), d(2024, 3, 31), []) is None
+    assert covered_span(d(2024, 3, 29), d(2024, 3, 31), []) == (d(2024, 3, 29), d(2024, 3, 31))
+
+
+def test_empty_fetch_is_refetched(tmp_path):
+    cache = AggregatesCache(str(tmp_path))
+    calls = []
+
+    def fetch(start, end):
+        calls.append((start, end))
+        return bars([]) if len(calls) == 1 else bars(["2024-03-11", "2024-03-12"])
+
+    assert cache.get("I:SPX", "2024-03-11", "2024-03-12", fetch).empty
+    assert cache.missing("I:SPX", "2024-03-11", "2024-03-12") == [(d(2024, 3, 11), d(2024, 3, 12))]
+    assert len(cache.get("I:SPX", "2024-03-11", "2024-03-12", fetch)) == 2
+    assert cache.get("I:SPX", "2024-03-11", "2024-03-12", fetch).equals(cache.read("I:SPX", "2024-03-11", "2024-03-12"))
+    assert len(calls) == 2
+
+
+def test_truncated_fetch_only_covers_returned_sessions(tmp_path):
+    cache = AggregatesCache(str(tmp_path))
+    cache.write("O:SPXW", bars(["2024-03-11", "2024-03-12"], minutes = range(3)), "2024-03-11", "2024-03-15", "minute")
+    assert cache.missing("O:SPXW", "2024-03-11", "2024-03-17", "minute") == [(d(2024, 3, 13), d(2024, 3, 17))]
+    assert len(cache.read("O:SPXW", "2024-03-11", "2024-03-15", "minute")) == 6
+
+
+def test_offline_miss_raises(tmp_path):
+    cache = AggregatesCache(str(tmp_path), offline = True)
+    with pytest.raises(cacheMissException):
+        cache.get("I:SPX", "2024-03-11", "2024-03-12", lambda start, end: bars([start]))
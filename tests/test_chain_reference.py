@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.chain_reference import StrikeIndex
+
+
+def chain(strikes) -> pd.DataFrame:
+    return pd.DataFrame({"ticker": [f"O:SPXW240312P0{int(k * 1000):07d}" for k in strikes], "strike_price": strikes})
+
+
+def test_lookups_match_the_original_filters():
+    rng = np.random.default_rng(0)
+    contracts = chain(rng.permutation(np.arange(4800.0, 5400.0, 5.0)))
+    index = StrikeIndex.from_contracts(contracts)
+    by_strike = contracts.sort_values("strike_price")
+    for price in (4999.0, 5000.0, 5000.5, 5105.0):
+        # call side: first two strikes at or above the upper price
+        otm_calls = by_strike[by_strike["strike_price"] >= price]
+        assert index.first_at_or_above(price, 0) == (otm_calls["strike_price"].iloc[0], otm_calls["ticker"].iloc[0])
+        assert index.first_at_or_above(price, 1)[0] == otm_calls["strike_price"].iloc[1]
+        # put side: two strikes closest below the lower price
+        otm_puts = contracts[contracts["strike_price"] <= price].assign(distance = lambda d: price - d["strike_price"]).sort_values("distance")
+        assert index.nth_at_or_below(price, 0) == (otm_puts["strike_price"].iloc[0], otm_puts["ticker"].iloc[0])
+        assert index.nth_at_or_below(price, 1)[0] == otm_puts["strike_price"].iloc[1]
+
+
+def test_out_of_range_raises():
+    index = StrikeIndex([5000.0, 5005.0], ["a", "b"])
+    with pytest.raises(IndexError):
+        index.first_at_or_above(5005.0, 1)
+    with pytest.raises(IndexError):
+        index.nth_at_or_below(5000.0, 1)
+    with pytest.raises(IndexError):
+        StrikeIndex([], []).first_at_or_above(5000.0)
+
+
+def test_other_trading_classes_are_dropped():
+    contracts = pd.concat([chain([5000.0, 5005.0]), pd.DataFrame({"ticker": ["O:SPX240315P05000000"], "strike_price": [5000.0]})])
+    index = StrikeIndex.from_contracts(contracts)
+    assert len(index) == 2
+    assert all("SPXW" in t for t in index.tickers)
+
+
+def test_save_load_round_trip(tmp_path):
+    index = StrikeIndex.from_contracts(chain([5010.0, 5000.0, 5005.0]))
+    path = str(tmp_path / "chains" / "put.npz")
+    index.save(path)
+    loaded = StrikeIndex.load(path)
+    np.testing.assert_array_equal(loaded.strikes, index.strikes)
+    np.testing.assert_array_equal(loaded.tickers, index.tickers)
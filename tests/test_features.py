@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.features import RVRPFeatureStore, session_features, ANNUALIZATION
+
+SCALAR = 0.5
+
+
+def reference(frame: pd.DataFrame, window: int = 21) -> pd.DataFrame:
+    """The original full-frame rolling computation"""
+    df = frame.copy()
+    df["rvrp"] = df["vix1d_935"] - df["realized_vol"]
+    df["rvrp_ma"] = df["rvrp"].rolling(window=window).mean()
+    df["rvrp_ma_shifted"] = df["rvrp_ma"].shift(1)
+    df["expected_move_rvrp"] = SCALAR * (df["vix1d_935"] - df["rvrp_ma_shifted"]) / (100 * np.sqrt(252))
+    return df
+
+
+def inputs(n: int = 80, missing=(30,)) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range("2024-01-02", periods = n).strftime("%Y-%m-%d")
+    df = pd.DataFrame({"realized_vol": rng.uniform(5, 20, n), "vix1d_935": rng.uniform(8, 25, n),
+                       "actual_move": rng.uniform(0, 0.1, n), "expected_move_original": rng.uniform(0, 0.01, n)},
+                      index = pd.Index(dates, name = "date"))
+    df.iloc[list(missing)] = np.nan
+    return df
+
+
+def filled(df: pd.DataFrame, window: int = 21, capacity: int = 512) -> RVRPFeatureStore:
+    store = RVRPFeatureStore(window, capacity)
+    for date, row in df.iterrows():
+        store.append(date, **row.to_dict())
+    return store
+
+
+def test_matches_rolling_mean_with_missing_days():
+    df = inputs()
+    # a small capacity also covers growing the arrays
+    frame = filled(df, capacity = 8).to_frame(SCALAR)
+    expected = reference(df)
+    for column in ("rvrp", "rvrp_ma", "rvrp_ma_shifted", "expected_move_rvrp"):
+        np.testing.assert_allclose(frame[column].to_numpy(), expected[column].to_numpy(), rtol = 1e-12, equal_nan = True)
+    # the NaN day leaves the mean undefined for one full window
+    assert frame["rvrp_ma"].iloc[30:51].isna().all() and not np.isnan(frame["rvrp_ma"].iloc[51])
+
+
+def test_next_expected_move_is_the_next_shifted_row():
+    df = inputs(missing = ())
+    store = filled(df.iloc[:-1])
+    expected = reference(df)
+    assert store.rvrp_ma() == pytest.approx(expected["rvrp_ma_shifted"].iloc[-1])
+    assert store.next_expected_move(df["vix1d_935"].iloc[-1], SCALAR) == pytest.approx(expected["expected_move_rvrp"].iloc[-1])
+
+
+def test_dates_must_increase():
+    store = RVRPFeatureStore()
+    store.append("2024-03-12", 10.0, 12.0)
+    assert str(store.last_date) == "2024-03-12"
+    with pytest.raises(ValueError):
+        store.append("2024-03-12", 10.0, 12.0)
+
+
+def test_save_load_round_trip(tmp_path):
+    store = filled(inputs())
+    path = str(tmp_path / "rvrp_features.npz")
+    store.save(path)
+    loaded = RVRPFeatureStore.load(path)
+    assert len(loaded) == len(store) and loaded.last_date == store.last_date
+    pd.testing.assert_frame_equal(loaded.to_frame(SCALAR), store.to_frame(SCALAR))
+    # appending after a load keeps the running window
+    loaded.append("2024-06-03", 10.0, 15.0)
+    store.append("2024-06-03", 10.0, 15.0)
+    assert loaded.rvrp_ma() == pytest.approx(store.rvrp_ma())
+
+
+def test_session_features():
+    index = pd.DatetimeIndex(["2024-03-12 09:35", "2024-03-12 09:36", "2024-03-12 09:37"])
+    spx = pd.DataFrame({"c": [5000.0, 5010.0, 4990.0]}, index = index)
+    vix = pd.DataFrame({"c": [12.0, 12.5, 13.2]}, index = index)
+    features = session_features(spx, vix)
+    log_diff = np.log(spx["c"]) - np.log(spx["c"].shift(1))
+    assert features["realized_vol"] == pytest.approx(np.sqrt((log_diff ** 2).sum()) * 100 * ANNUALIZATION)
+    assert features["vix1d_935"] == 12.0
+    assert features["actual_move"] == pytest.approx(0.1)
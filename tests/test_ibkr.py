@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+
+ib_async = pytest.importorskip("ib_async")
+from ib_async import Contract, OrderStatus, Trade
+from utils.ibkr import limit_prices
+
+
+@pytest.mark.parametrize("optimal, market, step, max_steps, prices", [
+    (1.20, 1.00, 0.05, None, [1.2, 1.15, 1.1, 1.05, 1.0]),
+    (1.22, 1.00, 0.05, None, [1.2, 1.15, 1.1, 1.05, 1.0]),
+    (1.20, 1.00, 0.05, 2, [1.2, 1.15, 1.0]),
+    (1.00, 1.00, 0.05, None, [1.0]),
+    # a credit never goes below one tick
+    (0.10, -0.05, 0.05, None, [0.1, 0.05]),
+])
+def test_limit_prices(optimal, market, step, max_steps, prices):
+    assert limit_prices(optimal, market, step, max_steps) == prices
+
+
+class FakeIB:
+    """Fills nothing while the ladder works, the fill lands together with the cancel"""
+    def __init__(self, filled_on_cancel: float):
+        self.filled_on_cancel = filled_on_cancel
+        self.trade = None
+
+    def placeOrder(self, contract, order):
+        if self.trade is None:
+            self.trade = Trade(contract, order, OrderStatus(orderId = 1, status = "Submitted"))
+        return self.trade
+
+    def cancelOrder(self, order):
+        status = self.trade.orderStatus
+        status.filled, status.avgFillPrice = self.filled_on_cancel, 1.05
+        status.status = "Filled" if self.filled_on_cancel == order.totalQuantity else "Cancelled"
+        self.trade.statusEvent.emit(self.trade)
+
+    def run(self, coroutine):
+        return asyncio.run(coroutine)
+
+
+class Alerts:
+    def __init__(self):
+        self.messages = []
+    info = warning = error = lambda self, message: self.messages.append(message)
+
+
+@pytest.fixture
+def app():
+    from short_credit_spread_ibkr import ShortCreditSpread
+    app = ShortCreditSpread.__new__(ShortCreditSpread)
+    app.alerts, app.exchange, app.size, app.trade_dict = Alerts(), "SMART", 3, {}
+    app.filtered_contracts = {"short_put": Contract(conId = 1, symbol = "SPX", currency = "USD"),
+                              "long_put": Contract(conId = 2, symbol = "SPX", currency = "USD")}
+    app.optimal_price, app.buy_at_mkt_price = 1.10, 1.00
+    app.price_improvement_step, app.price_improvement_timeout, app.price_improvement_max_steps = 0.05, 0.01, None
+    return app
+
+
+@pytest.mark.parametrize("filled", [3, 1])
+def test_fill_racing_the_cancel_is_returned(app, filled):
+    app.ib = FakeIB(filled)
+    trade = app.place_spread_order()
+    assert trade is app.ib.trade and trade.orderStatus.filled == filled
+
+
+def test_unfilled_order_opens_no_position(app):
+    app.ib = FakeIB(0)
+    assert app.place_spread_order() is None
+    assert "no position opened" in app.alerts.messages[-1]
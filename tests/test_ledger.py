@@ -0,0 +1,38 @@
+import json
+from utils.ledger import Ledger, param_hash
+
+
+def test_missing_skips_recorded_days(tmp_path):
+    ledger = Ledger(str(tmp_path / "trades.jsonl"), params = {"entry_time": "09:35"})
+    ledger.append("2024-03-11", {"cost": 0.5})
+    ledger.append("2024-03-12", {"cost": 0.6})
+    assert ledger.missing(["2024-03-11", "2024-03-12", "2024-03-13"]) == ["2024-03-13"]
+
+
+def test_empty_records_are_not_done(tmp_path):
+    ledger = Ledger(str(tmp_path / "features.jsonl"), params = {})
+    ledger.append("2024-03-11", {})
+    assert ledger.missing(["2024-03-11"]) == ["2024-03-11"]
+    ledger.append("2024-03-11", {"price": 5100.0})
+    assert ledger.missing(["2024-03-11"]) == []
+
+
+def test_other_params_or_code_are_recomputed(tmp_path):
+    path = str(tmp_path / "trades.jsonl")
+    Ledger(path, params = {"scalar": 0.5}).append("2024-03-11", {"cost": 0.5})
+    assert Ledger(path, params = {"scalar": 0.75}).missing(["2024-03-11"]) == ["2024-03-11"]
+
+    def run_day_trade():
+        return 1
+    assert Ledger(path, params = {"scalar": 0.5}, code = [run_day_trade]).missing(["2024-03-11"]) == ["2024-03-11"]
+
+
+def test_latest_record_wins_and_torn_lines_are_skipped(tmp_path):
+    path = tmp_path / "trades.jsonl"
+    ledger = Ledger(str(path), params = {})
+    ledger.append("2024-03-11", {"cost": 0.5})
+    ledger.append("2024-03-11", {"cost": 0.7})
+    with open(path, "a") as f:
+        f.write(json.dumps({"date": "2024-03-12", "params": param_hash({}), "code": None})[:-10])
+    assert ledger.records() == {"2024-03-11": {"cost": 0.7}}
+    assert ledger.missing(["2024-03-12"]) == ["2024-03-12"]
@@ -0,0 +1,24 @@
+import pytest
+from utils.polygon import EndpointStats, latest_mid_price, polygonRequestException
+
+
+def test_latest_mid_price():
+    payload = {"results": [{"sip_timestamp": 1710253800000000000, "bid_price": 1.1, "ask_price": 1.3}]}
+    quote_ts, mid = latest_mid_price(payload, "O:SPXW240312P05100000")
+    assert mid == pytest.approx(1.2)
+    assert quote_ts.tz.key == "America/New_York"
+
+
+@pytest.mark.parametrize("payload", [{}, {"results": []}, {"results": [{"sip_timestamp": 1, "bid_price": 1.1}]}])
+def test_latest_mid_price_without_quotes(payload):
+    with pytest.raises(polygonRequestException, match = "O:SPXW240312P05100000"):
+        latest_mid_price(payload, "O:SPXW240312P05100000")
+
+
+def test_endpoint_stats_keep_a_bounded_sample():
+    stats = EndpointStats(max_samples = 100)
+    for i in range(1000):
+        stats.record(i / 1000)
+    assert stats.calls == 1000 and len(stats.samples) == 100
+    assert stats.to_dict()["p50_ms"] == pytest.approx(949.5)
+    assert stats.to_dict()["max_ms"] == 999.0
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from utils.date_util import schedule_trading_dates
+from utils.regime_state import RegimeState
+
+TICKERS = ["I:VIX1D", "SPY"]
+
+
+class DailyBars:
+    """get_ticker_data stand-in: one daily bar per NYSE session, less the skipped dates"""
+    def __init__(self, skip: dict = None):
+        self.skip = skip or {}
+        self.calls = 0
+
+    def get_ticker_data(self, ticker, start, end, timespan):
+        self.calls += 1
+        days = pd.DatetimeIndex(schedule_trading_dates("NYSE", start, end)).tz_localize("America/New_York")
+        days = days[[str(day.date()) not in self.skip.get(ticker, ()) for day in days]]
+        closes = 100 + np.sin(np.arange(len(days)) / 5) + np.arange(len(days)) * 0.05
+        return pd.DataFrame({"c": closes}, index = (days.tz_convert("UTC") - pd.Timestamp(0, tz = "UTC")) // pd.Timedelta(milliseconds = 1))
+
+
+def test_update_only_requests_new_sessions(tmp_path):
+    path, client, logs = str(tmp_path / "state.json"), DailyBars(), []
+    state = RegimeState.load_or_new(path, TICKERS, log = logs.append)
+    state.update(client, "2024-03-08")
+    state.save(path)
+    state = RegimeState.load_or_new(path, TICKERS, log = logs.append)
+    assert state.update(client, "2024-03-08") == {"I:VIX1D": 0, "SPY": 0}
+    assert state.update(client, "2024-03-12") == {"I:VIX1D": 2, "SPY": 2}
+    assert client.calls == 4 and logs == []
+
+
+def test_tolerated_gap_is_logged_and_kept(tmp_path):
+    path, logs = str(tmp_path / "state.json"), []
+    state = RegimeState.load_or_new(path, TICKERS, log = logs.append)
+    state.update(DailyBars({"I:VIX1D": {"2024-02-29"}}), "2024-03-08")
+    state.save(path)
+    state = RegimeState.load_or_new(path, TICKERS, log = logs.append)
+    assert len(state.dates["I:VIX1D"]) and logs == ["I:VIX1D: regime state kept, calendar mismatches on ['2024-02-29']"]
+
+
+def test_other_exchange_discards_the_state(tmp_path):
+    path, logs = str(tmp_path / "state.json"), []
+    state = RegimeState.load_or_new(path, TICKERS)
+    state.update(DailyBars(), "2024-03-08")
+    state.save(path)
+    state = RegimeState.load_or_new(path, TICKERS, exchange = "CBOE_Equity_Options", log = logs.append)
+    assert state.exchange == "CBOE_Equity_Options" and state.last_date("SPY") is None
+    assert logs and "NYSE" in logs[0]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.signals import StreamingRegime, TrendRegime, trend_regime, vol_regime
+
+
+def random_walk(n: int, seed: int = 3) -> np.ndarray:
+    return 100 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.01, n)))
+
+
+def reference(close) -> pd.DataFrame:
+    """The pandas rolling / apply regimes of the original backtest and IBKR scripts"""
+    data = pd.DataFrame({"c": close})
+    data["1_mo_avg"] = data["c"].rolling(window=20).mean()
+    data["3_mo_avg"] = data["c"].rolling(window=60).mean()
+    data['regime'] = data.apply(lambda row: 1 if (row['c'] > row['1_mo_avg']) else 0, axis=1)
+    data['vol_regime'] = data.apply(lambda row: 1 if (row['1_mo_avg'] > row['3_mo_avg']) else 0, axis=1)
+    return data
+
+
+@pytest.mark.parametrize("n", [5, 20, 59, 60, 300])
+def test_vectorized_regimes_match_pandas(n):
+    close = random_walk(n)
+    expected = reference(close)
+    assert (trend_regime(close) == expected["regime"].to_numpy()).all()
+    assert (vol_regime(close) == expected["vol_regime"].to_numpy()).all()
+
+
+def test_streaming_regime_matches_every_prefix():
+    close = random_walk(200)
+    expected = reference(close)
+    state = StreamingRegime()
+    for i, c in enumerate(close):
+        assert state.peek_trend(c) == expected["regime"].iloc[i]
+        state.update(c)
+        assert (state.trend(), state.vol()) == (expected["regime"].iloc[i], expected["vol_regime"].iloc[i])
+
+
+def test_streaming_regime_round_trip():
+    state = StreamingRegime.from_closes(random_walk(150))
+    restored = StreamingRegime.from_dict(state.to_dict())
+    assert list(restored.closes) == list(state.closes) and restored.sums == state.sums
+    restored.update(101.0)
+    state.update(101.0)
+    assert (restored.trend(), restored.vol()) == (state.trend(), state.vol())
+
+
+def test_trend_regime_with_intraday_matches_the_concatenated_history():
+    days = pd.bdate_range("2023-01-02", periods = 120, tz = "America/New_York") + pd.Timedelta(hours = 16)
+    closes = random_walk(len(days))
+    daily = pd.DataFrame({"c": closes}, index = (days.tz_convert("UTC") - pd.Timestamp(0, tz = "UTC")) // pd.Timedelta(milliseconds = 1))
+    regime = TrendRegime(daily)
+    expected = reference(closes)
+    for i in [0, 10, 18, 19, 40, 119]:
+        prior_day = days[i].date()
+        assert regime.regime_at(prior_day) == expected["regime"].iloc[i]
+        for intraday in (closes[i] * 0.99, closes[i] * 1.01):
+            concatenated = reference(np.append(closes[:i + 1], intraday))
+            assert regime.regime_with_intraday(prior_day, intraday) == concatenated["regime"].iloc[-1]
+    assert regime.regime_at(days[0].date() - pd.Timedelta(days = 1)) == 0